@@ -1,15 +1,20 @@
-from typing import List, Optional, Generic, TypeVar, Type
+from typing import List, Optional, Generic, TypeVar, Type, Dict, Any, Iterator
 
 import sqlalchemy
+from fastapi import HTTPException, status
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import select, delete, update, exists
+from sqlalchemy import select, delete, update, exists, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 ModelType = TypeVar('ModelType', bound=sqlalchemy.Table)
 CreateSchemaType = TypeVar('CreateSchemaType', bound=BaseModel)
 UpdateSchemaType = TypeVar('UpdateSchemaType', bound=BaseModel)
 
+# PostgreSQL limit of bind parameters per statement
+MAX_BIND_PARAMS = 32767
+
 
 class CRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     """ Base CRUD """
@@ -41,29 +46,46 @@ class CRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         query = await db.execute(select(self.model).filter_by(**kwargs))
         return query.scalars().first()
 
-    async def exists(self,  db: AsyncSession, **kwargs) -> bool:
+    async def get_one(self, db: AsyncSession, detail: str = 'Not found', **kwargs) -> ModelType:
         """
-            Exists
+            Get or raise (single query instead of exists + get)
             :param db: DB
             :type db: AsyncSession
+            :param detail: Error detail
+            :type detail: str
             :param kwargs: kwargs
-            :return: Exists?
+            :return: Model
+            :rtype: ModelType
+            :raise HTTPException 400: Not found
         """
-        query = await db.execute(exists(select(self.model.id).filter_by(**kwargs)).select())
-        return query.scalar()
+        obj = await self.get(db, **kwargs)
+        if obj is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+        return obj
 
-    async def page_exists(self, db: AsyncSession, skip: int, limit: int):
+    async def get_many(self, db: AsyncSession, ids: List[int]) -> List[ModelType]:
         """
-            Next query exists?
+            Get many by IDs (order of IDs is preserved, missing are skipped)
             :param db: DB
             :type db: AsyncSession
-            :param skip: Skip
-            :type skip: int
-            :param limit: Limit
-            :type limit: int
-            :return: Page exists?
+            :param ids: IDs
+            :type ids: list
+            :return: Models
+            :rtype: list
+        """
+        query = await db.execute(select(self.model).filter(self.model.id.in_(ids)))
+        objects = {obj.id: obj for obj in query.scalars()}
+        return [objects[pk] for pk in ids if pk in objects]
+
+    async def exists(self,  db: AsyncSession, **kwargs) -> bool:
+        """
+            Exists
+            :param db: DB
+            :type db: AsyncSession
+            :param kwargs: kwargs
+            :return: Exists?
         """
-        query = await db.execute(exists(select(self.model).order_by(self.model.id.desc()).offset(skip).limit(limit)).select())
+        query = await db.execute(exists(select(self.model.id).filter_by(**kwargs)).select())
         return query.scalar()
 
     async def all(self, db: AsyncSession,  skip: int = 0, limit: int = 100) -> List[ModelType]:
@@ -81,6 +103,34 @@ class CRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         query = await db.execute(select(self.model).order_by(self.model.id.desc()).offset(skip).limit(limit))
         return query.scalars().all()
 
+    async def keyset(
+            self, db: AsyncSession, limit: int = 100, pk: Optional[int] = None, reverse: bool = False,
+    ) -> List[ModelType]:
+        """
+            Keyset (cursor) page by ID desc
+            :param db: DB
+            :type db: AsyncSession
+            :param limit: Limit
+            :type limit: int
+            :param pk: Cursor ID (exclusive)
+            :type pk: int
+            :param reverse: Rows before cursor (newer) in ID asc order
+            :type reverse: bool
+            :return: Models
+            :rtype: list
+        """
+        query = select(self.model)
+        if reverse:
+            query = query.order_by(self.model.id.asc())
+            if pk is not None:
+                query = query.filter(self.model.id > pk)
+        else:
+            query = query.order_by(self.model.id.desc())
+            if pk is not None:
+                query = query.filter(self.model.id < pk)
+        query = await db.execute(query.limit(limit))
+        return query.scalars().all()
+
     async def create(self, db: AsyncSession,  schema: CreateSchemaType, **kwargs) -> ModelType:
         """
             Create
@@ -126,3 +176,125 @@ class CRUD(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         query.execution_options(synchronize_session="fetch")
         await db.execute(query)
         return await self.get(db, id=pk)
+
+    def chunks(self, rows: List[Any], size: Optional[int] = None) -> Iterator[List[Any]]:
+        """
+            Split rows to chunks fitting bind parameters limit
+            :param rows: Rows (or IDs)
+            :type rows: list
+            :param size: Chunk size (rows with all columns by default)
+            :type size: int
+            :return: Chunks
+        """
+        size = max(1, size or MAX_BIND_PARAMS // len(self.model.__table__.columns))
+        for index in range(0, len(rows), size):
+            yield rows[index:index + size]
+
+    async def bulk_create(self, db: AsyncSession, schemas: List[CreateSchemaType], **kwargs) -> List[ModelType]:
+        """
+            Bulk create (INSERT ... RETURNING, no second select)
+            :param db: DB
+            :type db: AsyncSession
+            :param schemas: data
+            :type schemas: list
+            :param kwargs: kwargs (same for all rows)
+            :return: New models
+            :rtype: list
+        """
+        rows = [{**jsonable_encoder(schema), **kwargs} for schema in schemas]
+        objects = []
+        for chunk in self.chunks(rows):
+            query = insert(self.model).values(chunk).returning(*self.model.__table__.columns)
+            query = await db.execute(select(self.model).from_statement(query))
+            objects.extend(query.scalars().all())
+        return objects
+
+    async def bulk_update(
+            self, db: AsyncSession, ids: List[int], schema: UpdateSchemaType, **kwargs,
+    ) -> List[ModelType]:
+        """
+            Bulk update (same data for all IDs, UPDATE ... RETURNING)
+            :param db: DB
+            :type db: AsyncSession
+            :param ids: IDs
+            :type ids: list
+            :param schema: Update data
+            :type schema: UpdateSchemaType
+            :param kwargs: kwargs
+            :return: Updated models
+            :rtype: list
+        """
+        update_data = {**schema.dict(exclude_unset=True), **kwargs}
+        objects = []
+        for chunk in self.chunks(ids, MAX_BIND_PARAMS - len(update_data)):
+            query = update(self.model).filter(self.model.id.in_(chunk)).values(**update_data).returning(
+                *self.model.__table__.columns
+            )
+            query = await db.execute(
+                select(self.model).from_statement(query).execution_options(populate_existing=True)
+            )
+            objects.extend(query.scalars().all())
+        return objects
+
+    async def bulk_upsert(
+            self,
+            db: AsyncSession,
+            rows: List[Dict[str, Any]],
+            index_elements: List[str],
+            update_fields: Optional[List[str]] = None,
+    ) -> List[ModelType]:
+        """
+            Bulk upsert (INSERT ... ON CONFLICT DO UPDATE ... RETURNING)
+            :param db: DB
+            :type db: AsyncSession
+            :param rows: Rows data
+            :type rows: list
+            :param index_elements: Conflict columns (unique key)
+            :type index_elements: list
+            :param update_fields: Columns to update on conflict (all row columns by default)
+            :type update_fields: list
+            :return: Created or updated models
+            :rtype: list
+        """
+        if not rows:
+            return []
+
+        if update_fields is None:
+            update_fields = [field for field in rows[0] if field not in index_elements]
+
+        objects = []
+        for chunk in self.chunks(rows):
+            query = insert(self.model).values(chunk)
+            if update_fields:
+                query = query.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={field: query.excluded[field] for field in update_fields},
+                )
+            else:
+                query = query.on_conflict_do_nothing(index_elements=index_elements)
+            query = await db.execute(
+                select(self.model).from_statement(
+                    query.returning(*self.model.__table__.columns)
+                ).execution_options(populate_existing=True)
+            )
+            objects.extend(query.scalars().all())
+
+        if 'id' in rows[0]:
+            # Explicit IDs don't advance ID sequence, next insert would conflict with them
+            sequence = func.pg_get_serial_sequence(f'"{self.model.__table__.name}"', 'id')
+            await db.execute(select(func.setval(sequence, func.greatest(
+                max(row['id'] for row in rows), func.coalesce(func.pg_sequence_last_value(sequence), 0),
+            ))))
+        return objects
+
+    async def bulk_remove(self, db: AsyncSession, ids: List[int]) -> None:
+        """
+            Bulk remove
+            :param db: DB
+            :type db: AsyncSession
+            :param ids: IDs
+            :type ids: list
+            :return: None
+        """
+        for chunk in self.chunks(ids, MAX_BIND_PARAMS):
+            await db.execute(delete(self.model).filter(self.model.id.in_(chunk)))
@@ -2,16 +2,21 @@ import os
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.sessions import SessionMiddleware
 
+from app.auth.security import hash_pool
 from app.config import TESTS, API_V1_URL, MEDIA_ROOT, DOCKER, SECRET_KEY
 from app.db import engine, Base
+from app.middleware import ReadYourWritesMiddleware
+from app.videos.counters import view_counter
 from scripts.createsuperuser import createsuperuser_docker
 
 app = FastAPI(
     title='FastAPI Anti-YouTube',
     description='FastAPI Anti-YouTube by _Counter021_',
     version='0.3.3',
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -27,6 +32,8 @@ app.add_middleware(
     secret_key=SECRET_KEY,
 )
 
+app.add_middleware(ReadYourWritesMiddleware)
+
 
 @app.on_event('startup')
 async def startup():
@@ -40,6 +47,14 @@ async def startup():
     if not os.path.exists(MEDIA_ROOT):
         os.makedirs(MEDIA_ROOT)
 
+    view_counter.start()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await view_counter.stop()
+    hash_pool.shutdown()
+
 
 from app.routers import routers
 
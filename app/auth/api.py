@@ -1,10 +1,10 @@
 from typing import List
 
-from celery.result import AsyncResult
 from fastapi import APIRouter, status, Depends, Form, UploadFile, File, Request, WebSocket
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
 from app.auth import service
+from app.auth.cache import user_cache
 from app.auth.models import User
 from app.auth.permission import is_active
 from app.auth.schemas import (
@@ -20,10 +20,11 @@ from app.auth.schemas import (
     ChangePassword,
     Tasks,
 )
-from app.config import oauth
-from app.db import async_session
+from app.config import oauth, SUBSCRIPTIONS_VIDEOS_LIMIT
+from app.db import async_session, read_session
 from app.schemas import Message
-from app.videos.schemas import GetVideo, SubscriptionsVideos
+from app.task_events import task_events
+from app.videos.schemas import GetVideo, SubscriptionsVideos, VideoPaginate
 
 auth_router = APIRouter()
 
@@ -67,7 +68,9 @@ async def register(schema: RegisterUser):
 async def activate(schema: VerificationUUID):
     async with async_session() as session:
         async with session.begin():
-            return await service.activate(session, schema)
+            response = await service.activate(session, schema)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.post(
@@ -109,7 +112,9 @@ async def follow(to_id: int, user: User = Depends(is_active)):
 async def unfollow(to_id: int, user: User = Depends(is_active)):
     async with async_session() as session:
         async with session.begin():
-            return await service.unfollow(session, to_id, user)
+            response = await service.unfollow(session, to_id, user)
+        service.backfill_committed(session)
+    return response
 
 
 @auth_router.get(
@@ -137,7 +142,9 @@ async def create_reset_password(email: str):
 async def verify_password_reset(token: str, schema: Password):
     async with async_session() as session:
         async with session.begin():
-            return await service.verify_password_reset(session, token, schema)
+            response = await service.verify_password_reset(session, token, schema)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.post(
@@ -177,7 +184,9 @@ async def get_data(user: User = Depends(is_active)):
 async def change_data(schema: ChangeUserData, user: User = Depends(is_active)):
     async with async_session() as session:
         async with session.begin():
-            return await service.change_data(session, schema, user)
+            response = await service.change_data(session, schema, user)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.post(
@@ -191,21 +200,23 @@ async def change_data(schema: ChangeUserData, user: User = Depends(is_active)):
 async def upload_avatar(avatar: UploadFile = File(...), user: User = Depends(is_active)):
     async with async_session() as session:
         async with session.begin():
-            return await service.upload_avatar(session, avatar, user)
+            response = await service.upload_avatar(session, avatar, user)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.get(
     '/history',
-    response_model=List[GetVideo],
+    responses={200: {'model': VideoPaginate}},
     status_code=status.HTTP_200_OK,
     description='Get history',
     response_description='Get history',
     name='History',
 )
-async def get_history(user: User = Depends(is_active)):
+async def get_history(user: User = Depends(is_active), cursor: str = '', collapse: bool = False):
     async with async_session() as session:
         async with session.begin():
-            return await service.get_history(session, user)
+            return ORJSONResponse(await service.get_history(session, user, cursor, collapse))
 
 
 @auth_router.get(
@@ -217,6 +228,7 @@ async def get_history(user: User = Depends(is_active)):
     name='Get channel',
 )
 async def get_channel(pk: int, request: Request):
+    # Primary: counters read on lagging replica would be cached again right after invalidation
     async with async_session() as session:
         async with session.begin():
             return await service.get_channel(session, pk, request)
@@ -224,30 +236,44 @@ async def get_channel(pk: int, request: Request):
 
 @auth_router.get(
     '/channel/videos/{pk}',
-    response_model=List[GetVideo],
+    responses={200: {'model': List[GetVideo]}},
     status_code=status.HTTP_200_OK,
     description='Get channel videos',
     response_description='Get channel videos',
     name='Get channel videos',
 )
 async def get_channel_videos(pk: int):
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            return await service.get_channel_videos(session, pk)
+            return ORJSONResponse(await service.get_channel_videos(session, pk))
 
 
 @auth_router.get(
     '/followed',
-    response_model=List[SubscriptionsVideos],
+    responses={200: {'model': List[SubscriptionsVideos]}},
     status_code=status.HTTP_200_OK,
     description='Subscriptions',
     response_description='Subscriptions',
     name='Subscriptions',
 )
-async def subscriptions(user: User = Depends(is_active)):
+async def subscriptions(user: User = Depends(is_active), limit: int = SUBSCRIPTIONS_VIDEOS_LIMIT):
     async with async_session() as session:
         async with session.begin():
-            return await service.subscriptions(session, user)
+            return ORJSONResponse(await service.subscriptions(session, user, limit))
+
+
+@auth_router.get(
+    '/feed',
+    responses={200: {'model': VideoPaginate}},
+    status_code=status.HTTP_200_OK,
+    description='Subscriptions feed',
+    response_description='Subscriptions feed',
+    name='Subscriptions feed',
+)
+async def feed(user: User = Depends(is_active), cursor: str = ''):
+    async with async_session() as session:
+        async with session.begin():
+            return ORJSONResponse(await service.feed(session, user, cursor))
 
 
 @auth_router.put(
@@ -261,7 +287,9 @@ async def subscriptions(user: User = Depends(is_active)):
 async def change_password(schema: ChangePassword, user: User = Depends(is_active)):
     async with async_session() as session:
         async with session.begin():
-            return await service.change_password(session, schema, user)
+            response = await service.change_password(session, schema, user)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.post(
@@ -289,7 +317,9 @@ async def two_auth(username: str = Form(...), password: str = Form(...), code: s
 async def toggle_2step_auth(user: User = Depends(is_active)):
     async with async_session() as session:
         async with session.begin():
-            return await service.toggle_2step_auth(session, user)
+            response = await service.toggle_2step_auth(session, user)
+        await user_cache.invalidate_committed(session)
+    return response
 
 
 @auth_router.get(
@@ -329,29 +359,10 @@ async def google_auth(request: Request):
     name='Export data',
 )
 async def export(user: User = Depends(is_active)):
-    async with async_session() as session:
-        async with session.begin():
-            return await service.export(session, user)
+    return await service.export(user)
 
 
 @auth_router.websocket('/task-status')
 async def task_status(websocket: WebSocket):
     await websocket.accept()
-
-    while True:
-        task_id = await websocket.receive_text()
-        task = AsyncResult(task_id)
-        if task.status == 'PENDING':
-            response = {
-                'state': task.state,
-                'progress': 0,
-            }
-            await websocket.send_json(response)
-        else:
-            response = {
-                'state': task.state,
-                'progress': task.info.get('progress', 0),
-            }
-            await websocket.send_json(response)
-            if task.info.get('progress') == 100:
-                break
+    await task_events.stream(websocket)
@@ -0,0 +1,214 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List
+
+import redis
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.auth.models import User
+from app.config import (
+    USER_CACHE_TTL,
+    USER_CACHE_REDIS_URL,
+    CHANNEL_CACHE_TTL,
+)
+
+
+class BaseCache(ABC):
+    """ Base cache tier """
+
+    @abstractmethod
+    async def get(self, key: int) -> Optional[Dict[str, Any]]:
+        """
+            Get data
+            :param key: Key (object ID)
+            :type key: int
+            :return: Data or None
+            :rtype: dict
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, key: int, data: Dict[str, Any]) -> None:
+        """
+            Set data
+            :param key: Key (object ID)
+            :type key: int
+            :param data: Data
+            :type data: dict
+            :return: None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, key: int) -> None:
+        """
+            Delete data
+            :param key: Key (object ID)
+            :type key: int
+            :return: None
+        """
+        raise NotImplementedError
+
+
+class RedisCache(BaseCache):
+    """ Redis cache, shared between workers """
+
+    def __init__(self, url: str, ttl: int, prefix: str) -> None:
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def key(self, key: int) -> str:
+        return f'{self.prefix}:{key}'
+
+    async def get(self, key: int) -> Optional[Dict[str, Any]]:
+        try:
+            data = await run_in_threadpool(self.client.get, self.key(key))
+        except redis.RedisError as error:
+            logging.warning(f'{self.prefix} cache get error: {error}')
+            return
+        return json.loads(data) if data else None
+
+    async def set(self, key: int, data: Dict[str, Any]) -> None:
+        try:
+            await run_in_threadpool(self.client.setex, self.key(key), self.ttl, json.dumps(data))
+        except redis.RedisError as error:
+            logging.warning(f'{self.prefix} cache set error: {error}')
+
+    async def delete(self, key: int) -> None:
+        try:
+            await run_in_threadpool(self.client.delete, self.key(key))
+        except redis.RedisError as error:
+            logging.warning(f'{self.prefix} cache delete error: {error}')
+
+
+class TieredCache:
+    """ Tiered cache (first tier is the fastest, disabled without tiers) """
+
+    def __init__(self, tiers: List[BaseCache], name: str) -> None:
+        self.tiers = tiers
+        self.name = name
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tiers)
+
+    async def get(self, key: int) -> Optional[Dict[str, Any]]:
+        """
+            Get data (copied to faster tiers on hit)
+            :param key: Key (object ID)
+            :type key: int
+            :return: Data or None
+            :rtype: dict
+        """
+        for index, tier in enumerate(self.tiers):
+            data = await tier.get(key)
+            if data is not None:
+                for upper_tier in self.tiers[:index]:
+                    await upper_tier.set(key, data)
+                return data
+
+    async def set(self, key: int, data: Dict[str, Any]) -> None:
+        """
+            Set data
+            :param key: Key (object ID)
+            :type key: int
+            :param data: Data
+            :type data: dict
+            :return: None
+        """
+        for tier in self.tiers:
+            await tier.set(key, data)
+
+    async def invalidate(self, key: int) -> None:
+        """
+            Invalidate data
+            :param key: Key (object ID)
+            :type key: int
+            :return: None
+        """
+        for tier in self.tiers:
+            await tier.delete(key)
+
+    def invalidate_on_commit(self, db: AsyncSession, key: int) -> None:
+        """
+            Mark data for invalidation after transaction is committed (see invalidate_committed)
+            :param db: DB
+            :type db: AsyncSession
+            :param key: Key (object ID)
+            :type key: int
+            :return: None
+        """
+        if self.enabled:
+            db.info.setdefault(f'invalidate_{self.name}', set()).add(key)
+
+    async def invalidate_committed(self, db: AsyncSession) -> None:
+        """
+            Invalidate data changed by committed transaction
+            (invalidated before commit, old row can be cached again by concurrent request)
+            :param db: DB
+            :type db: AsyncSession
+            :return: None
+        """
+        for key in db.info.pop(f'invalidate_{self.name}', ()):
+            await self.invalidate(key)
+
+
+class UserCache(TieredCache):
+    """ User cache """
+
+    # Fields read by permission checks and handlers, password hash and OTP secret are never cached
+    fields = ('id', 'username', 'email', 'is_superuser', 'is_active', 'avatar', 'about', 'send_message', 'two_auth')
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        """
+            Get user
+            :param user_id: User ID
+            :type user_id: int
+            :return: User or None
+            :rtype: User
+        """
+        data = await self.get(user_id)
+        if data is not None:
+            return User(**data)
+
+    async def set_user(self, user: User) -> None:
+        """
+            Set user
+            :param user: User
+            :type user: User
+            :return: None
+        """
+        await self.set(user.id, {field: getattr(user, field) for field in self.fields})
+
+
+def create_user_cache() -> UserCache:
+    """
+        Create user cache from config
+        :return: User cache
+        :rtype: UserCache
+    """
+    tiers = []
+    # Shared tier only: process-local copies would outlive invalidation made by other workers
+    if USER_CACHE_TTL > 0 and USER_CACHE_REDIS_URL:
+        tiers.append(RedisCache(USER_CACHE_REDIS_URL, USER_CACHE_TTL, 'user'))
+    return UserCache(tiers, 'user')
+
+
+def create_channel_cache() -> TieredCache:
+    """
+        Create channel counters cache from config
+        :return: Channel counters cache
+        :rtype: TieredCache
+    """
+    tiers = []
+    # Redis only, same as user cache
+    if CHANNEL_CACHE_TTL > 0 and USER_CACHE_REDIS_URL:
+        tiers.append(RedisCache(USER_CACHE_REDIS_URL, CHANNEL_CACHE_TTL, 'channel'))
+    return TieredCache(tiers, 'channel')
+
+
+user_cache = create_user_cache()
+channel_cache = create_channel_cache()
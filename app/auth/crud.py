@@ -1,63 +1,101 @@
-from typing import List
+from typing import List, Optional, Dict, Any
 
-from sqlalchemy import select
+from sqlalchemy import select, update, exists, func, and_
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from sqlalchemy.sql.functions import count
+from sqlalchemy.sql.functions import count, sum
 
 from app.CRUD import CRUD, ModelType
 from app.auth.models import User, Verification, Subscriptions
 from app.auth.schemas import RegisterUser, UserUpdate, VerificationUUID
+from app.videos.models import Video
 
 
 class UserCRUD(CRUD[User, RegisterUser, UserUpdate]):
     """ User CRUD """
 
-    async def export_data(self, db: AsyncSession, **kwargs) -> ModelType:
+    async def channel(
+            self, db: AsyncSession, pk: int, user_id: Optional[int] = None, counters: bool = True,
+    ) -> Optional[Dict[str, Any]]:
         """
-            Export data
+            Channel with counters in one query
             :param db: DB
             :type db: AsyncSession
-            :param kwargs: kwargs
-            :return: Model
-            :rtype: ModelType
+            :param pk: Channel ID
+            :type pk: int
+            :param user_id: Viewer ID (adds is_following)
+            :type user_id: int
+            :param counters: Add views and count_videos
+            :type counters: bool
+            :return: Channel and counters or None
+            :rtype: dict
+        """
+        columns = []
+        if user_id is not None:
+            columns.append(
+                exists().where(
+                    and_(Subscriptions.c.subscriber_id == user_id, Subscriptions.c.subscription_id == self.model.id),
+                ).label('is_following')
+            )
+        if counters:
+            columns.append(
+                select(func.coalesce(sum(Video.views), 0)).filter(
+                    Video.user_id == self.model.id,
+                ).scalar_subquery().label('views')
+            )
+            columns.append(
+                select(count(Video.id)).filter(Video.user_id == self.model.id).scalar_subquery().label('count_videos')
+            )
+        query = await db.execute(select(self.model, *columns).filter(self.model.id == pk))
+        row = query.first()
+        if row is None:
+            return
+        return {'channel': row[0], **{column.name: value for column, value in zip(columns, row[1:])}}
+
+    async def get_subscriptions(self, db: AsyncSession, user: User) -> List[ModelType]:
+        """
+            Get subscriptions
+            :param db: DB
+            :type db: AsyncSession
+            :param user: User
+            :type user: User
+            :return: Subscriptions
+            :rtype: list
         """
         query = await db.execute(
-            select(self.model).options(
-                selectinload(self.model.comments),
-            ).filter_by(**kwargs)
+            select(self.model).join(
+                Subscriptions, Subscriptions.c.subscription_id == self.model.id,
+            ).filter(Subscriptions.c.subscriber_id == user.id).order_by(self.model.id.desc())
         )
-        return query.scalars().first()
+        return query.scalars().all()
 
-    async def count_followers(self, db: AsyncSession, pk: int) -> int:
+    async def add_subscribers(self, db: AsyncSession, pk: int, value: int) -> None:
         """
-            Followers count
+            Atomic change subscribers counter
             :param db: DB
             :type db: AsyncSession
             :param pk: Channel ID
             :type pk: int
-            :return: Count followers
-            :rtype: int
+            :param value: Delta (1 - follow; -1 - unfollow)
+            :type value: int
+            :return: None
         """
-        query = await db.execute(
-            select(count(Subscriptions.c.subscription_id).filter(Subscriptions.c.subscription_id == pk))
+        query = update(self.model).filter(self.model.id == pk).values(
+            subscribers_count=self.model.subscribers_count + value,
         )
-        return list(query)[0][0]
+        await db.execute(query.execution_options(synchronize_session='fetch'))
 
-    async def get_subscriptions(self, db: AsyncSession, user: User) -> List[ModelType]:
+    async def reconcile_subscribers(self, db: AsyncSession) -> None:
         """
-            Get subscriptions
+            Recount subscribers counters from subscriptions table
             :param db: DB
             :type db: AsyncSession
-            :param user: User
-            :type user: User
-            :return: Subscriptions
-            :rtype: list
+            :return: None
         """
-        query = await db.execute(user.subscriptions.filter(Subscriptions.c.subscriber_id == user.id).options(
-            selectinload(self.model.videos),
-        ))
-        return list(map(lambda x: x[0], query))
+        subscribers = select(count(Subscriptions.c.subscriber_id)).filter(
+            Subscriptions.c.subscription_id == self.model.id,
+        ).scalar_subquery()
+        query = update(self.model).values(subscribers_count=subscribers)
+        await db.execute(query.execution_options(synchronize_session=False))
 
 
 class VerificationCRUD(CRUD[Verification, VerificationUUID, VerificationUUID]):
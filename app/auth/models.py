@@ -2,7 +2,7 @@ from typing import List, ForwardRef
 
 from fastapi import HTTPException, status
 from pyotp import random_base32
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Table
+from sqlalchemy import Column, String, Boolean, Integer, BigInteger, ForeignKey, Table, Index
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship, backref
 
@@ -18,6 +18,8 @@ Subscriptions = Table(
     Base.metadata,
     Column('subscriber_id', Integer, ForeignKey('user.id', ondelete='CASCADE')),
     Column('subscription_id', Integer, ForeignKey('user.id', ondelete='CASCADE')),
+    Index('ix_subscriptions_subscriber_id', 'subscriber_id'),
+    Index('ix_subscriptions_subscription_id', 'subscription_id'),
 )
 
 
@@ -47,6 +49,7 @@ class User(Base, ModelMixin):
     send_message: bool = Column(Boolean, default=True)
     otp_secret: str = Column(String, default=random_base32)
     two_auth: bool = Column(Boolean, default=False)
+    subscribers_count: int = Column(BigInteger, default=0, server_default='0', nullable=False)
 
     verifications: List[Verification] = relationship(Verification, backref='user', lazy='dynamic')
     subscriptions: List[UserRef] = relationship(
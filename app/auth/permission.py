@@ -4,6 +4,7 @@ import jwt
 from fastapi import Security, HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordBearer
 
+from app.auth.cache import user_cache
 from app.auth.crud import user_crud
 from app.auth.models import User
 from app.auth.schemas import TokenPayload
@@ -37,12 +38,19 @@ async def is_authenticated(token: str = Security(reusable_oauth2)) -> User:
     except jwt.exceptions.PyJWTError:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Could not validate credentials')
 
+    user = await user_cache.get_user(token_data.user_id)
+    if user is not None:
+        return user
+
     async with async_session() as session:
         async with session.begin():
-            if not await user_crud.exists(session, id=token_data.user_id):
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
+            user = await user_crud.get(session, id=token_data.user_id)
+
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='User not found')
 
-            return await user_crud.get(session, id=token_data.user_id)
+    await user_cache.set_user(user)
+    return user
 
 
 async def is_active(user: User = Depends(is_authenticated)) -> User:
@@ -1,5 +1,15 @@
+import asyncio
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Dict, Callable, TypeVar
+
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
 
+from app.config import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE
+
+T = TypeVar('T')
+
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 
@@ -25,3 +35,96 @@ def get_password_hash(password: str) -> str:
         :rtype: str
     """
     return pwd_context.hash(password)
+
+
+class HashPool:
+    """ Bounded worker pool for password hashing """
+
+    def __init__(self, executor: str, workers: int, queue_size: int) -> None:
+        self.executor_type = executor
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+        self.rejected = 0
+
+    def get_executor(self) -> Executor:
+        """
+            Get executor (created on first use)
+            :return: Executor
+            :rtype: Executor
+        """
+        if self.executor is None:
+            if self.executor_type == 'process':
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self.executor
+
+    async def run(self, function: Callable[..., T], *args) -> T:
+        """
+            Run function in pool
+            :param function: Function
+            :param args: args
+            :return: Function result
+            :raise HTTPException 503: Queue is full
+        """
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            logging.warning(f'password hash pool is full: {self.stats()}')
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Server is busy')
+
+        self.pending += 1
+        try:
+            return await asyncio.get_event_loop().run_in_executor(self.get_executor(), function, *args)
+        finally:
+            self.pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+            Pool stats
+            :return: Workers, pending, queued and rejected tasks
+            :rtype: dict
+        """
+        return {
+            'workers': self.workers,
+            'pending': self.pending,
+            'queued': max(0, self.pending - self.workers),
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        """
+            Shutdown pool
+            :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+hash_pool = HashPool(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
+
+
+async def verify_password_async(password: str, hash_password: str) -> bool:
+    """
+        Verification password in worker pool
+        :param password: Password
+        :type password: str
+        :param hash_password: Hash
+        :type hash_password: str
+        :return: Password match?
+        :rtype: bool
+    """
+    return await hash_pool.run(verify_password, password, hash_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """
+        Get hash in worker pool
+        :param password: Password
+        :type password: str
+        :return: Hash
+        :rtype: str
+    """
+    return await hash_pool.run(get_password_hash, password)
@@ -1,7 +1,6 @@
-from pathlib import Path
 from uuid import UUID
 
-from app.config import SERVER_HOST_FRONT_END, PROJECT_NAME, EMAIL_TEMPLATES_DIR
+from app.config import SERVER_HOST_FRONT_END, PROJECT_NAME
 from app.send_emails import send_email
 
 
@@ -17,12 +16,10 @@ def send_export_data(email_to: str, file_name: str) -> None:
     """
     project_name = PROJECT_NAME
     subject = f'{project_name} - Export data'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'export_data.html') as f:
-        template_str = f.read()
     send_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
+        subject=subject,
+        template='export_data',
         environment={
             'project_name': PROJECT_NAME,
             'email': email_to,
@@ -46,12 +43,10 @@ def send_about_change_password(email_to: str, username: str, password: str) -> N
     """
     project_name = PROJECT_NAME
     subject = f'{project_name} - New account for user {username}'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'change_password.html') as f:
-        template_str = f.read()
     send_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
+        subject=subject,
+        template='change_password',
         environment={
             'project_name': PROJECT_NAME,
             'username': username,
@@ -77,13 +72,11 @@ def send_new_account_email(email_to: str, username: str, password: str, uuid: UU
     """
     project_name = PROJECT_NAME
     subject = f'{project_name} - New account for user {username}'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'new_account.html') as f:
-        template_str = f.read()
     link = f'{SERVER_HOST_FRONT_END}/verify/?token={uuid}'
     send_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
+        subject=subject,
+        template='new_account',
         environment={
             'project_name': PROJECT_NAME,
             'username': username,
@@ -110,13 +103,11 @@ def send_reset_password_email(email_to: str, username: str, password: str, token
     """
     project_name = PROJECT_NAME
     subject = f'{project_name} - Reset password for user {username}'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'reset_password.html') as f:
-        template_str = f.read()
     link = f'{SERVER_HOST_FRONT_END}/password-reset/?token={token}'
     send_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
+        subject=subject,
+        template='reset_password',
         environment={
             'project_name': PROJECT_NAME,
             'username': username,
@@ -138,12 +129,10 @@ def send_username_email(email_to: str, username: str) -> None:
     """
     project_name = PROJECT_NAME
     subject = f'{project_name} - Get username'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'get_username.html') as f:
-        template_str = f.read()
     send_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
+        subject=subject,
+        template='get_username',
         environment={
             'project_name': PROJECT_NAME,
             'username': username,
@@ -8,6 +8,7 @@ from passlib.utils import generate_password
 from pyotp import TOTP, random_base32
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.auth.cache import user_cache, channel_cache
 from app.auth.crud import user_crud, verification_crud
 from app.auth.models import User
 from app.auth.permission import is_auth_or_anonymous
@@ -23,15 +24,28 @@ from app.auth.schemas import (
     ChangePassword,
     Change2StepAuth,
 )
-from app.auth.security import get_password_hash, verify_password
+from app.auth.security import get_password_hash_async, verify_password_async
 from app.auth.send_emails import send_new_account_email, send_reset_password_email, send_username_email, \
     send_about_change_password
 from app.auth.tokens import create_token, verify_refresh_token, create_password_reset_token, verify_password_reset_token
-from app.config import MEDIA_ROOT, SERVER_HOST_FRONT_END
+from app.config import (
+    MEDIA_ROOT,
+    SERVER_HOST_FRONT_END,
+    MAX_IMAGE_SIZE,
+    SUBSCRIPTIONS_VIDEOS_LIMIT,
+    SUBSCRIPTIONS_VIDEOS_MAX_LIMIT,
+    PAGINATE_SIZE,
+    SERVER_HOST,
+    API_V1_URL,
+    FEED_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
+    TESTS,
+)
 from app.files import remove_file, write_file
-from app.tasks import export_data
-from app.videos.crud import history_crud, video_crud
-from app.videos.schemas import ExportData
+from app.serializers import serialize_video, serialize_video_row, serialize_user, serialize_user_data
+from app.service import encode_cursor, decode_cursor
+from app.tasks import export_data, backfill_feeds
+from app.videos.crud import history_crud, video_crud, video_list_crud
 
 
 async def refresh(db: AsyncSession, schema: RefreshToken):
@@ -48,10 +62,7 @@ async def refresh(db: AsyncSession, schema: RefreshToken):
 
     username = verify_refresh_token(schema.refresh_token)
 
-    if not await user_crud.exists(db, username=username):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
-
-    user = await user_crud.get(db, username=username)
+    user = await user_crud.get_one(db, 'User not found', username=username)
     return create_token(user.id, username)
 
 
@@ -75,7 +86,7 @@ async def register(db: AsyncSession, schema: RegisterUser) -> Dict[str, str]:
 
     del schema.confirm_password
 
-    user = await user_crud.create(db, schema, password=get_password_hash(schema.password))
+    user = await user_crud.create(db, schema, password=await get_password_hash_async(schema.password))
 
     verification = await verification_crud.create(db, VerificationUUID(uuid=str(uuid4())), user_id=user.id)
 
@@ -96,12 +107,10 @@ async def activate(db: AsyncSession, schema: VerificationUUID) -> Dict[str, str]
         :raise HTTPException 400: Verification not exist
     """
 
-    if not await verification_crud.exists(db, uuid=schema.uuid):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Verification not found')
-
-    verification = await verification_crud.get(db, uuid=schema.uuid)
+    verification = await verification_crud.get_one(db, 'Verification not found', uuid=schema.uuid)
 
     await user_crud.update(db, verification.user_id, UserUpdate(is_active=True))
+    user_cache.invalidate_on_commit(db, verification.user_id)
 
     await verification_crud.remove(db, id=verification.id)
 
@@ -123,12 +132,9 @@ async def validation_login(db: AsyncSession, username: str, password: str) -> Us
     """
     schema = LoginUser(username=username, password=password)
 
-    if not await user_crud.exists(db, username=schema.username):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
-
-    user = await user_crud.get(db, username=schema.username)
+    user = await user_crud.get_one(db, 'User not found', username=schema.username)
 
-    if not verify_password(schema.password, user.password):
+    if not await verify_password_async(schema.password, user.password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Password mismatch')
 
     if not user.is_active:
@@ -199,14 +205,15 @@ async def follow(db: AsyncSession, to_id: int, user: User) -> Dict[str, str]:
     if to_id == user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='You not follow to self')
 
-    if not await user_crud.exists(db, id=to_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Follow to user not found')
-
-    to_user = await user_crud.get(db, id=to_id)
+    to_user = await user_crud.get_one(db, 'Follow to user not found', id=to_id)
 
     user = await user_crud.get(db, id=user.id)
 
+    subscribers = to_user.subscribers_count
     await user.follow(db, to_user)
+    await user_crud.add_subscribers(db, to_id, 1)
+    if subscribers < FEED_FANOUT_MAX_FOLLOWERS:
+        await video_crud.add_to_feed(db, user.id, to_id, FEED_SIZE)
     return {'msg': 'You follow to user'}
 
 
@@ -227,17 +234,32 @@ async def unfollow(db: AsyncSession, to_id: int, user: User) -> Dict[str, str]:
     if to_id == user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='You not unfollow to self')
 
-    if not await user_crud.exists(db, id=to_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Unfollow to user not found')
-
-    to_user = await user_crud.get(db, id=to_id)
+    to_user = await user_crud.get_one(db, 'Unfollow to user not found', id=to_id)
 
     user = await user_crud.get(db, id=user.id)
 
+    subscribers = to_user.subscribers_count
     await user.unfollow(db, to_user)
+    await user_crud.add_subscribers(db, to_id, -1)
+    await video_crud.remove_from_feed(db, user.id, to_id)
+    if subscribers == FEED_FANOUT_MAX_FOLLOWERS + 1:
+        # Channel is not pulled on read anymore
+        db.info.setdefault('backfill_feeds', set()).add(to_id)
     return {'msg': 'You unfollow to user'}
 
 
+def backfill_committed(db: AsyncSession) -> None:
+    """
+        Backfill followers feeds of channels dropped below fan-out threshold by committed transaction
+        :param db: DB
+        :type db: AsyncSession
+        :return: None
+    """
+    for channel_id in db.info.pop('backfill_feeds', ()):
+        if not TESTS:
+            backfill_feeds.delay(channel_id)
+
+
 async def create_reset_password(db: AsyncSession, email: str) -> Dict[str, str]:
     """
         Create password reset
@@ -250,11 +272,8 @@ async def create_reset_password(db: AsyncSession, email: str) -> Dict[str, str]:
         :raise HTTPException 400: User not exist
     """
 
-    if not await user_crud.exists(db, email=email):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
-
+    user = await user_crud.get_one(db, 'User not found', email=email)
     token = create_password_reset_token(email)
-    user = await user_crud.get(db, email=email)
     send_reset_password_email(user.email, user.username, user.password, token)
     return {'msg': 'Email send'}
 
@@ -275,16 +294,13 @@ async def verify_password_reset(db: AsyncSession, token: str, schema: Password)
 
     email = verify_password_reset_token(token)
 
-    if not await user_crud.exists(db, email=email):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
-
-    user = await user_crud.get(db, email=email)
+    user = await user_crud.get_one(db, 'User not found', email=email)
 
     del schema.confirm_password
 
-    await user_crud.update(
-        db, user.id, schema, password=get_password_hash(schema.password), two_auth=False, otp_secret=random_base32(),
-    )
+    password = await get_password_hash_async(schema.password)
+    await user_crud.update(db, user.id, schema, password=password, two_auth=False, otp_secret=random_base32())
+    user_cache.invalidate_on_commit(db, user.id)
     return {'msg': 'Password has been reset'}
 
 
@@ -300,10 +316,7 @@ async def get_username(db: AsyncSession, email: str) -> Dict[str, str]:
         :raise HTTPException 400: User not exist
     """
 
-    if not await user_crud.exists(db, email=email):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
-
-    user = await user_crud.get(db, email=email)
+    user = await user_crud.get_one(db, 'User not found', email=email)
     send_username_email(user.email, user.username)
     return {'msg': 'Email send'}
 
@@ -316,7 +329,7 @@ async def get_data(user: User) -> Dict[str, Any]:
         :return: User
         :rtype: dict
     """
-    return user.__dict__
+    return serialize_user_data(user)
 
 
 async def change_data(db: AsyncSession, schema: ChangeUserData, user: User) -> Dict[str, Any]:
@@ -332,7 +345,8 @@ async def change_data(db: AsyncSession, schema: ChangeUserData, user: User) -> D
         :rtype: dict
     """
     user = await user_crud.update(db, user.id, schema)
-    return user.__dict__
+    user_cache.invalidate_on_commit(db, user.id)
+    return serialize_user_data(user)
 
 
 async def upload_avatar(db: AsyncSession, avatar: UploadFile, user: User) -> Dict[str, Any]:
@@ -347,44 +361,55 @@ async def upload_avatar(db: AsyncSession, avatar: UploadFile, user: User) -> Dic
         :return: User
         :rtype: dict
         :raise HTTPException 400: Video format not png or jpeg
+        :raise HTTPException 413: File is too large
     """
 
     if avatar.content_type not in ('image/png', 'image/jpeg'):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Avatar only format in jpeg or png')
 
-    if MEDIA_ROOT in user.avatar:
-        remove_file(user.avatar)
-
     avatar_name = f'{MEDIA_ROOT}{datetime.utcnow().timestamp()}.{avatar.filename.split(".")[-1]}'
 
-    await write_file(avatar_name, avatar)
+    await write_file(avatar_name, avatar, MAX_IMAGE_SIZE)
+
+    if MEDIA_ROOT in user.avatar:
+        remove_file(user.avatar)
 
     user = await user_crud.update(db, user.id, UploadAvatar(avatar=avatar_name))
-    return user.__dict__
+    user_cache.invalidate_on_commit(db, user.id)
+    return serialize_user_data(user)
 
 
-async def get_history(db: AsyncSession, user: User) -> List[Dict[str, Any]]:
+async def get_history(db: AsyncSession, user: User, cursor: str = '', collapse: bool = False) -> Dict[str, Any]:
     """
         Get history
         :param db: DB
         :type db: AsyncSession
         :param user: User
         :type user: User
-        :return: History
-        :rtype: list
-    """
-    history = []
-    for history_video in await history_crud.filter(db, user_id=user.id):
-        video = await video_crud.get(db, id=history_video.video.id)
-        to_history = {
-            **history_video.video.__dict__,
-            'category': video.category.__dict__,
-            'votes': video_crud.get_votes(history_video.video),
-            'user': video.user.__dict__
-        }
-        history.append(to_history)
-
-    return history
+        :param cursor: Cursor
+        :type cursor: str
+        :param collapse: Collapse repeated views
+        :type collapse: bool
+        :return: History page
+        :rtype: dict
+        :raise HTTPException 400: Invalid cursor
+    """
+    pk, _ = decode_cursor(cursor)
+    history = await history_crud.history(db, user.id, PAGINATE_SIZE + 1, pk, collapse)
+    next_page = None
+    if len(history) > PAGINATE_SIZE:
+        history = history[:PAGINATE_SIZE]
+        next_page = f'{SERVER_HOST}{API_V1_URL}/auth/history?cursor={encode_cursor(history[-1][1])}'
+        if collapse:
+            next_page += '&collapse=true'
+    return {
+        'next': next_page,
+        'previous': None,
+        'page': None,
+        'results': [
+            serialize_video(video) for video, _ in history
+        ],
+    }
 
 
 async def get_channel(db: AsyncSession, pk, request: Request) -> Dict[str, Any]:
@@ -401,26 +426,26 @@ async def get_channel(db: AsyncSession, pk, request: Request) -> Dict[str, Any]:
         :raise HTTPException 400: User not found
     """
 
-    if not await user_crud.exists(db, id=pk):
+    user = await is_auth_or_anonymous(request)
+    counters = await channel_cache.get(pk)
+    channel = await user_crud.channel(
+        db, pk, user.id if user and user.id != pk else None, counters=counters is None,
+    )
+    if channel is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
 
-    is_following = None
+    if counters is None:
+        counters = {'views': channel['views'], 'count_videos': channel['count_videos']}
+        await channel_cache.set(pk, counters)
 
-    user = await is_auth_or_anonymous(request)
-    channel = await user_crud.get(db, id=pk)
+    is_following = None
     if user:
-        user = await user_crud.get(db, id=user.id)
-        if user.id != pk:
-            is_following = await user.is_following(db, channel)
-        else:
-            is_following = 3
-    views, count_videos = await video_crud.count_views_and_videos(db, user_id=pk)
+        is_following = 3 if user.id == pk else channel['is_following']
     return {
-        **channel.__dict__,
-        'followers_count': await user_crud.count_followers(db, pk),
+        **serialize_user(channel['channel']),
+        **counters,
+        'followers_count': channel['channel'].subscribers_count,
         'is_following': is_following,
-        'views': views or 0,
-        'count_videos': count_videos,
     }
 
 
@@ -436,47 +461,67 @@ async def get_channel_videos(db: AsyncSession, pk: int) -> List[Dict[str, Any]]:
         :raise HTTPException 400: User not found
     """
 
-    if not await user_crud.exists(db, id=pk):
+    videos = await video_list_crud.filter(db, user_id=pk)
+    if not videos and not await user_crud.exists(db, id=pk):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='User not found')
 
-    videos = await video_crud.filter(db, user_id=pk)
     return [
-        {
-            **video.__dict__,
-            'user': video.user.__dict__,
-            'votes': video_crud.get_votes(video),
-            'category': video.category.__dict__,
-        } for video in videos
+        serialize_video_row(video) for video in videos
     ]
 
 
-async def subscriptions(db: AsyncSession, user: User) -> List[Dict[str, Any]]:
+async def subscriptions(db: AsyncSession, user: User, limit: int = SUBSCRIPTIONS_VIDEOS_LIMIT) -> List[Dict[str, Any]]:
     """
         Subscriptions
         :param db: DB
         :type db: AsyncSession
         :param user: User
         :type user: User
+        :param limit: Videos limit per channel
+        :type limit: int
         :return: Subscriptions
         :rtype: list
     """
-    user = await user_crud.get(db, id=user.id)
+    limit = max(1, min(limit, SUBSCRIPTIONS_VIDEOS_MAX_LIMIT))
     subscriptions_list = await user_crud.get_subscriptions(db, user)
-    followed_list = []
-    for subscription in subscriptions_list:
-        followed = {
-            'user': subscription.__dict__,
-            'videos': [
-                {
-                    **video.__dict__,
-                    'user': video.user.__dict__,
-                    'votes': video_crud.get_votes(video),
-                    'category': video.category.__dict__,
-                } for video in await video_crud.filter(db, user_id=subscription.id)
-            ],
-        }
-        followed_list.append(followed)
-    return followed_list
+    videos = {subscription.id: [] for subscription in subscriptions_list}
+    for video in await video_crud.subscriptions_videos(db, user.id, limit):
+        videos[video.user_id].append(serialize_video(video))
+    return [
+        {
+            'user': serialize_user(subscription),
+            'videos': videos[subscription.id],
+        } for subscription in subscriptions_list
+    ]
+
+
+async def feed(db: AsyncSession, user: User, cursor: str = '') -> Dict[str, Any]:
+    """
+        Chronological feed of followed channels
+        :param db: DB
+        :type db: AsyncSession
+        :param user: User
+        :type user: User
+        :param cursor: Cursor
+        :type cursor: str
+        :return: Videos page
+        :rtype: dict
+        :raise HTTPException 400: Invalid cursor
+    """
+    pk, _ = decode_cursor(cursor)
+    videos = await video_crud.feed(db, user.id, PAGINATE_SIZE + 1, pk, FEED_FANOUT_MAX_FOLLOWERS)
+    next_page = None
+    if len(videos) > PAGINATE_SIZE:
+        videos = videos[:PAGINATE_SIZE]
+        next_page = f'{SERVER_HOST}{API_V1_URL}/auth/feed?cursor={encode_cursor(videos[-1].id)}'
+    return {
+        'next': next_page,
+        'previous': None,
+        'page': None,
+        'results': [
+            serialize_video(video) for video in videos
+        ],
+    }
 
 
 async def change_password(db: AsyncSession, schema: ChangePassword, user: User) -> Dict[str, str]:
@@ -492,12 +537,15 @@ async def change_password(db: AsyncSession, schema: ChangePassword, user: User)
         :rtype: dict
     """
 
-    if not verify_password(schema.old_password, user.password):
+    # Password hash is not cached, read from DB
+    db_user = await user_crud.get_one(db, 'User not found', id=user.id)
+    if not await verify_password_async(schema.old_password, db_user.password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Old password mismatch')
 
     del schema.old_password
     del schema.confirm_password
-    await user_crud.update(db, user.id, schema, password=get_password_hash(schema.password))
+    await user_crud.update(db, user.id, schema, password=await get_password_hash_async(schema.password))
+    user_cache.invalidate_on_commit(db, user.id)
     send_about_change_password(user.email, user.username, schema.password)
     return {'msg': 'Password has been changed'}
 
@@ -514,9 +562,13 @@ async def toggle_2step_auth(db: AsyncSession, user: User) -> Dict[str, str]:
     """
     if user.two_auth:
         await user_crud.update(db, user.id, Change2StepAuth(two_auth=False))
+        user_cache.invalidate_on_commit(db, user.id)
         return {'msg': 'You off 2-step auth'}
-    qr_url = TOTP(user.otp_secret).provisioning_uri(name=user.username, issuer_name='Anti-YouTube')
+    # OTP secret is not cached, read from DB
+    db_user = await user_crud.get_one(db, 'User not found', id=user.id)
+    qr_url = TOTP(db_user.otp_secret).provisioning_uri(name=user.username, issuer_name='Anti-YouTube')
     await user_crud.update(db, user.id, Change2StepAuth(two_auth=True))
+    user_cache.invalidate_on_commit(db, user.id)
     return {'msg': qr_url}
 
 
@@ -530,14 +582,15 @@ async def google_auth(db: AsyncSession, user: Dict[str, Union[str, bool, int]])
         :return: Tokens
         :rtype: dict
     """
-    if not await user_crud.exists(db, email=user['email']):
+    google_user, user = user, await user_crud.get(db, email=user['email'])
+    if user is None:
         password = generate_password()
 
         schema = RegisterUser(
             password=password,
             confirm_password=password,
-            username=user['name'],
-            email=user['email'],
+            username=google_user['name'],
+            email=google_user['email'],
             about='',
             send_message=True,
         )
@@ -547,11 +600,9 @@ async def google_auth(db: AsyncSession, user: Dict[str, Union[str, bool, int]])
         user = await user_crud.create(
             db,
             schema,
-            password=get_password_hash(schema.password),
+            password=await get_password_hash_async(schema.password),
             is_active=True,
         )
-    else:
-        user = await user_crud.get(db, email=user['email'])
 
     data = {
         **create_token(user.id, user.username),
@@ -564,20 +615,13 @@ async def google_auth(db: AsyncSession, user: Dict[str, Union[str, bool, int]])
     )
 
 
-async def export(db: AsyncSession, user: User) -> Dict[str, str]:
+async def export(user: User) -> Dict[str, str]:
     """
-        Export data
-        :param db: DB
-        :type db: AsyncSession
+        Export data (built by task from user ID)
         :param user: User
         :type user: User
         :return: Task ID
         :rtype: dict
     """
-    user_data = await user_crud.export_data(db, id=user.id)
-    videos = await get_channel_videos(db, user.id)
-    history = await get_history(db, user)
-    comments = [comment.__dict__ for comment in user_data.comments]
-    data = ExportData(**{**user.__dict__, 'videos': videos, 'history': history, 'comments': comments}).dict()
-    task = export_data.delay(data=data)
+    task = export_data.delay(user_id=user.id)
     return {'task_id': task.id}
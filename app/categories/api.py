@@ -1,11 +1,12 @@
 from typing import List
 
 from fastapi import APIRouter, status, Depends
+from fastapi.responses import ORJSONResponse
 
 from app.auth.permission import is_superuser
 from app.categories import service
 from app.categories.schemas import GetCategory, CreateCategory, UpdateCategory
-from app.db import async_session
+from app.db import async_session, read_session
 from app.schemas import Message
 from app.videos.schemas import GetVideo
 
@@ -14,16 +15,16 @@ category_router = APIRouter()
 
 @category_router.get(
     '/',
-    response_model=List[GetCategory],
+    responses={200: {'model': List[GetCategory]}},
     status_code=status.HTTP_200_OK,
     description='Get all categories',
     response_description='Get all categories',
     name='Get categories',
 )
 async def get_all_categories():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            return await service.get_all_categories(session)
+            return ORJSONResponse(await service.get_all_categories(session))
 
 
 @category_router.post(
@@ -50,7 +51,7 @@ async def create_category(schema: CreateCategory):
     name='Get category',
 )
 async def get_category(pk: int):
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
             return await service.get_category(session, pk)
 
@@ -87,13 +88,13 @@ async def delete_category(pk: int):
 
 @category_router.get(
     '/videos/{category_pk}',
-    response_model=List[GetVideo],
+    responses={200: {'model': List[GetVideo]}},
     status_code=status.HTTP_200_OK,
     description='Get videos for category',
     response_description='Get videos for category',
     name='Get videos',
 )
 async def get_videos_for_category(category_pk: int):
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            return await service.get_videos_for_category(session, category_pk)
+            return ORJSONResponse(await service.get_videos_for_category(session, category_pk))
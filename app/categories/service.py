@@ -5,7 +5,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.categories.crud import category_crud
 from app.categories.schemas import CreateCategory, UpdateCategory
-from app.videos.crud import video_crud
+from app.serializers import serialize_category, serialize_video_row
+from app.videos.crud import video_list_crud
 
 
 async def get_all_categories(db: AsyncSession) -> List[Dict[str, Union[str, int]]]:
@@ -16,7 +17,7 @@ async def get_all_categories(db: AsyncSession) -> List[Dict[str, Union[str, int]
         :return: Categories
         :rtype: list
     """
-    return [category.__dict__ for category in await category_crud.all(db)]
+    return [serialize_category(category) for category in await category_crud.all(db)]
 
 
 async def create_category(db: AsyncSession, schema: CreateCategory) -> Dict[str, Union[str, int]]:
@@ -30,7 +31,7 @@ async def create_category(db: AsyncSession, schema: CreateCategory) -> Dict[str,
         :rtype: dict
     """
     category = await category_crud.create(db, schema)
-    return category.__dict__
+    return serialize_category(category)
 
 
 async def get_category(db: AsyncSession, pk: int) -> Dict[str, Union[str, int]]:
@@ -45,11 +46,8 @@ async def get_category(db: AsyncSession, pk: int) -> Dict[str, Union[str, int]]:
         :raise HTTPException 400: Category not found
     """
 
-    if not await category_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found')
-
-    category = await category_crud.get(db, id=pk)
-    return category.__dict__
+    category = await category_crud.get_one(db, 'Category not found', id=pk)
+    return serialize_category(category)
 
 
 async def update_category(db: AsyncSession, pk: int, schema: UpdateCategory) -> Dict[str, Union[str, int]]:
@@ -66,11 +64,10 @@ async def update_category(db: AsyncSession, pk: int, schema: UpdateCategory) ->
         :raise HTTPException 400: Category not found
     """
 
-    if not await category_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found')
-
     category = await category_crud.update(db, pk, schema)
-    return category.__dict__
+    if category is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found')
+    return serialize_category(category)
 
 
 async def delete_category(db: AsyncSession, pk) -> Dict[str, str]:
@@ -103,14 +100,10 @@ async def get_videos_for_category(db: AsyncSession, category_pk: int):
         :raise HTTPException 400: Category not found
     """
 
-    if not await category_crud.exists(db, id=category_pk):
+    videos = await video_list_crud.filter(db, category_id=category_pk)
+    if not videos and not await category_crud.exists(db, id=category_pk):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found')
 
     return [
-        {
-            **video.__dict__,
-            'category': video.category.__dict__,
-            'user': video.user.__dict__,
-            'votes': video_crud.get_votes(video),
-        } for video in await video_crud.filter(db, category_id=category_pk)
+        serialize_video_row(video) for video in videos
     ]
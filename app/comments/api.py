@@ -1,28 +1,29 @@
 from typing import List
 
 from fastapi import APIRouter, status, Depends
+from fastapi.responses import ORJSONResponse
 
 from app.auth.models import User
 from app.auth.permission import is_active
 from app.comments import service
 from app.comments.schemas import CreateComment, GetCommentParent, GetAllComments
-from app.db import async_session
+from app.db import async_session, read_session
 
 comments_router = APIRouter()
 
 
 @comments_router.get(
     '/video/{pk}',
-    response_model=List[GetAllComments],
+    responses={200: {'model': List[GetAllComments]}},
     status_code=status.HTTP_200_OK,
     description='Get comments for video',
     response_description='Get comments for video',
     name='Comments',
 )
 async def get_comments(pk: int):
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            return await service.get_comments(session, pk)
+            return ORJSONResponse(await service.get_comments(session, pk))
 
 
 @comments_router.post(
@@ -1,11 +1,11 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.CRUD import CRUD, ModelType
-from app.comments.models import Comment
+from app.comments.models import Comment, CommentChildren
 from app.comments.schemas import CreateComment
 
 
@@ -40,17 +40,22 @@ class CommentCRUD(CRUD[Comment, CreateComment, CreateComment]):
         ).order_by(self.model.id.desc()).filter_by(**kwargs))
         return query.scalars()
 
-    async def get_children(self, db: AsyncSession, comment: Comment):
+    async def get_edges(self, db: AsyncSession, video_id: int) -> List[Tuple[int, int]]:
         """
-            Get children comment
+            Get parent-children edges for video comments
             :param db: DB
             :type db: AsyncSession
-            :param comment: Comment
-            :type comment: Comment
-            :return: Children comment
+            :param video_id: Video ID
+            :type video_id: int
+            :return: Pairs (parent ID, children ID)
             :rtype: list
         """
-        return list(map(lambda x: x[0], await db.execute(comment.children)))
+        query = await db.execute(
+            select(CommentChildren.c.parent_id, CommentChildren.c.children_id).join(
+                self.model, self.model.id == CommentChildren.c.children_id,
+            ).filter(self.model.video_id == video_id).order_by(CommentChildren.c.children_id)
+        )
+        return query.all()
 
 
 comment_crud = CommentCRUD(Comment)
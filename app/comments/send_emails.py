@@ -1,13 +1,12 @@
-from pathlib import Path
-
 from app.auth.models import User
 from app.comments.models import Comment
-from app.config import SERVER_HOST_FRONT_END, PROJECT_NAME, EMAIL_TEMPLATES_DIR
-from app.send_emails import send_email
+from app.config import SERVER_HOST_FRONT_END, PROJECT_NAME, COMMENT_DIGEST_WINDOW
+from app.mail import comment_digest
+from app.send_emails import queue_email
 from app.videos.models import Video
 
 
-def send_new_comment_email(email_to: str, author: User, video: Video, comment: Comment) -> None:
+async def send_new_comment_email(email_to: str, author: User, video: Video, comment: Comment) -> None:
     """
         Send new comment email
         :param email_to: Email to user
@@ -26,19 +25,22 @@ def send_new_comment_email(email_to: str, author: User, video: Video, comment: C
 
     project_name = PROJECT_NAME
     subject = f'{project_name} - New comment'
-    with open(Path(EMAIL_TEMPLATES_DIR) / 'new_comment.html') as f:
-        template_str = f.read()
     link = f'{SERVER_HOST_FRONT_END}/videos/{video.id}'
-    send_email(
+    environment = {
+        'project_name': PROJECT_NAME,
+        'link': link,
+        'author': author.username,
+        'video': video.title,
+        'comment': comment.text,
+        'comment_user': comment.user.username,
+    }
+    if COMMENT_DIGEST_WINDOW > 0:
+        await comment_digest.push(author.id, email_to, environment)
+        return
+
+    await queue_email(
         email_to=email_to,
-        subject_template=subject,
-        html_template=template_str,
-        environment={
-            'project_name': PROJECT_NAME,
-            'link': link,
-            'author': author.username,
-            'video': video.title,
-            'comment': comment.text,
-            'comment_user': comment.user.username,
-        },
+        subject=subject,
+        template='new_comment',
+        environment=environment,
     )
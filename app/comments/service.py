@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,47 +8,35 @@ from app.comments.crud import comment_crud
 from app.comments.models import Comment
 from app.comments.schemas import CreateComment
 from app.comments.send_emails import send_new_comment_email
+from app.serializers import serialize_comment
 from app.videos.crud import video_crud
 
 
-async def get_children(db: AsyncSession, comments: List[Comment]) -> List[Dict[str, Any]]:
-    res = []
-    for comment in comments:
-        c = {
-            'parent_id': list(await db.execute(comment.parent))[0][0].id,
-            'id': comment.id,
-            'text': comment.text,
-            'created_at': comment.created_at,
-            'user': comment.user.__dict__,
-            'is_child': comment.is_child,
-        }
-
-        children = await comment_crud.get_children(db, comment)
-
-        if len(children):
-            c['children'] = await get_children(db, children)
-        res.append(c)
-    return res
-
-
-async def comment_tree(db: AsyncSession, comments: List[Comment]) -> List[Dict[str, Any]]:
+def comment_tree(comments: List[Comment], edges: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+    """
+        Build comments tree in memory
+        :param comments: Video comments
+        :type comments: list
+        :param edges: Pairs (parent ID, children ID)
+        :type edges: list
+        :return: Comment tree
+        :rtype: list
+    """
+    parents = {children_id: parent_id for parent_id, children_id in edges}
+    nodes = {}
     res = []
     for comment in comments:
-        c = {
-            'parent_id': None,
-            'id': comment.id,
-            'text': comment.text,
-            'created_at': comment.created_at,
-            'user': comment.user.__dict__,
-            'is_child': comment.is_child,
-        }
-
-        children = await comment_crud.get_children(db, comment)
-
-        if len(children):
-            c['children'] = await get_children(db, children)
+        nodes[comment.id] = serialize_comment(comment)
+        nodes[comment.id]['parent_id'] = parents.get(comment.id)
+        nodes[comment.id]['children'] = None
         if not comment.is_child:
-            res.append(c)
+            res.append(nodes[comment.id])
+
+    for parent_id, children_id in edges:
+        if parent_id in nodes and children_id in nodes:
+            if nodes[parent_id]['children'] is None:
+                nodes[parent_id]['children'] = []
+            nodes[parent_id]['children'].append(nodes[children_id])
     return res
 
 
@@ -66,15 +54,12 @@ async def create_comment(db: AsyncSession, schema: CreateComment, user: User) ->
         :raise HTTPException 400: Video not found or Parent not found
     """
 
-    if not await video_crud.exists(db, id=schema.video_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
+    video = await video_crud.get_one(db, 'Video not found', id=schema.video_id)
 
     parent = None
 
     if schema.parent_id:
-        if not await comment_crud.exists(db, id=schema.parent_id):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Parent not found')
-        parent = await comment_crud.get(db, id=schema.parent_id)
+        parent = await comment_crud.get_one(db, 'Parent not found', id=schema.parent_id)
         is_child = True
     else:
         is_child = False
@@ -85,27 +70,23 @@ async def create_comment(db: AsyncSession, schema: CreateComment, user: User) ->
     if is_child:
         parent.children.append(new_comment)
 
-    video = await video_crud.get(db, id=schema.video_id)
-
     if parent:
         if parent.user.id != user.id:
-            send_new_comment_email(
+            await send_new_comment_email(
                 parent.user.email,
                 parent.user,
                 video,
                 new_comment,
             )
             if (user.id != video.user.id) and (parent.user.id != video.user.id):
-                send_new_comment_email(video.user.email, video.user, video, new_comment)
+                await send_new_comment_email(video.user.email, video.user, video, new_comment)
     elif user.id != video.user.id:
-        send_new_comment_email(video.user.email, video.user, video, new_comment)
+        await send_new_comment_email(video.user.email, video.user, video, new_comment)
 
-    return {
-        **new_comment.__dict__,
-        'user': new_comment.user.__dict__,
-        'parent': {**parent.__dict__, 'user': parent.user.__dict__} if parent else None,
-        'parent_id': parent.id if parent else None,
-    }
+    comment = serialize_comment(new_comment)
+    comment['parent'] = {**serialize_comment(parent), 'parent_id': None} if parent else None
+    comment['parent_id'] = parent.id if parent else None
+    return comment
 
 
 async def get_comments(db: AsyncSession, pk: int) -> List[Dict[str, Any]]:
@@ -120,8 +101,9 @@ async def get_comments(db: AsyncSession, pk: int) -> List[Dict[str, Any]]:
         :raise HTTPException 400: Video not found
     """
 
-    if not await video_crud.exists(db, id=pk):
+    comments = list(await comment_crud.filter(db, video_id=pk))
+    if not comments and not await video_crud.exists(db, id=pk):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
 
-    comments = await comment_crud.filter(db, video_id=pk)
-    return await comment_tree(db, comments)
+    edges = await comment_crud.get_edges(db, pk)
+    return comment_tree(comments, edges)
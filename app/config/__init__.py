@@ -21,6 +21,12 @@ SERVER_HOST = 'http://localhost:8000'
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
 PAGINATE_SIZE = 3
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SUBSCRIPTIONS_VIDEOS_LIMIT = 20
+SUBSCRIPTIONS_VIDEOS_MAX_LIMIT = 50
+FEED_SIZE = int(os.environ.get('FEED_SIZE') or 500)
+FEED_FANOUT_MAX_FOLLOWERS = int(os.environ.get('FEED_FANOUT_MAX_FOLLOWERS') or 10000)
 
 BACKEND_CORS_ORIGINS = [
     'http://localhost',
@@ -30,6 +36,14 @@ BACKEND_CORS_ORIGINS = [
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 15
 
+USER_CACHE_TTL = min(int(os.environ.get('USER_CACHE_TTL') or 60), ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL')
+CHANNEL_CACHE_TTL = int(os.environ.get('CHANNEL_CACHE_TTL') or 60)
+
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR') or 'thread'
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 4)
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE') or 100)
+
 TESTS = int(os.environ.get('TESTS'))
 
 POSTGRES_USER = os.environ.get('POSTGRES_USER')
@@ -41,17 +55,68 @@ POSTGRES_PORT = os.environ.get('POSTGRES_PORT')
 DATABASE_URL = f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}'
 MEDIA_ROOT = 'media/'
 
+STREAMING_CHUNK_SIZE = int(os.environ.get('STREAMING_CHUNK_SIZE') or 1024 * 1024)
+STREAMING_MAX_RANGES = 16
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE') or 1024 * 1024)
+MAX_VIDEO_SIZE = int(os.environ.get('MAX_VIDEO_SIZE') or 1024 * 1024 * 1024 * 2)
+MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE') or 1024 * 1024 * 5)
+
+VIEWS_FLUSH_INTERVAL = int(os.environ.get('VIEWS_FLUSH_INTERVAL') or 1000)
+
+TRENDS_SNAPSHOT = 1
+TRENDS_REFRESH_INTERVAL = int(os.environ.get('TRENDS_REFRESH_INTERVAL') or 300)
+
+TASK_STATUS_HEARTBEAT = int(os.environ.get('TASK_STATUS_HEARTBEAT') or 15)
+TASK_STATUS_MAX_TASKS = int(os.environ.get('TASK_STATUS_MAX_TASKS') or 20)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 1000)
+
+COMMENT_DIGEST_WINDOW = int(os.environ.get('COMMENT_DIGEST_WINDOW') or 300)
+COMMENT_DIGEST_MIN_INTERVAL = int(os.environ.get('COMMENT_DIGEST_MIN_INTERVAL') or 3600)
+COMMENT_DIGEST_MAX_ITEMS = int(os.environ.get('COMMENT_DIGEST_MAX_ITEMS') or 20)
+COMMENT_DIGEST_FLUSH_INTERVAL = 60
+
 if TESTS:
     DATABASE_URL = f'postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}_test'
     MEDIA_ROOT = 'media/tests/'
     PAGINATE_SIZE = 2
-
-SMTP_TLS = True
-SMTP_PORT = 587
-SMTP_HOST = 'smtp.googlemail.com'
+    USER_CACHE_TTL = 0
+    CHANNEL_CACHE_TTL = 0
+    VIEWS_FLUSH_INTERVAL = 0
+    TRENDS_SNAPSHOT = 0
+    FEED_FANOUT_MAX_FOLLOWERS = 0
+    COMMENT_DIGEST_WINDOW = 0
+
+SYNC_DATABASE_URL = DATABASE_URL.replace('+asyncpg', '+psycopg2')
+
+DB_ECHO = int(os.environ.get('DB_ECHO') or 0)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+DB_POOL_PRE_PING = int(os.environ.get('DB_POOL_PRE_PING') or 1)
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT') or 0)
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_PREPARED_STATEMENT_CACHE_SIZE') or 100)
+
+DATABASE_REPLICA_URLS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+REPLICA_RETRY_INTERVAL = int(os.environ.get('REPLICA_RETRY_INTERVAL') or 30)
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS') or 5)
+
+SMTP_TLS = int(os.environ.get('SMTP_TLS') or 1)
+SMTP_PORT = int(os.environ.get('SMTP_PORT') or 587)
+SMTP_HOST = os.environ.get('SMTP_HOST') or 'smtp.googlemail.com'
 EMAILS_FROM_EMAIL = 'robot@counter.com'
 SMTP_USER = os.environ.get('SMTP_USER')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_TIMEOUT = 10
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE') or 1)
+SMTP_KEEPALIVE = int(os.environ.get('SMTP_KEEPALIVE') or 60)
+
+EMAIL_QUEUE_REDIS_URL = (
+    os.environ.get('EMAIL_QUEUE_REDIS_URL') or os.environ.get('CELERY_BROKER_URL') or 'redis://localhost:6379'
+)
+EMAIL_BATCH_INTERVAL = int(os.environ.get('EMAIL_BATCH_INTERVAL') or 10)
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE') or 100)
 
 EMAILS_FROM_NAME = PROJECT_NAME
 EMAIL_RESET_TOKEN_EXPIRE_HOURS = 48
@@ -1,13 +1,199 @@
-from sqlalchemy import Column, Integer
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, List, AsyncIterator, Optional
+
+from sqlalchemy import Column, Integer, create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import declarative_base, sessionmaker, declared_attr
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL,
+    SYNC_DATABASE_URL,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT,
+    DB_PREPARED_STATEMENT_CACHE_SIZE,
+    DATABASE_REPLICA_URLS,
+    REPLICA_RETRY_INTERVAL,
+)
+
+pool_options = {
+    'echo': bool(DB_ECHO),
+    'pool_size': DB_POOL_SIZE,
+    'max_overflow': DB_MAX_OVERFLOW,
+    'pool_timeout': DB_POOL_TIMEOUT,
+    'pool_recycle': DB_POOL_RECYCLE,
+    'pool_pre_ping': bool(DB_POOL_PRE_PING),
+}
+
+
+def create_engine_async(url: str) -> AsyncEngine:
+    """
+        Create async engine with pool options from config
+        :param url: Database URL
+        :type url: str
+        :return: Engine
+        :rtype: AsyncEngine
+    """
+    return create_async_engine(
+        url,
+        future=True,
+        connect_args={
+            'prepared_statement_cache_size': DB_PREPARED_STATEMENT_CACHE_SIZE,
+            'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT)},
+        },
+        **pool_options,
+    )
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=True)
+
+engine = create_engine_async(DATABASE_URL)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+# Celery workers
+sync_engine = create_engine(
+    SYNC_DATABASE_URL,
+    future=True,
+    connect_args={'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'},
+    **pool_options,
+)
+sync_session = sessionmaker(sync_engine, expire_on_commit=False)
 Base = declarative_base()
 
+pool_counters = {'connects': 0, 'checkouts': 0, 'invalidations': 0}
+
+
+@event.listens_for(engine.sync_engine, 'connect')
+def on_connect(dbapi_connection, connection_record) -> None:
+    pool_counters['connects'] += 1
+
+
+@event.listens_for(engine.sync_engine, 'checkout')
+def on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    pool_counters['checkouts'] += 1
+
+
+@event.listens_for(engine.sync_engine, 'invalidate')
+def on_invalidate(dbapi_connection, connection_record, exception) -> None:
+    pool_counters['invalidations'] += 1
+
+
+def pool_stats(db_engine: Engine = engine.sync_engine) -> Dict[str, int]:
+    """
+        Connection pool stats
+        :param db_engine: Engine
+        :type db_engine: Engine
+        :return: Pool size, idle, checked out and overflow connections, counters
+        :rtype: dict
+    """
+    pool = db_engine.pool
+    return {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': DB_MAX_OVERFLOW,
+        **pool_counters,
+    }
+
+
+# Read-your-writes override: reads of current request go to primary
+read_primary: ContextVar[bool] = ContextVar('read_primary', default=False)
+
+
+class ReplicaRouter:
+    """ Round-robin read replicas with health-aware failover """
+
+    def __init__(self, engines: List[AsyncEngine], retry_interval: int) -> None:
+        self.engines = engines
+        self.retry_interval = retry_interval
+        self.position = 0
+        self.down_until: Dict[int, float] = {}
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """
+            Next healthy replica in round-robin order
+            :return: Engine or None (no replicas or all are down)
+            :rtype: AsyncEngine
+        """
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            index = self.position
+            self.position = (self.position + 1) % len(self.engines)
+            if self.down_until.get(index, 0) <= now:
+                return self.engines[index]
+
+    def mark_down(self, replica: AsyncEngine, error: Exception) -> None:
+        """
+            Skip replica for retry interval
+            :param replica: Engine
+            :type replica: AsyncEngine
+            :param error: Connection error
+            :type error: Exception
+            :return: None
+        """
+        self.down_until[self.engines.index(replica)] = time.monotonic() + self.retry_interval
+        logging.warning(f'replica {replica.url.host}:{replica.url.port} is down: {error}')
+
+
+def is_connection_error(error: Exception) -> bool:
+    """
+        Error is caused by lost or refused DB connection (not by query)
+        :param error: Error
+        :type error: Exception
+        :return: Connection error?
+        :rtype: bool
+    """
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+replica_router = ReplicaRouter([create_engine_async(url) for url in DATABASE_REPLICA_URLS], REPLICA_RETRY_INTERVAL)
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """
+        Session for read-only work: replica (round-robin), primary if replicas are down
+        or request must read its own writes.
+        Session is bound to replica connection checked out before use: replica refusing it
+        is marked down and next one (or primary) serves request
+        :return: Session
+        :rtype: AsyncSession
+    """
+    replica = None if read_primary.get() else replica_router.choose()
+    connection = None
+    while replica is not None:
+        try:
+            connection = await replica.connect()
+            break
+        except Exception as error:
+            if not is_connection_error(error):
+                raise
+            replica_router.mark_down(replica, error)
+            replica = replica_router.choose()
+
+    session = AsyncSession(connection, expire_on_commit=False) if connection is not None else async_session()
+    try:
+        yield session
+    except Exception as error:
+        if replica is not None and is_connection_error(error):
+            replica_router.mark_down(replica, error)
+        raise
+    finally:
+        await session.close()
+        if connection is not None:
+            await connection.close()
+
 
 class ModelMixin(object):
 
@@ -0,0 +1,71 @@
+from typing import Dict, Any, List
+
+from jinja2 import Environment, FileSystemLoader, Template, TemplateNotFound
+
+from app.config import EMAIL_TEMPLATES_DIR
+
+
+class TemplateRegistry:
+    """ Email templates by key (file name without extension), compiled once per process """
+
+    def __init__(self, directory: str, extension: str = '.html') -> None:
+        self.extension = extension
+        self.environment = Environment(loader=FileSystemLoader(directory), auto_reload=False, cache_size=-1)
+
+    def keys(self) -> List[str]:
+        """
+            Template keys
+            :return: Keys
+            :rtype: list
+        """
+        return [
+            name[:-len(self.extension)] for name in self.environment.list_templates()
+            if name.endswith(self.extension)
+        ]
+
+    def get(self, key: str) -> Template:
+        """
+            Get compiled template
+            :param key: Template key
+            :type key: str
+            :return: Template
+            :rtype: Template
+        """
+        return self.environment.get_template(key + self.extension)
+
+    def exists(self, key: str) -> bool:
+        """
+            Template exists?
+            :param key: Template key
+            :type key: str
+            :return: Exists?
+            :rtype: bool
+        """
+        try:
+            self.get(key)
+        except TemplateNotFound:
+            return False
+        return True
+
+    def render(self, key: str, context: Dict[str, Any]) -> str:
+        """
+            Render template
+            :param key: Template key
+            :type key: str
+            :param context: Context
+            :type context: dict
+            :return: Html
+            :rtype: str
+        """
+        return self.get(key).render(**context)
+
+    def load(self) -> None:
+        """
+            Compile all templates
+            :return: None
+        """
+        for key in self.keys():
+            self.get(key)
+
+
+email_templates = TemplateRegistry(EMAIL_TEMPLATES_DIR)
@@ -1,22 +1,54 @@
+import hashlib
+import logging
+
 import aiofiles
+import aiofiles.os
 
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException, status
 
 import os
 
+from app.config import UPLOAD_CHUNK_SIZE
+
 
-async def write_file(file_name: str, file: UploadFile) -> None:
+async def write_file(file_name: str, file: UploadFile, max_size: int = None) -> str:
     """
-        Write file
+        Write file (streaming copy into temp file, renamed on success)
         :param file_name: File name
         :type file_name: str
         :param file: File
         :type file: UploadFile
-        :return: None
+        :param max_size: Max file size in bytes
+        :type max_size: int
+        :return: SHA-256 checksum
+        :rtype: str
+        :raise HTTPException 413: File is too large
     """
-    async with aiofiles.open(file_name, 'wb') as buffer:
-        data = await file.read()
-        await buffer.write(data)
+    temp_name = f'{file_name}.part'
+    checksum = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_name, 'wb') as buffer:
+            while True:
+                data = await file.read(UPLOAD_CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if max_size is not None and size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail='File is too large',
+                    )
+                checksum.update(data)
+                await buffer.write(data)
+        await aiofiles.os.rename(temp_name, file_name)
+    except BaseException:
+        remove_file(temp_name)
+        raise
+
+    digest = checksum.hexdigest()
+    logging.info(f'upload {file_name} size {size} sha256 {digest}')
+    return digest
 
 
 def remove_file(file_name: str) -> None:
@@ -0,0 +1,426 @@
+import json
+import logging
+import smtplib
+import socket
+import ssl
+import time
+from queue import LifoQueue, Empty, Full
+from typing import Optional, List, Tuple, Dict, Any
+
+import redis
+from redis.lock import Lock
+from starlette.concurrency import run_in_threadpool
+
+from app.config import (
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_TLS,
+    SMTP_USER,
+    SMTP_PASSWORD,
+    SMTP_TIMEOUT,
+    SMTP_POOL_SIZE,
+    SMTP_KEEPALIVE,
+    EMAIL_QUEUE_REDIS_URL,
+    COMMENT_DIGEST_WINDOW,
+    COMMENT_DIGEST_MIN_INTERVAL,
+    COMMENT_DIGEST_MAX_ITEMS,
+)
+
+# Connection is lost, message can be sent on a new connection
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class SMTPUnavailable(smtplib.SMTPException):
+    """ Connection can not be opened (connect, TLS or login failed) """
+    pass
+
+
+# Server can not send any message now, messages are retried later
+UNAVAILABLE_ERRORS = RECONNECT_ERRORS + (SMTPUnavailable,)
+
+
+class SMTPPool:
+    """ SMTP connections of worker process (kept alive between tasks, reconnected when lost) """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            tls: bool = False,
+            user: Optional[str] = None,
+            password: Optional[str] = None,
+            size: int = 1,
+            keepalive: int = 60,
+            timeout: int = 10,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.user = user
+        self.password = password
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.connections: LifoQueue = LifoQueue(maxsize=size)
+
+    def connect(self) -> smtplib.SMTP:
+        """
+            Open connection
+            :return: Connection
+            :rtype: SMTP
+            :raise SMTPUnavailable: Connect, TLS or login failed
+        """
+        client = None
+        try:
+            client = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.tls:
+                client.starttls(context=ssl.create_default_context())
+            if self.user:
+                client.login(self.user, self.password)
+        except (smtplib.SMTPException, OSError) as error:
+            if client is not None:
+                client.close()
+            raise SMTPUnavailable(f'{self.host}:{self.port} {error!r}') from error
+        return client
+
+    @staticmethod
+    def close_connection(client: smtplib.SMTP) -> None:
+        """
+            Close connection
+            :param client: Connection
+            :type client: SMTP
+            :return: None
+        """
+        try:
+            client.quit()
+        except (smtplib.SMTPException, OSError):
+            client.close()
+
+    def acquire(self) -> smtplib.SMTP:
+        """
+            Get idle connection (checked with NOOP after keepalive) or open new one
+            :return: Connection
+            :rtype: SMTP
+            :raise SMTPUnavailable: New connection can not be opened
+        """
+        while True:
+            try:
+                client, released_at = self.connections.get_nowait()
+            except Empty:
+                return self.connect()
+            if time.monotonic() - released_at < self.keepalive:
+                return client
+            try:
+                if client.noop()[0] == 250:
+                    return client
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.close_connection(client)
+
+    def release(self, client: smtplib.SMTP) -> None:
+        """
+            Return connection to pool (closed when pool is full)
+            :param client: Connection
+            :type client: SMTP
+            :return: None
+        """
+        try:
+            self.connections.put_nowait((client, time.monotonic()))
+        except Full:
+            self.close_connection(client)
+
+    def send(self, from_addr: str, to_addrs: List[str], message: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """
+            Send message (retried once on new connection when connection is lost)
+            :param from_addr: From address
+            :type from_addr: str
+            :param to_addrs: To addresses
+            :type to_addrs: list
+            :param message: Message
+            :type message: bytes
+            :return: Refused recipients
+            :rtype: dict
+            :raise SMTPException: Message is not sent
+        """
+        for attempt in range(2):
+            client = self.acquire()
+            try:
+                response = client.sendmail(from_addr, to_addrs, message)
+            except RECONNECT_ERRORS:
+                client.close()
+                if attempt:
+                    raise
+                continue
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # Server rejected message, connection is reset and still usable
+                self.release(client)
+                raise
+            except Exception:
+                client.close()
+                raise
+            self.release(client)
+            return response
+
+    def close(self) -> None:
+        """
+            Close idle connections
+            :return: None
+        """
+        while True:
+            try:
+                client, _ = self.connections.get_nowait()
+            except Empty:
+                return
+            self.close_connection(client)
+
+
+class EmailQueue:
+    """ Redis list of emails waiting for batch sending (taken emails are kept until acknowledged) """
+
+    # Move first emails of queue to processing list
+    TAKE_SCRIPT = """
+        local items = {}
+        for i = 1, tonumber(ARGV[1]) do
+            local item = redis.call('LPOP', KEYS[1])
+            if not item then
+                break
+            end
+            redis.call('RPUSH', KEYS[2], item)
+            items[i] = item
+        end
+        return items
+    """
+    # Move processing list back to head of queue
+    RECOVER_SCRIPT = """
+        local count = 0
+        while true do
+            local item = redis.call('RPOP', KEYS[2])
+            if not item then
+                return count
+            end
+            redis.call('LPUSH', KEYS[1], item)
+            count = count + 1
+        end
+    """
+
+    def __init__(self, url: str, key: str = 'email:queue', lock_timeout: int = 600) -> None:
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self.processing_key = f'{key}:processing'
+        self.lock_timeout = lock_timeout
+        self.take_script = self.client.register_script(self.TAKE_SCRIPT)
+        self.recover_script = self.client.register_script(self.RECOVER_SCRIPT)
+
+    def push(self, *emails: Dict[str, Any]) -> None:
+        """
+            Add emails to queue
+            :param emails: Emails (send_email kwargs)
+            :type emails: dict
+            :return: None
+        """
+        if emails:
+            self.client.rpush(self.key, *(json.dumps(email) for email in emails))
+
+    def take(self, size: int) -> List[Dict[str, Any]]:
+        """
+            Take emails from queue (kept in processing list until ack)
+            :param size: Max count
+            :type size: int
+            :return: Emails
+            :rtype: list
+        """
+        result = []
+        for email in self.take_script(keys=[self.key, self.processing_key], args=[size]):
+            try:
+                result.append(json.loads(email))
+            except ValueError as error:
+                logging.warning(f'email queue decode error: {error}')
+        return result
+
+    def ack(self, *unsent: Dict[str, Any]) -> None:
+        """
+            Acknowledge taken emails, unsent emails are returned to head of queue
+            :param unsent: Unsent emails
+            :type unsent: dict
+            :return: None
+        """
+        with self.client.pipeline() as pipe:
+            if unsent:
+                pipe.lpush(self.key, *(json.dumps(email) for email in reversed(unsent)))
+            pipe.delete(self.processing_key)
+            pipe.execute()
+
+    def recover(self) -> int:
+        """
+            Return emails taken by interrupted flush to head of queue
+            :return: Recovered count
+            :rtype: int
+        """
+        return self.recover_script(keys=[self.key, self.processing_key])
+
+    def lock(self) -> Lock:
+        """
+            Lock of queue flush (one flush at a time, released after timeout when worker is lost)
+            :return: Lock
+            :rtype: Lock
+        """
+        return self.client.lock(f'{self.key}:lock', timeout=self.lock_timeout, blocking_timeout=0)
+
+
+class NotificationDigest:
+    """ Per-recipient Redis buffer of notifications, flushed into one digest email per window """
+
+    # Add notification, flush after window but not earlier than min interval after previous digest
+    PUSH_SCRIPT = """
+        local due = tonumber(ARGV[4]) + tonumber(ARGV[5])
+        local sent_at = redis.call('GET', KEYS[4])
+        if sent_at then
+            due = math.max(due, tonumber(sent_at) + tonumber(ARGV[6]))
+        end
+        redis.call('RPUSH', KEYS[1], ARGV[2])
+        redis.call('LTRIM', KEYS[1], -tonumber(ARGV[7]), -1)
+        redis.call('INCR', KEYS[2])
+        redis.call('SET', KEYS[3], ARGV[3])
+        redis.call('ZADD', KEYS[5], 'NX', due, ARGV[1])
+    """
+    # Remove read notifications and mark digest as sent, later notifications wait for next digest
+    ACK_SCRIPT = """
+        local now = tonumber(ARGV[3])
+        local remaining = tonumber(redis.call('GET', KEYS[2]) or 0) - tonumber(ARGV[2])
+        redis.call('SETEX', KEYS[4], math.max(tonumber(ARGV[5]), 1), ARGV[3])
+        if remaining > 0 then
+            redis.call('LTRIM', KEYS[1], -remaining, -1)
+            redis.call('SET', KEYS[2], remaining)
+            redis.call('ZADD', KEYS[5], now + math.max(tonumber(ARGV[4]), tonumber(ARGV[5])), ARGV[1])
+            return remaining
+        end
+        redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+        redis.call('ZREM', KEYS[5], ARGV[1])
+        return 0
+    """
+
+    def __init__(
+            self,
+            url: str,
+            window: int,
+            min_interval: int,
+            max_items: int,
+            prefix: str = 'digest',
+            lock_timeout: int = 600,
+    ) -> None:
+        self.client = redis.Redis.from_url(url)
+        self.window = window
+        self.min_interval = min_interval
+        self.max_items = max_items
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.due_key = f'{prefix}:due'
+        self.push_script = self.client.register_script(self.PUSH_SCRIPT)
+        self.ack_script = self.client.register_script(self.ACK_SCRIPT)
+
+    def keys(self, user_id: int) -> List[str]:
+        """
+            Recipient keys (buffer, count, email, sent time, due set)
+            :param user_id: Recipient ID
+            :type user_id: int
+            :return: Keys
+            :rtype: list
+        """
+        key = f'{self.prefix}:{user_id}'
+        return [key, f'{key}:count', f'{key}:email', f'{key}:sent', self.due_key]
+
+    async def push(self, user_id: int, email: str, item: Dict[str, Any], now: Optional[float] = None) -> None:
+        """
+            Add notification to recipient buffer
+            :param user_id: Recipient ID
+            :type user_id: int
+            :param email: Recipient email
+            :type email: str
+            :param item: Notification
+            :type item: dict
+            :param now: Current time
+            :type now: float
+            :return: None
+        """
+        args = [
+            user_id, json.dumps(item), email, now or time.time(), self.window, self.min_interval, self.max_items,
+        ]
+        try:
+            await run_in_threadpool(self.push_script, keys=self.keys(user_id), args=args)
+        except redis.RedisError as error:
+            logging.warning(f'{self.prefix} push error: {error}')
+
+    def due(self, size: int, now: Optional[float] = None) -> List[int]:
+        """
+            Recipients with digest due
+            :param size: Max count
+            :type size: int
+            :param now: Current time
+            :type now: float
+            :return: Recipient IDs
+            :rtype: list
+        """
+        return [int(user_id) for user_id in self.client.zrangebyscore(self.due_key, 0, now or time.time(), 0, size)]
+
+    def read(self, user_id: int) -> Tuple[Optional[str], int, List[Dict[str, Any]]]:
+        """
+            Read recipient buffer (kept until ack)
+            :param user_id: Recipient ID
+            :type user_id: int
+            :return: Email, notifications count and last notifications
+            :rtype: tuple
+        """
+        key, count_key, email_key, *_ = self.keys(user_id)
+        with self.client.pipeline() as pipe:
+            pipe.lrange(key, 0, -1)
+            pipe.get(count_key)
+            pipe.get(email_key)
+            items, count, email = pipe.execute()
+        return (
+            email.decode() if email else None,
+            int(count or 0),
+            [json.loads(item) for item in items],
+        )
+
+    def ack(self, user_id: int, count: int, now: Optional[float] = None) -> int:
+        """
+            Acknowledge read buffer after digest is queued
+            :param user_id: Recipient ID
+            :type user_id: int
+            :param count: Read notifications count
+            :type count: int
+            :param now: Current time
+            :type now: float
+            :return: Count of notifications pushed after read
+            :rtype: int
+        """
+        return self.ack_script(
+            keys=self.keys(user_id), args=[user_id, count, now or time.time(), self.window, self.min_interval],
+        )
+
+    def lock(self) -> Lock:
+        """
+            Lock of digests flush (one flush at a time, released after timeout when worker is lost)
+            :return: Lock
+            :rtype: Lock
+        """
+        return self.client.lock(f'{self.prefix}:lock', timeout=self.lock_timeout, blocking_timeout=0)
+
+
+smtp_pool = SMTPPool(
+    SMTP_HOST,
+    SMTP_PORT,
+    bool(SMTP_TLS),
+    SMTP_USER,
+    SMTP_PASSWORD,
+    SMTP_POOL_SIZE,
+    SMTP_KEEPALIVE,
+    SMTP_TIMEOUT,
+)
+email_queue = EmailQueue(EMAIL_QUEUE_REDIS_URL)
+comment_digest = NotificationDigest(
+    EMAIL_QUEUE_REDIS_URL,
+    COMMENT_DIGEST_WINDOW,
+    COMMENT_DIGEST_MIN_INTERVAL,
+    COMMENT_DIGEST_MAX_ITEMS,
+    'digest:comment',
+)
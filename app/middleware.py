@@ -0,0 +1,52 @@
+import time
+
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.config import REPLICA_STICKY_SECONDS
+from app.db import read_primary, replica_router, ReplicaRouter
+
+READ_PRIMARY_COOKIE = 'read_primary_until'
+READ_PRIMARY_HEADER = 'x-read-primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReadYourWritesMiddleware:
+    """
+        Route reads of client to primary for a few seconds after its writes
+        (or when request has X-Read-Primary header), so replica lag is not visible
+    """
+
+    def __init__(
+            self, app: ASGIApp, sticky_seconds: int = REPLICA_STICKY_SECONDS, router: ReplicaRouter = replica_router,
+    ) -> None:
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+        self.router = router
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not self.router.engines:
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        try:
+            sticky = float(connection.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        read_primary.set(sticky or connection.headers.get(READ_PRIMARY_HEADER) == '1')
+
+        if scope['method'] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                cookie = (
+                    f'{READ_PRIMARY_COOKIE}={time.time() + self.sticky_seconds}; '
+                    f'Max-Age={self.sticky_seconds}; Path=/; HttpOnly; SameSite=Lax'
+                )
+                message['headers'] = [*message.get('headers', []), (b'set-cookie', cookie.encode('latin-1'))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,167 @@
+import hashlib
+import os
+from email.utils import formatdate
+from typing import Optional, List, Tuple, IO
+from uuid import uuid4
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Scope, Receive, Send
+
+from app.config import STREAMING_CHUNK_SIZE, STREAMING_MAX_RANGES
+
+
+def parse_ranges(header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+        Parse Range header
+        :param header: Range header
+        :type header: str
+        :param file_size: File size
+        :type file_size: int
+        :return: Satisfiable ranges (start, end) or None if header must be ignored
+        :rtype: list
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return
+
+    specs = specs.split(',')
+    if len(specs) > STREAMING_MAX_RANGES:
+        return
+
+    ranges = []
+    for spec in specs:
+        start, separator, end = spec.strip().partition('-')
+        if not separator:
+            return
+        try:
+            if not start:
+                length = int(end)
+                if length > 0 and file_size > 0:
+                    ranges.append((max(0, file_size - length), file_size - 1))
+                continue
+
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return
+
+        if end is not None and end < start:
+            return
+        if start < file_size:
+            ranges.append((start, file_size - 1 if end is None else min(end, file_size - 1)))
+    return ranges
+
+
+class RangedFileResponse(Response):
+    """ File response with Range, If-Range, multi-range and zero-copy support """
+
+    def __init__(
+            self,
+            path: str,
+            stat_result: os.stat_result,
+            request_headers,
+            media_type: str = None,
+            chunk_size: int = STREAMING_CHUNK_SIZE,
+    ) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.background = None
+        self.media_type = media_type
+        self.parts: List[Tuple[bytes, int, int]] = []
+
+        file_size = stat_result.st_size
+        etag = hashlib.md5(f'{stat_result.st_mtime}-{file_size}'.encode()).hexdigest()
+        headers = {
+            'accept-ranges': 'bytes',
+            'etag': f'"{etag}"',
+            'last-modified': formatdate(stat_result.st_mtime, usegmt=True),
+        }
+
+        ranges = None
+        range_header = request_headers.get('range')
+        if_range = request_headers.get('if-range')
+        if range_header and (not if_range or if_range in (headers['etag'], headers['last-modified'])):
+            ranges = parse_ranges(range_header, file_size)
+
+        if ranges is None:
+            self.status_code = 200
+            self.parts.append((b'', 0, file_size))
+            headers['content-length'] = str(file_size)
+        elif not ranges:
+            self.status_code = 416
+            self.media_type = None
+            headers['content-range'] = f'bytes */{file_size}'
+            headers['content-length'] = '0'
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.parts.append((b'', start, end - start + 1))
+            headers['content-range'] = f'bytes {start}-{end}/{file_size}'
+            headers['content-length'] = str(end - start + 1)
+        else:
+            boundary = uuid4().hex
+            self.status_code = 206
+            self.media_type = f'multipart/byteranges; boundary={boundary}'
+            content_length = 0
+            for index, (start, end) in enumerate(ranges):
+                prefix = (b'' if index == 0 else b'\r\n') + (
+                    f'--{boundary}\r\n'
+                    f'Content-Type: {media_type}\r\n'
+                    f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'
+                ).encode('latin-1')
+                self.parts.append((prefix, start, end - start + 1))
+                content_length += len(prefix) + end - start + 1
+            self.epilogue = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+            headers['content-length'] = str(content_length + len(self.epilogue))
+
+        self.init_headers(headers)
+
+    async def send_part(self, send: Send, file: IO[bytes], start: int, length: int, zero_copy: bool) -> None:
+        """
+            Send file part
+            :param send: Send
+            :param file: File
+            :param start: Start
+            :type start: int
+            :param length: Length
+            :type length: int
+            :param zero_copy: Server supports zero-copy send
+            :type zero_copy: bool
+            :return: None
+        """
+        if zero_copy:
+            await send({
+                'type': 'http.response.zerocopysend',
+                'file': file,
+                'offset': start,
+                'count': length,
+                'more_body': True,
+            })
+            return
+
+        await run_in_threadpool(file.seek, start)
+        while length > 0:
+            data = await run_in_threadpool(file.read, min(self.chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+
+        if scope['method'] != 'HEAD' and self.parts:
+            zero_copy = 'http.response.zerocopysend' in scope.get('extensions', {})
+            file = await run_in_threadpool(open, self.path, 'rb')
+            try:
+                for prefix, start, length in self.parts:
+                    if prefix:
+                        await send({'type': 'http.response.body', 'body': prefix, 'more_body': True})
+                    await self.send_part(send, file, start, length, zero_copy)
+            finally:
+                await run_in_threadpool(file.close)
+            if len(self.parts) > 1:
+                await send({'type': 'http.response.body', 'body': self.epilogue, 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
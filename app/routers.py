@@ -1,10 +1,16 @@
-from fastapi import APIRouter
+from typing import Dict
+
+from fastapi import APIRouter, Depends
 from fastapi.responses import FileResponse
 
 from app import service
 from app.auth.api import auth_router
+from app.auth.models import User
+from app.auth.permission import is_superuser
+from app.auth.security import hash_pool
 from app.categories.api import category_router
 from app.comments.api import comments_router
+from app.db import pool_stats
 from app.videos.api import videos_router
 
 routers = APIRouter()
@@ -28,6 +34,24 @@ async def get_file(file_name: str) -> FileResponse:
     """
     return await service.get_file(file_name)
 
+
+@routers.get(
+    '/pool-stats',
+    tags=['system'],
+    description='Connection and password hashing pools stats',
+    response_description='Pools stats',
+    name='Pools stats',
+)
+async def get_pool_stats(user: User = Depends(is_superuser)) -> Dict[str, Dict[str, int]]:
+    """
+        Pools stats
+        :param user: Superuser
+        :type user: User
+        :return: DB and password hashing pools stats
+        :rtype: dict
+    """
+    return {'db': pool_stats(), 'password_hash': hash_pool.stats()}
+
 routers.include_router(auth_router, prefix='/auth', tags=['auth'])
 routers.include_router(category_router, prefix='/categories', tags=['categories'])
 routers.include_router(videos_router, prefix='/videos', tags=['videos'])
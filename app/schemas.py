@@ -19,7 +19,7 @@ class Votes(BaseModel):
 class Paginate(BaseModel):
     """ Paginate """
 
-    page: int
+    page: Optional[int]
     previous: Optional[str]
     next: Optional[str]
     results: List
@@ -1,14 +1,50 @@
-from app.config import TESTS
+import logging
+
+import redis
+from starlette.concurrency import run_in_threadpool
+
+from app.config import TESTS, EMAIL_BATCH_INTERVAL
+from app.mail import email_queue
 from app.tasks import send_email as email
 
 
 def send_email(
         email_to: str,
-        subject_template: str = '',
-        html_template: str = '',
+        subject: str = '',
+        template: str = '',
         environment=None,
         attach: bool = False,
         file_name: str = '',
 ) -> None:
-    if not TESTS:
-        email.delay(email_to, subject_template, html_template, environment, attach, file_name)
+    if TESTS:
+        return
+    email.delay(email_to, subject, template, environment, attach, file_name)
+
+
+async def queue_email(email_to: str, subject: str = '', template: str = '', environment=None) -> None:
+    """
+        Queue email for batch sending (sent as task when batching is disabled)
+        :param email_to: Email to user
+        :type email_to: str
+        :param subject: Subject
+        :type subject: str
+        :param template: Html body template key
+        :type template: str
+        :param environment: Environment
+        :type environment: dict
+        :return: None
+    """
+    if TESTS:
+        return
+    if EMAIL_BATCH_INTERVAL <= 0:
+        send_email(email_to, subject, template, environment)
+        return
+    try:
+        await run_in_threadpool(email_queue.push, {
+            'email_to': email_to,
+            'subject': subject,
+            'template': template,
+            'environment': environment,
+        })
+    except redis.RedisError as error:
+        logging.warning(f'email queue push error: {error}')
@@ -0,0 +1,81 @@
+from operator import attrgetter
+from typing import Callable, Dict, Any, Type
+
+from pydantic import BaseModel
+
+from app.auth.schemas import UserPublic, ChangeUserDataResponse
+from app.categories.schemas import GetCategory
+from app.comments.schemas import GetComment
+from app.videos.schemas import GetVideoBase
+
+
+def serializer(schema: Type[BaseModel], *exclude: str, prefix: str = '') -> Callable[[Any], Dict[str, Any]]:
+    """
+        Precompile serializer of schema fields (object or row to dict, no validation)
+        :param schema: Schema
+        :type schema: BaseModel
+        :param exclude: Excluded fields (serialized by caller)
+        :type exclude: str
+        :param prefix: Prefix of attributes (labels of joined row columns)
+        :type prefix: str
+        :return: Serializer
+        :rtype: function
+    """
+    fields = tuple(field for field in schema.__fields__ if field not in exclude)
+    getter = attrgetter(*(prefix + field for field in fields))
+
+    if len(fields) == 1:
+        return lambda obj: {fields[0]: getter(obj)}
+    return lambda obj: dict(zip(fields, getter(obj)))
+
+
+serialize_user = serializer(UserPublic)
+serialize_user_data = serializer(ChangeUserDataResponse)
+serialize_category = serializer(GetCategory)
+_serialize_video = serializer(GetVideoBase)
+_serialize_comment = serializer(GetComment, 'user', 'parent_id')
+_serialize_user_row = serializer(UserPublic, prefix='user_')
+_serialize_category_row = serializer(GetCategory, prefix='category_')
+
+
+def serialize_video(video) -> Dict[str, Any]:
+    """
+        Serialize video (GetVideo)
+        :param video: Video
+        :type video: Video
+        :return: Video data
+        :rtype: dict
+    """
+    data = _serialize_video(video)
+    data['category'] = serialize_category(video.category)
+    data['user'] = serialize_user(video.user)
+    data['votes'] = {'likes': video.likes_count, 'dislikes': video.dislikes_count}
+    return data
+
+
+def serialize_video_row(row) -> Dict[str, Any]:
+    """
+        Serialize video row of VideoListCRUD (GetVideo)
+        :param row: Row
+        :type row: Row
+        :return: Video data
+        :rtype: dict
+    """
+    data = _serialize_video(row)
+    data['category'] = _serialize_category_row(row)
+    data['user'] = _serialize_user_row(row)
+    data['votes'] = {'likes': row.likes_count, 'dislikes': row.dislikes_count}
+    return data
+
+
+def serialize_comment(comment) -> Dict[str, Any]:
+    """
+        Serialize comment (GetComment without parent ID)
+        :param comment: Comment
+        :type comment: Comment
+        :return: Comment data
+        :rtype: dict
+    """
+    data = _serialize_comment(comment)
+    data['user'] = serialize_user(comment.user)
+    return data
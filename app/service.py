@@ -1,5 +1,7 @@
+import base64
+import binascii
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 from fastapi import HTTPException, status
 from fastapi.responses import FileResponse
@@ -25,12 +27,48 @@ async def get_file(file_name: str) -> FileResponse:
     return FileResponse(base_dir + file_name)
 
 
-def paginate(crud, url):
+def encode_cursor(pk: int, reverse: bool = False) -> str:
+    """
+        Encode opaque cursor
+        :param pk: Cursor ID
+        :type pk: int
+        :param reverse: Previous page cursor
+        :type reverse: bool
+        :return: Cursor
+        :rtype: str
+    """
+    return base64.urlsafe_b64encode(f'{"p" if reverse else "n"}:{pk}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[int], bool]:
+    """
+        Decode opaque cursor
+        :param cursor: Cursor
+        :type cursor: str
+        :return: Cursor ID and previous page flag
+        :rtype: tuple
+        :raise HTTPException 400: Invalid cursor
+    """
+    if not cursor:
+        return None, False
+
+    try:
+        direction, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        if direction not in ('n', 'p'):
+            raise ValueError
+        return int(pk), direction == 'p'
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+def paginate(crud, url, cursor_url: str = None):
     """
         Paginate decorator
         :param crud: CRUD
         :param url: url
         :type url: str
+        :param cursor_url: Cursor mode url
+        :type cursor_url: str
         :return: wrapper
     """
 
@@ -41,6 +79,42 @@ def paginate(crud, url):
             :return: wrapper
         """
 
+        async def cursor_wrapper(*args, cursor: str, **kwargs) -> Dict[str, Any]:
+            """
+                Keyset (cursor) pagination, one query per page
+                :param args: args
+                :param cursor: Cursor
+                :type cursor: str
+                :param kwargs: kwargs
+                :return: Pagination results
+                :rtype: dict
+            """
+            pk, reverse = decode_cursor(cursor)
+            queryset = await crud.keyset(kwargs['db'], PAGINATE_SIZE + 1, pk, reverse)
+
+            has_more = len(queryset) > PAGINATE_SIZE
+            queryset = queryset[:PAGINATE_SIZE]
+            if reverse:
+                queryset = queryset[::-1]
+
+            if not queryset:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Results not found')
+
+            next_page = None
+            previous_page = None
+
+            if has_more or reverse:
+                next_page = f'{cursor_url}{encode_cursor(queryset[-1].id)}'
+            if (has_more and reverse) or (pk is not None and not reverse):
+                previous_page = f'{cursor_url}{encode_cursor(queryset[0].id, reverse=True)}'
+
+            return {
+                'next': next_page,
+                'previous': previous_page,
+                'page': None,
+                'results': await function(*args, queryset=queryset, **kwargs)
+            }
+
         async def wrapper(*args, **kwargs) -> Dict[str, Any]:
             """
                 Wrapper
@@ -49,23 +123,24 @@ def paginate(crud, url):
                 :return: Pagination results
                 :rtype: dict
             """
+            cursor = kwargs.pop('cursor', None)
+            if cursor is not None and cursor_url:
+                return await cursor_wrapper(*args, cursor=cursor, **kwargs)
+
             skip = PAGINATE_SIZE * (kwargs['page'] - 1)
-            queryset = await crud.all(kwargs['db'], skip, PAGINATE_SIZE)
+            queryset = await crud.all(kwargs['db'], skip, PAGINATE_SIZE + 1)
 
             if not queryset:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Results not found')
 
-            next_page = f'{url}{kwargs["page"] + 1}' if await crud.page_exists(kwargs['db'], skip + PAGINATE_SIZE, PAGINATE_SIZE) else None
-            previous_page = None
-
-            if (kwargs['page'] - 1) > 0:
-                previous_page = f'{url}{kwargs["page"] - 1}' if await crud.page_exists(kwargs['db'], skip - PAGINATE_SIZE, PAGINATE_SIZE) else None
+            next_page = f'{url}{kwargs["page"] + 1}' if len(queryset) > PAGINATE_SIZE else None
+            previous_page = f'{url}{kwargs["page"] - 1}' if kwargs['page'] > 1 else None
 
             return {
                 'next': next_page,
                 'previous': previous_page,
                 'page': kwargs['page'],
-                'results': await function(*args, queryset=queryset, **kwargs)
+                'results': await function(*args, queryset=queryset[:PAGINATE_SIZE], **kwargs)
             }
 
         return wrapper
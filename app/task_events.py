@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import threading
+import time
+from queue import Queue, Empty
+from typing import Dict, Any, Set, List, Optional
+
+import redis
+from celery import states
+from celery.result import AsyncResult
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from app.config import TASK_STATUS_HEARTBEAT, TASK_STATUS_MAX_TASKS
+from app.tasks import celery
+
+
+def task_payload(task_id: str, state: str, info: Any) -> Dict[str, Any]:
+    """
+        Task status message
+        :param task_id: Task ID
+        :type task_id: str
+        :param state: Task state
+        :type state: str
+        :param info: Task meta (progress) or result
+        :return: Message
+        :rtype: dict
+    """
+    if isinstance(info, dict):
+        progress = info.get('progress', 0)
+    else:
+        progress = 100 if state == states.SUCCESS else 0
+    return {'task_id': task_id, 'state': state, 'progress': progress}
+
+
+class TaskListener:
+    """ Task status updates of one websocket (coalesced, latest state per task) """
+
+    def __init__(self) -> None:
+        self.tasks: Set[str] = set()
+        self.pushed: Set[str] = set()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.ready = asyncio.Event()
+
+    def push(self, task_id: str, state: str, info: Any, initial: bool = False) -> None:
+        """
+            Push task state (replaces unsent state of same task)
+            :param task_id: Task ID
+            :type task_id: str
+            :param state: Task state
+            :type state: str
+            :param info: Task meta or result
+            :param initial: State is fetched from result backend
+            :type initial: bool
+            :return: None
+        """
+        if task_id not in self.tasks or (initial and task_id in self.pushed):
+            return
+        if not initial:
+            self.pushed.add(task_id)
+        self.pending[task_id] = task_payload(task_id, state, info)
+        self.ready.set()
+
+    async def get(self, timeout: float) -> List[Dict[str, Any]]:
+        """
+            Wait for task states
+            :param timeout: Timeout in seconds
+            :type timeout: float
+            :return: Task states (empty on timeout)
+            :rtype: list
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+        payloads = list(self.pending.values())
+        self.pending.clear()
+        return payloads
+
+
+class TaskEvents:
+    """
+        Task status updates from result backend pub/sub (one connection per process,
+        subscribed only to channels of tasks watched by websockets of this process)
+    """
+
+    def __init__(self, app=celery, heartbeat: float = TASK_STATUS_HEARTBEAT) -> None:
+        self.app = app
+        self.heartbeat = heartbeat
+        self.listeners: Dict[str, Set[TaskListener]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        # Subscribe and unsubscribe commands for listener thread (it owns pub/sub connection)
+        self.commands: Queue = Queue()
+        self.channels: Set[str] = set()
+
+    def start(self) -> None:
+        """
+            Start pub/sub listener thread
+            :return: None
+        """
+        if self.thread is None:
+            self.loop = asyncio.get_event_loop()
+            self.thread = threading.Thread(target=self.listen, name='task-events', daemon=True)
+            self.thread.start()
+
+    def connect(self) -> redis.Redis:
+        """
+            Pub/sub client (result backend client has socket timeout, idle pub/sub would be reconnected)
+            :return: Client
+            :rtype: Redis
+        """
+        return redis.Redis.from_url(self.app.conf.result_backend, health_check_interval=30)
+
+    def listen(self) -> None:
+        """
+            Listen task state messages (Redis result backend publishes every stored state)
+            :return: None
+        """
+        backend = self.app.backend
+        client = self.connect()
+        reconnect = False
+        while True:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                if self.channels:
+                    pubsub.subscribe(*(backend.get_key_for_task(task_id) for task_id in self.channels))
+                if reconnect:
+                    self.loop.call_soon_threadsafe(self.resync)
+                reconnect = True
+                while True:
+                    self.run_commands(pubsub, block=not self.channels)
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None or message['type'] != 'message':
+                        continue
+                    try:
+                        meta = backend.decode_result(message['data'])
+                    except Exception as error:
+                        logging.warning(f'task events decode error: {error}')
+                        continue
+                    self.loop.call_soon_threadsafe(self.dispatch, meta['task_id'], meta['status'], meta['result'])
+            except redis.RedisError as error:
+                logging.warning(f'task events error: {error}')
+            finally:
+                pubsub.close()
+            time.sleep(1)
+
+    def run_commands(self, pubsub, block: bool) -> None:
+        """
+            Apply queued subscribe and unsubscribe commands (listener thread)
+            :param pubsub: Pub/sub
+            :type pubsub: PubSub
+            :param block: Wait for command (no channels to listen)
+            :type block: bool
+            :return: None
+        """
+        backend = self.app.backend
+        while True:
+            try:
+                command, task_id = self.commands.get(block=block)
+            except Empty:
+                return
+            block = False
+            if command == 'subscribe':
+                self.channels.add(task_id)
+                pubsub.subscribe(backend.get_key_for_task(task_id))
+                # States stored before subscription are fetched
+                self.loop.call_soon_threadsafe(lambda task_id=task_id: asyncio.ensure_future(self.fetch(task_id)))
+            else:
+                self.channels.discard(task_id)
+                pubsub.unsubscribe(backend.get_key_for_task(task_id))
+
+    def dispatch(self, task_id: str, state: str, info: Any) -> None:
+        """
+            Dispatch task state to listeners
+            :param task_id: Task ID
+            :type task_id: str
+            :param state: Task state
+            :type state: str
+            :param info: Task meta or result
+            :return: None
+        """
+        for listener in tuple(self.listeners.get(task_id, ())):
+            listener.push(task_id, state, info)
+            if state in states.READY_STATES:
+                self.unsubscribe(listener, task_id)
+
+    def resync(self) -> None:
+        """
+            Fetch states of subscribed tasks (updates may be lost while reconnecting)
+            :return: None
+        """
+        for task_id, listeners in self.listeners.items():
+            for listener in listeners:
+                listener.pushed.discard(task_id)
+            asyncio.ensure_future(self.fetch(task_id))
+
+    async def fetch(self, task_id: str, listeners: Optional[Set[TaskListener]] = None) -> None:
+        """
+            Fetch task state from result backend and dispatch it
+            :param task_id: Task ID
+            :type task_id: str
+            :param listeners: Listeners to dispatch to (all listeners of task by default)
+            :type listeners: set
+            :return: None
+        """
+        task = AsyncResult(task_id, app=self.app)
+        try:
+            state, info = await run_in_threadpool(lambda: (task.state, task.info))
+        except redis.RedisError as error:
+            logging.warning(f'task status fetch error: {error}')
+            return
+        task_listeners = self.listeners.get(task_id, set())
+        if listeners is not None:
+            task_listeners = task_listeners & listeners
+        for listener in tuple(task_listeners):
+            listener.push(task_id, state, info, initial=True)
+            if state in states.READY_STATES and task_id not in listener.pushed:
+                self.unsubscribe(listener, task_id)
+
+    async def subscribe(self, listener: TaskListener, task_id: str) -> None:
+        """
+            Subscribe listener to task
+            :param listener: Listener
+            :type listener: TaskListener
+            :param task_id: Task ID
+            :type task_id: str
+            :return: None
+        """
+        self.start()
+        listener.tasks.add(task_id)
+        if task_id in self.listeners:
+            self.listeners[task_id].add(listener)
+            await self.fetch(task_id, {listener})
+        else:
+            self.listeners[task_id] = {listener}
+            self.commands.put(('subscribe', task_id))
+
+    def unsubscribe(self, listener: TaskListener, task_id: str) -> None:
+        """
+            Unsubscribe listener from task
+            :param listener: Listener
+            :type listener: TaskListener
+            :param task_id: Task ID
+            :type task_id: str
+            :return: None
+        """
+        listener.tasks.discard(task_id)
+        listener.pushed.discard(task_id)
+        listeners = self.listeners.get(task_id)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                del self.listeners[task_id]
+                self.commands.put(('unsubscribe', task_id))
+
+    async def receive(self, websocket: WebSocket, listener: TaskListener) -> None:
+        """
+            Receive task IDs from client
+            :param websocket: Websocket
+            :type websocket: WebSocket
+            :param listener: Listener
+            :type listener: TaskListener
+            :return: None
+        """
+        while True:
+            task_id = (await websocket.receive_text()).strip()
+            if not task_id or task_id in listener.tasks:
+                continue
+            if len(listener.tasks) >= TASK_STATUS_MAX_TASKS:
+                await websocket.send_json({'task_id': task_id, 'detail': 'Too many tasks'})
+                continue
+            await self.subscribe(listener, task_id)
+
+    async def send(self, websocket: WebSocket, listener: TaskListener) -> None:
+        """
+            Send task states to client (heartbeat when idle)
+            :param websocket: Websocket
+            :type websocket: WebSocket
+            :param listener: Listener
+            :type listener: TaskListener
+            :return: None
+        """
+        while True:
+            payloads = await listener.get(self.heartbeat)
+            if not payloads:
+                await websocket.send_json({'state': 'HEARTBEAT'})
+            for payload in payloads:
+                await websocket.send_json(payload)
+
+    async def stream(self, websocket: WebSocket) -> None:
+        """
+            Stream task states to websocket until client disconnects
+            :param websocket: Websocket
+            :type websocket: WebSocket
+            :return: None
+        """
+        listener = TaskListener()
+        workers = [
+            asyncio.ensure_future(self.receive(websocket, listener)),
+            asyncio.ensure_future(self.send(websocket, listener)),
+        ]
+        try:
+            done, _ = await asyncio.wait(workers, return_when=asyncio.FIRST_COMPLETED)
+            for worker in done:
+                error = worker.exception()
+                if error is not None and not isinstance(error, WebSocketDisconnect):
+                    logging.warning(f'task status websocket error: {error!r}')
+        finally:
+            for worker in workers:
+                worker.cancel()
+            for task_id in tuple(listener.tasks):
+                self.unsubscribe(listener, task_id)
+
+
+task_events = TaskEvents()
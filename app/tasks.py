@@ -1,9 +1,11 @@
+import gzip
 import json
-import time
-from typing import Dict, Any
+from operator import itemgetter
+from typing import Dict, Any, Optional
 
 import emails
 from emails.template import JinjaTemplate
+import orjson
 
 import logging
 
@@ -11,98 +13,415 @@ from app.config import (
     EMAILS_ENABLED,
     EMAILS_FROM_EMAIL,
     EMAILS_FROM_NAME,
-    SMTP_TLS,
-    SMTP_USER,
-    SMTP_PORT,
-    SMTP_HOST,
-    SMTP_PASSWORD,
     TESTS,
     MEDIA_ROOT,
+    TRENDS_REFRESH_INTERVAL,
+    FEED_SIZE,
+    FEED_FANOUT_MAX_FOLLOWERS,
+    EXPORT_CHUNK_SIZE,
+    EMAIL_BATCH_INTERVAL,
+    EMAIL_BATCH_SIZE,
+    PROJECT_NAME,
+    COMMENT_DIGEST_WINDOW,
+    COMMENT_DIGEST_FLUSH_INTERVAL,
 )
 
 import os
 
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+from redis.exceptions import LockError
+from sqlalchemy import text, select, literal, func, true
+from sqlalchemy.dialects.postgresql import insert
 
+from app.db import sync_engine
+from app.email_templates import email_templates
 from app.files import remove_file
+from app.mail import smtp_pool, email_queue, comment_digest, UNAVAILABLE_ERRORS
 
 celery = Celery(__name__)
 celery.conf.broker_url = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379")
 celery.conf.result_backend = os.environ.get("CELERY_RESULT_BACKEND", "redis://localhost:6379")
+celery.conf.beat_schedule = {
+    'refresh-trends': {
+        'task': 'refresh_trends',
+        'schedule': TRENDS_REFRESH_INTERVAL,
+    },
+}
+if EMAIL_BATCH_INTERVAL > 0:
+    celery.conf.beat_schedule['flush-emails'] = {
+        'task': 'flush_emails',
+        'schedule': EMAIL_BATCH_INTERVAL,
+    }
+if COMMENT_DIGEST_WINDOW > 0:
+    celery.conf.beat_schedule['flush-comment-digests'] = {
+        'task': 'flush_comment_digests',
+        'schedule': COMMENT_DIGEST_FLUSH_INTERVAL,
+    }
 
 password_reset_jwt_subject = 'preset'
 
 
+def build_message(
+        email_to: str,
+        subject: str = '',
+        template: str = '',
+        environment=None,
+        subject_template: Optional[str] = None,
+        html_template: Optional[str] = None,
+) -> emails.Message:
+    """
+        Build email
+        :param email_to: Email to user
+        :type email_to: str
+        :param subject: Subject
+        :type subject: str
+        :param template: Html body template key
+        :type template: str
+        :param environment: Environment
+        :type environment: dict
+        :param subject_template: Subject template (payload of previous release)
+        :type subject_template: str
+        :param html_template: Html body template (payload of previous release)
+        :type html_template: str
+        :return: Message
+        :rtype: Message
+    """
+    # Messages queued by previous release carry templates instead of template key
+    # (positional args of send_email task or subject_template/html_template of email queue), remove in next release
+    if subject_template is not None or html_template is not None or not email_templates.exists(template):
+        message = emails.Message(
+            subject=JinjaTemplate(subject if subject_template is None else subject_template),
+            html=JinjaTemplate(template if html_template is None else html_template),
+            mail_from=(EMAILS_FROM_NAME, EMAILS_FROM_EMAIL),
+            mail_to=email_to,
+        )
+        message.render(**(environment or {}))
+        return message
+
+    return emails.Message(
+        subject=subject,
+        html=email_templates.render(template, environment or {}),
+        mail_from=(EMAILS_FROM_NAME, EMAILS_FROM_EMAIL),
+        mail_to=email_to,
+    )
+
+
 @celery.task(name='send_email')
 def send_email(
         email_to: str,
-        subject_template: str = '',
-        html_template: str = '',
+        subject: str = '',
+        template: str = '',
         environment=None,
         attach: bool = False,
         file_name: str = '',
+        subject_template: Optional[str] = None,
+        html_template: Optional[str] = None,
 ) -> None:
     """
-        Send email
+        Send email (over pooled SMTP connection of worker)
         :param email_to: Email to user
         :type email_to: str
-        :param subject_template: Subject template
-        :type subject_template: str
-        :param html_template: Html body template
-        :type html_template: str
+        :param subject: Subject
+        :type subject: str
+        :param template: Html body template key
+        :type template: str
         :param environment: Environment
         :type environment: dict
         :param attach: Attachments
         :type attach: bool
         :param file_name: File name
         :type file_name: str
+        :param subject_template: Subject template (message of previous release)
+        :type subject_template: str
+        :param html_template: Html body template (message of previous release)
+        :type html_template: str
         :return: None
     """
-    if environment is None:
-        environment = {}
-
     assert EMAILS_ENABLED, 'no provided configuration for email variables'
-    message = emails.Message(
-        subject=JinjaTemplate(subject_template),
-        html=JinjaTemplate(html_template),
-        mail_from=(EMAILS_FROM_NAME, EMAILS_FROM_EMAIL),
-    )
-    smtp_options = {'host': SMTP_HOST, 'port': SMTP_PORT}
-    if SMTP_TLS:
-        smtp_options['tls'] = True
-    if SMTP_USER:
-        smtp_options['user'] = SMTP_USER
-    if SMTP_PASSWORD:
-        smtp_options['password'] = SMTP_PASSWORD
+    message = build_message(email_to, subject, template, environment, subject_template, html_template)
     if not TESTS:
         if attach and file_name:
-            message.attach(data=open(file_name), filename=file_name.split('/')[-1])
+            with open(file_name, 'rb') as file:
+                message.attach(data=file.read(), filename=file_name.split('/')[-1])
             remove_file(file_name)
 
-        response = message.send(to=email_to, render=environment, smtp=smtp_options)
-        logging.info(f'send email result: {response}')
+        refused = smtp_pool.send(EMAILS_FROM_EMAIL, [email_to], message.as_string().encode())
+        logging.info(f'send email to {email_to}, refused: {refused}')
+
+
+@celery.task(name='flush_emails')
+def flush_emails() -> int:
+    """
+        Send queued emails in batches over pooled SMTP connection
+        :return: Sent count
+        :rtype: int
+    """
+    lock = email_queue.lock()
+    if not lock.acquire():
+        # Previous flush is still running
+        return 0
+    try:
+        email_queue.recover()
+        sent = 0
+        while True:
+            queued = email_queue.take(EMAIL_BATCH_SIZE)
+            # Same recipient emails are sent one after another, duplicates once
+            unique = {json.dumps(email, sort_keys=True): email for email in queued}
+            batch = sorted(unique.values(), key=itemgetter('email_to'))
+            for index, email in enumerate(batch):
+                try:
+                    message = build_message(**email).as_string().encode()
+                    smtp_pool.send(EMAILS_FROM_EMAIL, [email['email_to']], message)
+                except UNAVAILABLE_ERRORS as error:
+                    # Server is unavailable, rest of batch is retried on next flush
+                    email_queue.ack(*batch[index:])
+                    logging.warning(f'flush emails error: {error}')
+                    return sent
+                except Exception as error:
+                    logging.warning(f'send email to {email["email_to"]} error: {error}')
+                    continue
+                sent += 1
+            email_queue.ack()
+            if len(queued) < EMAIL_BATCH_SIZE:
+                return sent
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+@celery.task(name='flush_comment_digests')
+def flush_comment_digests() -> int:
+    """
+        Send due new comment digests (one email per recipient and window)
+        :return: Sent count
+        :rtype: int
+    """
+    lock = comment_digest.lock()
+    if not lock.acquire():
+        # Previous flush is still running
+        return 0
+    try:
+        sent = 0
+        while True:
+            users = comment_digest.due(EMAIL_BATCH_SIZE)
+            messages = []
+            counts = []
+            for user_id in users:
+                email_to, count, items = comment_digest.read(user_id)
+                counts.append((user_id, count))
+                if not email_to or not items:
+                    continue
+                if count == 1:
+                    messages.append({
+                        'email_to': email_to,
+                        'subject': f'{PROJECT_NAME} - New comment',
+                        'template': 'new_comment',
+                        'environment': items[0],
+                    })
+                else:
+                    messages.append({
+                        'email_to': email_to,
+                        'subject': f'{PROJECT_NAME} - {count} new comments',
+                        'template': 'comment_digest',
+                        'environment': {
+                            'project_name': PROJECT_NAME,
+                            'author': items[-1]['author'],
+                            'count': count,
+                            'comments': items,
+                        },
+                    })
+
+            if EMAIL_BATCH_INTERVAL > 0:
+                email_queue.push(*messages)
+            else:
+                for message in messages:
+                    send_email.delay(**message)
+            # Buffers are removed after digests are queued, digests of interrupted flush are sent again
+            for user_id, count in counts:
+                comment_digest.ack(user_id, count)
+            sent += len(messages)
+            if len(users) < EMAIL_BATCH_SIZE:
+                return sent
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+@worker_process_init.connect
+def load_email_templates(**kwargs) -> None:
+    email_templates.load()
+
+
+@worker_process_shutdown.connect
+def close_smtp_pool(**kwargs) -> None:
+    smtp_pool.close()
+
+
+def export_queries(user_id: int) -> Dict[str, Any]:
+    """
+        Export queries by section
+        :param user_id: User ID
+        :type user_id: int
+        :return: Queries
+        :rtype: dict
+    """
+    from app.comments.models import Comment
+    from app.videos.models import Video, History
+
+    video_columns = (
+        Video.id,
+        Video.title,
+        Video.description,
+        Video.video_file,
+        Video.preview_file,
+        Video.created_at,
+        Video.views,
+        Video.likes_count,
+        Video.dislikes_count,
+        Video.category_id,
+    )
+    return {
+        'video': select(*video_columns).filter(Video.user_id == user_id).order_by(Video.id),
+        'history': select(History.id.label('history_id'), *video_columns, Video.user_id).join(
+            Video, History.video_id == Video.id,
+        ).filter(History.user_id == user_id).order_by(History.id.desc()),
+        'comment': select(Comment.id, Comment.text, Comment.created_at, Comment.video_id).filter(
+            Comment.user_id == user_id,
+        ).order_by(Comment.id),
+    }
 
 
 @celery.task(name='export_data', bind=True)
-def export_data(self, data) -> Dict[str, Any]:
+def export_data(self, user_id: Optional[int] = None, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-        Export data
+        Export user data into gzipped NDJSON file (rows are streamed in chunks) and email it
         :param self: Task
-        :param data: Data
+        :param user_id: User ID
+        :type user_id: int
+        :param data: Exported user data (task of previous release)
         :type data: dict
         :return: Result
         :rtype: dict
     """
+    from app.auth.models import User
     from app.auth.send_emails import send_export_data
 
-    file_name = MEDIA_ROOT + data['username'] + '.json'
-    with open(file_name, 'w') as file:
-        json.dump(data, file)
-    total = 10
-    i = 0
-    for video in range(total):
-        i += 1
-        self.update_state(state='PROGRESS', meta={'progress': 100 * i // total})
-        time.sleep(1)
-    send_export_data(data['email'], file_name)
-    return {'progress': 100, 'result': data}
+    # Tasks queued by previous release carry exported data, remove in next release
+    if data is not None:
+        user_id = data['id']
+
+    queries = export_queries(user_id)
+    file_name = f'{MEDIA_ROOT}export-{user_id}-{self.request.id}.ndjson.gz'
+    # Counts and rows are read from one snapshot
+    with sync_engine.execution_options(isolation_level='REPEATABLE READ').begin() as conn:
+        user = conn.execute(
+            select(
+                User.id, User.username, User.email, User.avatar, User.about, User.is_active, User.two_auth,
+            ).filter(User.id == user_id)
+        ).first()
+        if user is None:
+            return {'progress': 100, 'rows': 0, 'total': 0}
+
+        total = sum(conn.execute(select(*(
+            select(func.count()).select_from(query.order_by(None).subquery()).scalar_subquery()
+            for query in queries.values()
+        ))).one())
+        rows = 0
+        progress = 0
+        self.update_state(state='PROGRESS', meta={'progress': progress, 'rows': rows, 'total': total})
+        try:
+            with gzip.open(file_name, 'wb') as file:
+                file.write(orjson.dumps({'type': 'user', **user._mapping}) + b'\n')
+                for section, query in queries.items():
+                    result = conn.execute(
+                        query.execution_options(stream_results=True, max_row_buffer=EXPORT_CHUNK_SIZE),
+                    )
+                    for chunk in result.partitions(EXPORT_CHUNK_SIZE):
+                        file.writelines(orjson.dumps({'type': section, **row._mapping}) + b'\n' for row in chunk)
+                        rows += len(chunk)
+                        if 100 * rows // total > progress:
+                            progress = 100 * rows // total
+                            self.update_state(
+                                state='PROGRESS', meta={'progress': min(progress, 99), 'rows': rows, 'total': total},
+                            )
+        except Exception:
+            remove_file(file_name)
+            raise
+
+    send_export_data(user.email, file_name)
+    return {'progress': 100, 'rows': rows, 'total': total}
+
+
+@celery.task(name='refresh_trends')
+def refresh_trends() -> None:
+    """
+        Refresh trends snapshot
+        :return: None
+    """
+    with sync_engine.begin() as conn:
+        conn.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY trends'))
+
+
+def push_to_feeds(conn, user_id: int, videos) -> None:
+    """
+        Push channel videos to feeds of its followers (small channels only, large are pulled on read)
+        :param conn: Connection
+        :param user_id: Channel ID
+        :type user_id: int
+        :param videos: Video IDs (select of one column)
+        :return: None
+    """
+    from app.auth.models import User, Subscriptions
+    from app.videos.models import FeedItem, feed_trim_query
+
+    subscribers = conn.execute(select(User.subscribers_count).filter(User.id == user_id)).scalar()
+    if not subscribers or subscribers > FEED_FANOUT_MAX_FOLLOWERS:
+        return
+
+    followers = select(Subscriptions.c.subscriber_id).filter(Subscriptions.c.subscription_id == user_id)
+    videos = videos.subquery()
+    conn.execute(
+        insert(FeedItem.__table__).from_select(
+            ['user_id', 'video_id'],
+            select(Subscriptions.c.subscriber_id, list(videos.c)[0]).select_from(
+                Subscriptions.join(videos, true()),
+            ).filter(Subscriptions.c.subscription_id == user_id),
+        ).on_conflict_do_nothing()
+    )
+    conn.execute(feed_trim_query(followers, FEED_SIZE))
+
+
+@celery.task(name='fan_out_video')
+def fan_out_video(video_id: int, user_id: int) -> None:
+    """
+        Push video to feeds of channel followers
+        :param video_id: Video ID
+        :type video_id: int
+        :param user_id: Channel ID
+        :type user_id: int
+        :return: None
+    """
+    with sync_engine.begin() as conn:
+        push_to_feeds(conn, user_id, select(literal(video_id)))
+
+
+@celery.task(name='backfill_feeds')
+def backfill_feeds(user_id: int) -> None:
+    """
+        Push latest channel videos to feeds of its followers
+        (channel dropped below fan-out threshold, videos posted while it was pulled on read are not in feeds)
+        :param user_id: Channel ID
+        :type user_id: int
+        :return: None
+    """
+    from app.videos.models import Video
+
+    with sync_engine.begin() as conn:
+        push_to_feeds(
+            conn, user_id, select(Video.id).filter(Video.user_id == user_id).order_by(Video.id.desc()).limit(FEED_SIZE),
+        )
@@ -1,11 +1,14 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, status, Form, UploadFile, File, Depends, Query, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import ORJSONResponse
 
+from app.auth.cache import channel_cache
 from app.auth.models import User
 from app.auth.permission import is_active, is_superuser
-from app.db import async_session
+from app.config import SEARCH_LIMIT
+from app.db import async_session, read_session
+from app.responses import RangedFileResponse
 from app.schemas import Message
 from app.videos import service
 from app.videos.schemas import GetVideo, CreateVideo, VideoPaginate, CreateVote, VideoUpdate
@@ -16,29 +19,29 @@ videos_router = APIRouter()
 @videos_router.get(
     '/trends',
     status_code=status.HTTP_200_OK,
-    response_model=List[GetVideo],
+    responses={200: {'model': List[GetVideo]}},
     description='Trends',
     response_description='Trends',
     name='Trends',
 )
 async def trends():
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
-            return await service.trends(session)
+            return ORJSONResponse(await service.trends(session))
 
 
 @videos_router.get(
     '/search',
     status_code=status.HTTP_200_OK,
-    response_model=List[GetVideo],
+    responses={200: {'model': List[GetVideo]}},
     description='Search videos',
     response_description='Search videos',
     name='Search videos',
 )
-async def search_videos(q: str):
-    async with async_session() as session:
+async def search_videos(q: str, limit: int = SEARCH_LIMIT, skip: int = 0):
+    async with read_session() as session:
         async with session.begin():
-            return await service.search_videos(session, q)
+            return ORJSONResponse(await service.search_videos(session, q, limit, skip))
 
 
 @videos_router.post(
@@ -60,21 +63,24 @@ async def create_video(
     async with async_session() as session:
         async with session.begin():
             schema: CreateVideo = CreateVideo(title=title, description=description, category_id=category_id)
-            return await service.create_video(session, schema, video_file, preview_file, user)
+            video = await service.create_video(session, schema, video_file, preview_file, user)
+        await channel_cache.invalidate_committed(session)
+    service.fan_out(video['id'], user.id)
+    return video
 
 
 @videos_router.get(
     '/',
     status_code=status.HTTP_200_OK,
-    response_model=VideoPaginate,
+    responses={200: {'model': VideoPaginate}},
     description='Get all videos',
     response_description='Get all videos',
     name='Get videos',
 )
-async def get_all_videos(page: int = Query(1, gt=0)):
-    async with async_session() as session:
+async def get_all_videos(page: int = Query(1, gt=0), cursor: Optional[str] = None):
+    async with read_session() as session:
         async with session.begin():
-            return await service.get_all_videos(db=session, page=page)
+            return ORJSONResponse(await service.get_all_videos(db=session, page=page, cursor=cursor))
 
 
 @videos_router.get(
@@ -86,7 +92,7 @@ async def get_all_videos(page: int = Query(1, gt=0)):
     name='Get video',
 )
 async def get_video(pk: int):
-    async with async_session() as session:
+    async with read_session() as session:
         async with session.begin():
             return await service.get_video(session, pk)
 
@@ -103,33 +109,23 @@ async def get_video(pk: int):
 async def delete_video(pk: int):
     async with async_session() as session:
         async with session.begin():
-            return await service.delete_video(session, pk)
+            response = await service.delete_video(session, pk)
+        await channel_cache.invalidate_committed(session)
+    return response
 
 
 @videos_router.get(
     '/video/{pk}',
-    response_class=StreamingResponse,
+    response_class=RangedFileResponse,
     status_code=status.HTTP_206_PARTIAL_CONTENT,
     description='Streaming response video',
     response_description='Streaming response video',
     name='Video streaming',
 )
-async def get_streaming_video(request: Request, pk: int) -> StreamingResponse:
+async def get_streaming_video(request: Request, pk: int) -> RangedFileResponse:
     async with async_session() as session:
         async with session.begin():
-            file, status_code, content_length, headers = await service.open_file(session, request, pk)
-            response = StreamingResponse(
-                file,
-                media_type='video/mp4',
-                status_code=status_code,
-            )
-
-            response.headers.update({
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(content_length),
-                **headers,
-            })
-            return response
+            return await service.open_file(session, request, pk)
 
 
 @videos_router.post(
@@ -157,7 +153,9 @@ async def create_vote(schema: CreateVote, user: User = Depends(is_active)):
 async def add_to_history(request: Request, pk: int):
     async with async_session() as session:
         async with session.begin():
-            return await service.add_to_history(session, request, pk)
+            response = await service.add_to_history(session, request, pk)
+        await channel_cache.invalidate_committed(session)
+    return response
 
 
 @videos_router.put(
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Dict, Optional, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.cache import channel_cache
+from app.config import VIEWS_FLUSH_INTERVAL
+from app.db import async_session
+from app.videos.crud import video_crud
+
+
+class ViewCounter:
+    """ Write-behind views counter, flushed in batches """
+
+    def __init__(self, interval: int) -> None:
+        self.interval = interval
+        self.buffer: Dict[int, int] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def add(self, db: AsyncSession, pk: int) -> None:
+        """
+            Add view
+            :param db: DB
+            :type db: AsyncSession
+            :param pk: Video ID
+            :type pk: int
+            :return: None
+        """
+        if self.interval <= 0:
+            await video_crud.add_views(db, {pk: 1})
+            await self.invalidate(db, [pk])
+            return
+        self.buffer[pk] = self.buffer.get(pk, 0) + 1
+
+    @staticmethod
+    async def invalidate(db: AsyncSession, pks: List[int]) -> None:
+        """
+            Mark cached counters of videos channels for invalidation after commit
+            :param db: DB
+            :type db: AsyncSession
+            :param pks: Video IDs
+            :type pks: list
+            :return: None
+        """
+        if not channel_cache.enabled:
+            return
+        for channel_id in await video_crud.channels(db, pks):
+            channel_cache.invalidate_on_commit(db, channel_id)
+
+    async def flush(self) -> None:
+        """
+            Flush buffered views to DB
+            :return: None
+        """
+        if not self.buffer:
+            return
+
+        views, self.buffer = self.buffer, {}
+        try:
+            async with async_session() as session:
+                async with session.begin():
+                    await video_crud.add_views(session, views)
+                    await self.invalidate(session, list(views))
+                await channel_cache.invalidate_committed(session)
+        except Exception as error:
+            for pk, count in views.items():
+                self.buffer[pk] = self.buffer.get(pk, 0) + count
+            logging.error(f'views flush error: {error}')
+
+    async def run(self) -> None:
+        """
+            Flush loop
+            :return: None
+        """
+        while True:
+            await asyncio.sleep(self.interval / 1000)
+            await self.flush()
+
+    def start(self) -> None:
+        """
+            Start flush loop
+            :return: None
+        """
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """
+            Stop flush loop and flush remaining views
+            :return: None
+        """
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.flush()
+
+
+view_counter = ViewCounter(VIEWS_FLUSH_INTERVAL)
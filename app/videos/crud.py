@@ -1,101 +1,305 @@
-from datetime import datetime, timedelta
+import re
 from typing import Optional, List, Dict, Tuple
 
-from sqlalchemy import select, or_
+from sqlalchemy import select, update, delete, exists, bindparam, func, literal, literal_column, union_all, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from sqlalchemy.sql.functions import count, sum
+from sqlalchemy.orm import selectinload, aliased
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.functions import count
 
 from app.CRUD import CRUD, ModelType
-from app.videos.models import Video, Votes, History
+from app.auth.models import User, Subscriptions
+from app.categories.models import Category
+from app.videos.models import Video, Votes, History, FeedItem, Trends, trends_query, feed_trim_query
 from app.videos.schemas import CreateVideo, VideoUpdate, CreateVote, CreateHistory
 
 
 class VideoCRUD(CRUD[Video, CreateVideo, VideoUpdate]):
     """ Video CRUD """
 
-    async def trends(self, db) -> List[ModelType]:
+    async def trends(self, db: AsyncSession, snapshot: bool = True, limit: int = 10) -> List[ModelType]:
         """
             Trends
             :param db: DB
             :type db: AsyncSession
+            :param snapshot: Read precomputed trends snapshot (else compute scores)
+            :type snapshot: bool
+            :param limit: Limit
+            :type limit: int
             :return: Models
             :rtype: list
         """
+        scores = Trends if snapshot else trends_query(limit).subquery()
         query = await db.execute(
             select(self.model).options(
-                selectinload(self.model.category), selectinload(self.model.user), selectinload(self.model.votes),
-            ).filter(self.model.created_at > datetime.utcnow() - timedelta(days=30)).order_by(
-                self.model.views.desc()
-            ).limit(10)
+                selectinload(self.model.category), selectinload(self.model.user),
+            ).join(scores, scores.c.video_id == self.model.id).order_by(
+                scores.c.score.desc(), self.model.id.desc(),
+            ).limit(limit)
         )
         return query.scalars().all()
 
-    async def search(self, db: AsyncSession, search: str) -> List[ModelType]:
+    async def filter(self, db: AsyncSession, **kwargs) -> List[ModelType]:
         """
-            Search
+            Filter
             :param db: DB
             :type db: AsyncSession
-            :param search: Search string (query)
-            :type search: str
+            :param kwargs: kwargs
             :return: Models
             :rtype: list
         """
+        query = await db.execute(select(self.model).options(
+            selectinload(self.model.category), selectinload(self.model.user),
+        ).order_by(self.model.id.desc()).filter_by(**kwargs))
+        return query.scalars()
+
+    async def get(self, db: AsyncSession, **kwargs) -> Optional[ModelType]:
+        """
+            Get
+            :param db: DB
+            :type db: AsyncSession
+            :param kwargs: kwargs
+            :return: Model
+            :rtype: ModelType
+        """
         query = await db.execute(
             select(self.model).options(
-                selectinload(self.model.category), selectinload(self.model.user), selectinload(self.model.votes),
-            ).filter(
-                or_(
-                    self.model.title.ilike(f'%{search}%'),
-                    self.model.description.ilike(f'%{search}%'),
-                )
-            ).order_by(self.model.id.desc())
+                selectinload(self.model.category), selectinload(self.model.user),
+            ).filter_by(**kwargs)
         )
-        return list(map(lambda x: x[0], query))
+        return query.scalars().first()
 
-    async def count_views_and_videos(self, db: AsyncSession, **kwargs) -> Tuple[int]:
+    async def get_many(self, db: AsyncSession, ids: List[int]) -> List[ModelType]:
         """
-            Count views and videos
+            Get many by IDs (order of IDs is preserved, missing are skipped)
             :param db: DB
             :type db: AsyncSession
-            :param kwargs: kwargs
-            :return: Count views and videos
-            :rtype: tuple
+            :param ids: IDs
+            :type ids: list
+            :return: Models
+            :rtype: list
         """
-        query = await db.execute(select(sum(self.model.views), count(self.model.id)).filter_by(**kwargs))
-        return list(query)[0]
+        query = await db.execute(
+            select(self.model).options(
+                selectinload(self.model.category), selectinload(self.model.user),
+            ).filter(self.model.id.in_(ids))
+        )
+        videos = {video.id: video for video in query.scalars()}
+        return [videos[pk] for pk in ids if pk in videos]
 
-    async def filter(self, db: AsyncSession, **kwargs) -> List[ModelType]:
+    async def subscriptions_videos(self, db: AsyncSession, user_id: int, limit: int = 20) -> List[ModelType]:
         """
-            Filter
+            Latest videos of every followed channel
             :param db: DB
             :type db: AsyncSession
-            :param kwargs: kwargs
+            :param user_id: Subscriber ID
+            :type user_id: int
+            :param limit: Limit per channel
+            :type limit: int
             :return: Models
             :rtype: list
         """
-        query = await db.execute(select(self.model).options(
-            selectinload(self.model.category), selectinload(self.model.user), selectinload(self.model.votes),
-        ).order_by(self.model.id.desc()).filter_by(**kwargs))
-        return query.scalars()
+        ranked = select(
+            self.model.id,
+            func.row_number().over(partition_by=self.model.user_id, order_by=self.model.id.desc()).label('position'),
+        ).join(
+            Subscriptions, Subscriptions.c.subscription_id == self.model.user_id,
+        ).filter(Subscriptions.c.subscriber_id == user_id).subquery()
+        query = await db.execute(
+            select(self.model).options(
+                selectinload(self.model.category), selectinload(self.model.user),
+            ).join(ranked, ranked.c.id == self.model.id).filter(ranked.c.position <= limit).order_by(
+                self.model.id.desc()
+            )
+        )
+        return query.scalars().all()
 
-    async def get(self, db: AsyncSession, **kwargs) -> Optional[ModelType]:
+    async def feed(
+            self,
+            db: AsyncSession,
+            user_id: int,
+            limit: int = 100,
+            pk: Optional[int] = None,
+            max_followers: int = 10000,
+    ) -> List[ModelType]:
         """
-            Get
+            Subscriptions feed (keyset by ID desc): precomputed feed items
+            plus videos of large channels pulled on read
             :param db: DB
             :type db: AsyncSession
-            :param kwargs: kwargs
-            :return: Model
-            :rtype: ModelType
+            :param user_id: Subscriber ID
+            :type user_id: int
+            :param limit: Limit
+            :type limit: int
+            :param pk: Cursor ID (exclusive)
+            :type pk: int
+            :param max_followers: Channels with more followers are pulled on read
+            :type max_followers: int
+            :return: Models
+            :rtype: list
         """
+        pushed = select(FeedItem.video_id.label('id')).filter(FeedItem.user_id == user_id)
+        large_channels = select(Subscriptions.c.subscription_id).join(
+            User, User.id == Subscriptions.c.subscription_id,
+        ).filter(Subscriptions.c.subscriber_id == user_id, User.subscribers_count > max_followers)
+        pulled = select(self.model.id).filter(self.model.user_id.in_(large_channels))
+        if pk is not None:
+            pushed = pushed.filter(FeedItem.video_id < pk)
+            pulled = pulled.filter(self.model.id < pk)
+        pushed = pushed.order_by(FeedItem.video_id.desc()).limit(limit).subquery()
+        pulled = pulled.order_by(self.model.id.desc()).limit(limit).subquery()
+        ids = union_all(select(pushed.c.id), select(pulled.c.id)).subquery()
+
         query = await db.execute(
             select(self.model).options(
-                selectinload(self.model.category), selectinload(self.model.user), selectinload(self.model.votes),
-            ).filter_by(**kwargs)
+                selectinload(self.model.category), selectinload(self.model.user),
+            ).filter(self.model.id.in_(select(ids.c.id))).order_by(self.model.id.desc()).limit(limit)
         )
-        return query.scalars().first()
+        return query.scalars().all()
+
+    async def add_to_feed(self, db: AsyncSession, user_id: int, channel_id: int, size: int) -> None:
+        """
+            Backfill subscriber feed with latest videos of channel
+            :param db: DB
+            :type db: AsyncSession
+            :param user_id: Subscriber ID
+            :type user_id: int
+            :param channel_id: Channel ID
+            :type channel_id: int
+            :param size: Feed size
+            :type size: int
+            :return: None
+        """
+        videos = select(literal(user_id), self.model.id).filter(
+            self.model.user_id == channel_id,
+        ).order_by(self.model.id.desc()).limit(size)
+        await db.execute(
+            insert(FeedItem).from_select(['user_id', 'video_id'], videos).on_conflict_do_nothing()
+        )
+        await db.execute(feed_trim_query(select(User.id).filter(User.id == user_id), size))
+
+    async def remove_from_feed(self, db: AsyncSession, user_id: int, channel_id: int) -> None:
+        """
+            Remove channel videos from subscriber feed
+            :param db: DB
+            :type db: AsyncSession
+            :param user_id: Subscriber ID
+            :type user_id: int
+            :param channel_id: Channel ID
+            :type channel_id: int
+            :return: None
+        """
+        await db.execute(
+            delete(FeedItem).filter(
+                FeedItem.user_id == user_id,
+                FeedItem.video_id.in_(select(self.model.id).filter(self.model.user_id == channel_id)),
+            ).execution_options(synchronize_session=False)
+        )
+
+    async def add_vote(self, db: AsyncSession, pk: int, vote: int) -> None:
+        """
+            Increment votes counter
+            :param db: DB
+            :type db: AsyncSession
+            :param pk: Video ID
+            :type pk: int
+            :param vote: Vote (0 - dislike; 1 - like)
+            :type vote: int
+            :return: None
+        """
+        if vote == 1:
+            values = {'likes_count': self.model.likes_count + 1}
+        else:
+            values = {'dislikes_count': self.model.dislikes_count + 1}
+        # Counter of loaded video is incremented in Python, no select after update
+        query = update(self.model).filter(self.model.id == pk).values(**values)
+        await db.execute(query.execution_options(synchronize_session='evaluate'))
 
-    async def all(self, db: AsyncSession,  skip: int = 0, limit: int = 100) -> List[ModelType]:
+    async def add_views(self, db: AsyncSession, views: Dict[int, int]) -> None:
+        """
+            Atomic increment views counters
+            :param db: DB
+            :type db: AsyncSession
+            :param views: Video ID -> new views
+            :type views: dict
+            :return: None
+        """
+        table = self.model.__table__
+        query = update(table).where(table.c.id == bindparam('pk')).values(views=table.c.views + bindparam('count'))
+        # Rows are locked in ID order, concurrent flushes do not deadlock
+        await db.execute(query, [{'pk': pk, 'count': count} for pk, count in sorted(views.items())])
+
+    async def channels(self, db: AsyncSession, pks: List[int]) -> List[int]:
+        """
+            Channels of videos
+            :param db: DB
+            :type db: AsyncSession
+            :param pks: Video IDs
+            :type pks: list
+            :return: Channel IDs
+            :rtype: list
+        """
+        query = await db.execute(select(self.model.user_id).filter(self.model.id.in_(pks)).distinct())
+        return query.scalars().all()
+
+    async def reconcile_votes(self, db: AsyncSession) -> None:
+        """
+            Recount votes counters from votes table
+            :param db: DB
+            :type db: AsyncSession
+            :return: None
+        """
+        likes = select(count(Votes.id)).filter(Votes.video_id == self.model.id, Votes.vote == 1).scalar_subquery()
+        dislikes = select(count(Votes.id)).filter(Votes.video_id == self.model.id, Votes.vote == 0).scalar_subquery()
+        query = update(self.model).values(likes_count=likes, dislikes_count=dislikes)
+        await db.execute(query.execution_options(synchronize_session=False))
+
+
+class VideoListCRUD(CRUD[Video, CreateVideo, VideoUpdate]):
+    """ Video listings CRUD: only columns of GetVideo in one joined select, rows instead of entities """
+
+    def query(self) -> Select:
+        """
+            Projected video, category and channel columns
+            :return: Select
+        """
+        return select(
+            self.model.id,
+            self.model.title,
+            self.model.description,
+            self.model.video_file,
+            self.model.preview_file,
+            self.model.created_at,
+            self.model.views,
+            self.model.likes_count,
+            self.model.dislikes_count,
+            Category.id.label('category_id'),
+            Category.name.label('category_name'),
+            User.id.label('user_id'),
+            User.username.label('user_username'),
+            User.avatar.label('user_avatar'),
+            User.about.label('user_about'),
+        ).join(Category, Category.id == self.model.category_id).join(User, User.id == self.model.user_id)
+
+    async def filter(self, db: AsyncSession, **kwargs) -> List[Row]:
+        """
+            Filter
+            :param db: DB
+            :type db: AsyncSession
+            :param kwargs: kwargs (video columns)
+            :return: Rows
+            :rtype: list
+        """
+        query = await db.execute(
+            self.query().filter(
+                *(getattr(self.model, key) == value for key, value in kwargs.items())
+            ).order_by(self.model.id.desc())
+        )
+        return query.all()
+
+    async def all(self, db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Row]:
         """
             All
             :param db: DB
@@ -104,28 +308,67 @@ class VideoCRUD(CRUD[Video, CreateVideo, VideoUpdate]):
             :type skip: int
             :param limit: end
             :type limit: int
-            :return: All ModelType
+            :return: Rows
             :rtype: list
         """
-        query = await db.execute(
-            select(self.model).options(
-                selectinload(self.model.category), selectinload(self.model.user), selectinload(self.model.votes),
-            ).order_by(self.model.id.desc()).offset(skip).limit(limit)
-        )
-        return query.scalars().all()
+        query = await db.execute(self.query().order_by(self.model.id.desc()).offset(skip).limit(limit))
+        return query.all()
 
-    def get_votes(self, video: Video) -> Dict[str, int]:
+    async def keyset(
+            self, db: AsyncSession, limit: int = 100, pk: Optional[int] = None, reverse: bool = False,
+    ) -> List[Row]:
         """
-            Get votes
-            :param video: Video
-            :type video: Video
-            :return: Votes
-            :rtype: dict
+            Keyset (cursor) page by ID desc
+            :param db: DB
+            :type db: AsyncSession
+            :param limit: Limit
+            :type limit: int
+            :param pk: Cursor ID (exclusive)
+            :type pk: int
+            :param reverse: Rows before cursor (newer) in ID asc order
+            :type reverse: bool
+            :return: Rows
+            :rtype: list
+        """
+        query = self.query()
+        if reverse:
+            query = query.order_by(self.model.id.asc())
+            if pk is not None:
+                query = query.filter(self.model.id > pk)
+        else:
+            query = query.order_by(self.model.id.desc())
+            if pk is not None:
+                query = query.filter(self.model.id < pk)
+        query = await db.execute(query.limit(limit))
+        return query.all()
+
+    async def search(self, db: AsyncSession, search: str, limit: int = 20, skip: int = 0) -> List[Row]:
         """
-        return {
-            'likes': len(list(filter(lambda vote: (vote.vote == 1), video.votes))),
-            'dislikes': len(list(filter(lambda vote: (vote.vote == 0), video.votes))),
-        }
+            Full-text search ranked by relevance (prefix matching on every word)
+            :param db: DB
+            :type db: AsyncSession
+            :param search: Search string (query)
+            :type search: str
+            :param limit: Limit
+            :type limit: int
+            :param skip: Skip
+            :type skip: int
+            :return: Rows
+            :rtype: list
+        """
+        words = re.findall(r'\w+', search)
+        if not words:
+            return []
+
+        ts_query = func.to_tsquery(literal_column("'simple'::regconfig"), ' & '.join(f'{word}:*' for word in words))
+        query = await db.execute(
+            self.query().filter(
+                self.model.search_vector.op('@@')(ts_query)
+            ).order_by(
+                func.ts_rank(self.model.search_vector, ts_query).desc(), self.model.id.desc(),
+            ).offset(skip).limit(limit)
+        )
+        return query.all()
 
 
 class VoteCRUD(CRUD[Votes, CreateVote, CreateVote]):
@@ -136,6 +379,25 @@ class VoteCRUD(CRUD[Votes, CreateVote, CreateVote]):
 class HistoryCRUD(CRUD[History, CreateHistory, CreateHistory]):
     """ History CRUD """
 
+    async def create_for_video(self, db: AsyncSession, user_id: int, video_id: int) -> bool:
+        """
+            Create history entry if video exists (single INSERT ... SELECT)
+            :param db: DB
+            :type db: AsyncSession
+            :param user_id: User ID
+            :type user_id: int
+            :param video_id: Video ID
+            :type video_id: int
+            :return: Created?
+            :rtype: bool
+        """
+        query = await db.execute(
+            insert(self.model).from_select(
+                ['user_id', 'video_id'], select(literal(user_id), Video.id).filter(Video.id == video_id),
+            ).returning(self.model.id)
+        )
+        return query.scalar() is not None
+
     async def filter(self, db: AsyncSession, **kwargs) -> List[ModelType]:
         """
             Filter
@@ -150,7 +412,49 @@ class HistoryCRUD(CRUD[History, CreateHistory, CreateHistory]):
         ).order_by(self.model.id.desc()).filter_by(**kwargs))
         return query.scalars()
 
+    async def history(
+            self,
+            db: AsyncSession,
+            user_id: int,
+            limit: Optional[int] = None,
+            pk: Optional[int] = None,
+            collapse: bool = False,
+    ) -> List[Tuple[Video, int]]:
+        """
+            Watched videos (keyset by history ID desc)
+            :param db: DB
+            :type db: AsyncSession
+            :param user_id: User ID
+            :type user_id: int
+            :param limit: Limit
+            :type limit: int
+            :param pk: Cursor history ID (exclusive)
+            :type pk: int
+            :param collapse: Only latest view of every video
+            :type collapse: bool
+            :return: (Video, history ID)
+            :rtype: list
+        """
+        query = select(Video, self.model.id).options(
+            selectinload(Video.category), selectinload(Video.user),
+        ).join(self.model, self.model.video_id == Video.id).filter(self.model.user_id == user_id)
+        if pk is not None:
+            query = query.filter(self.model.id < pk)
+        if collapse:
+            newer = aliased(self.model)
+            query = query.filter(
+                ~exists().where(
+                    and_(newer.user_id == user_id, newer.video_id == self.model.video_id, newer.id > self.model.id),
+                )
+            )
+        query = query.order_by(self.model.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        query = await db.execute(query)
+        return query.all()
+
 
 video_crud = VideoCRUD(Video)
+video_list_crud = VideoListCRUD(Video)
 vote_crud = VoteCRUD(Votes)
 history_crud = HistoryCRUD(History)
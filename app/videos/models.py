@@ -1,8 +1,30 @@
 from datetime import datetime
 from typing import ForwardRef, List
 
-from sqlalchemy import Column, String, DateTime, BigInteger, Integer, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    BigInteger,
+    Integer,
+    ForeignKey,
+    Computed,
+    Index,
+    Float,
+    MetaData,
+    Table,
+    UniqueConstraint,
+    delete,
+    DDL,
+    event,
+    select,
+    func,
+    literal_column,
+    true,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 
 from app.comments.models import Comment
 from app.db import Base, ModelMixin
@@ -13,15 +35,25 @@ VotesRef = ForwardRef('Votes')
 HistoryRef = ForwardRef('History')
 
 
+SEARCH_VECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+
 class Video(Base, ModelMixin):
     """ Video """
 
+    __table_args__ = (
+        Index('ix_video_search_vector', 'search_vector', postgresql_using='gin'),
+    )
+
     title: str = Column(String(50), nullable=False)
     description: str = Column(String(500), nullable=False)
     video_file: str = Column(String, nullable=False)
     preview_file: str = Column(String, nullable=False)
     created_at: datetime = Column(DateTime, default=datetime.utcnow)
     views: int = Column(BigInteger, default=0)
+    likes_count: int = Column(BigInteger, default=0, server_default='0', nullable=False)
+    dislikes_count: int = Column(BigInteger, default=0, server_default='0', nullable=False)
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR, persisted=True)))
 
     category_id: int = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'))
     user_id: int = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'))
@@ -70,3 +102,86 @@ class History(Base, ModelMixin):
 
     def __repr__(self):
         return f'History {self.id}'
+
+
+Index('ix_history_user_id_id', History.user_id, History.id.desc())
+
+
+class FeedItem(Base, ModelMixin):
+    """ Precomputed subscriptions feed item (fan-out on write) """
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'video_id', name='uq_feeditem_user_id_video_id'),
+    )
+
+    user_id: int = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    video_id: int = Column(Integer, ForeignKey('video.id', ondelete='CASCADE'), nullable=False)
+
+    def __str__(self):
+        return f'{self.id}'
+
+    def __repr__(self):
+        return f'Feed item {self.id}'
+
+
+def feed_trim_query(users, size: int):
+    """
+        Trim feeds query: keep only latest feed items of every user
+        (first removed item is found by bounded index scan of every user feed)
+        :param users: User IDs (select of one column)
+        :param size: Feed size
+        :type size: int
+        :return: Delete
+    """
+    feed = FeedItem.__table__
+    users = users.subquery()
+    user_id = list(users.c)[0]
+    removed = select(feed.c.video_id).filter(feed.c.user_id == user_id).order_by(
+        feed.c.video_id.desc(),
+    ).offset(size).limit(1).lateral()
+    bounds = select(user_id.label('user_id'), removed.c.video_id.label('video_id')).select_from(
+        users.join(removed, true()),
+    ).subquery()
+    return delete(feed).filter(feed.c.user_id == bounds.c.user_id, feed.c.video_id <= bounds.c.video_id)
+
+
+def trends_query(limit: int = 100):
+    """
+        Trends score query: time-decayed mix of views, votes and comments for last 30 days
+        :param limit: Limit
+        :type limit: int
+        :return: Select (video_id, score)
+    """
+    video = Video.__table__
+    comment = Comment.__table__
+    now = func.timezone('utc', func.now())
+    age_hours = func.date_part('epoch', now - video.c.created_at) / 3600
+    comments = select(func.count(comment.c.id)).filter(comment.c.video_id == video.c.id).scalar_subquery()
+    score = (
+        video.c.views + 10 * video.c.likes_count - 5 * video.c.dislikes_count + 5 * comments
+    ) / func.power(age_hours + 2, 1.5)
+    return select(video.c.id.label('video_id'), score.label('score')).filter(
+        video.c.created_at > now - literal_column("interval '30 days'")
+    ).order_by(literal_column('score').desc(), video.c.id.desc()).limit(limit)
+
+
+Trends = Table(
+    'trends',
+    MetaData(),
+    Column('video_id', Integer, primary_key=True),
+    Column('score', Float),
+)
+
+event.listen(
+    Base.metadata,
+    'after_create',
+    DDL(
+        'CREATE MATERIALIZED VIEW IF NOT EXISTS trends AS ' + str(
+            trends_query().compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+        ).replace('%', '%%')
+    ),
+)
+event.listen(
+    Base.metadata, 'after_create', DDL('CREATE UNIQUE INDEX IF NOT EXISTS ix_trends_video_id ON trends (video_id)'),
+)
+event.listen(Base.metadata, 'before_drop', DDL('DROP MATERIALIZED VIEW IF EXISTS trends'))
@@ -76,33 +76,9 @@ class CreateVote(BaseModel):
         return vote
 
 
-class UpdateVideoViews(BaseModel):
-    """ Update video """
-
-    views: int
-
-
 class CreateHistory(BaseModel):
     """ Create history """
 
     user_id: int
     video_id: int
 
-
-class ExportComment(BaseModel):
-    """ Export comments """
-
-    text: str
-    created_at: datetime
-    video_id: int
-
-
-class ExportData(UserPublic):
-    """ Export data """
-
-    is_active: bool
-    email: str
-    two_auth: bool
-    videos: List[GetVideo]
-    history: List[GetVideo]
-    comments: List[ExportComment]
@@ -1,19 +1,35 @@
+import os
 from datetime import datetime
-from pathlib import Path
-from typing import List, Dict, Any, Generator, IO
+from typing import List, Dict, Any
 
 from fastapi import UploadFile, HTTPException, status, Request
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
+from app.auth.cache import channel_cache
 from app.auth.models import User
 from app.auth.permission import is_auth_or_anonymous
 from app.categories.crud import category_crud
-from app.config import MEDIA_ROOT, SERVER_HOST, API_V1_URL
+from app.config import (
+    MEDIA_ROOT,
+    SERVER_HOST,
+    API_V1_URL,
+    MAX_VIDEO_SIZE,
+    MAX_IMAGE_SIZE,
+    SEARCH_LIMIT,
+    SEARCH_MAX_LIMIT,
+    TRENDS_SNAPSHOT,
+    TESTS,
+)
 from app.files import write_file, remove_file
+from app.responses import RangedFileResponse
+from app.serializers import serialize_video, serialize_video_row
 from app.service import paginate
-from app.videos.crud import video_crud, vote_crud, history_crud
-from app.videos.models import Video
-from app.videos.schemas import CreateVideo, CreateVote, UpdateVideoViews, CreateHistory, VideoUpdate
+from app.tasks import fan_out_video
+from app.videos.counters import view_counter
+from app.videos.crud import video_crud, video_list_crud, vote_crud, history_crud
+from app.videos.schemas import CreateVideo, CreateVote, VideoUpdate
 
 
 async def validation(db: AsyncSession, video_file: UploadFile, preview_file: UploadFile, category_id: int) -> None:
@@ -31,8 +47,7 @@ async def validation(db: AsyncSession, video_file: UploadFile, preview_file: Upl
         :raise HTTPException 400: Category not exist, video not in mp4 or preview not in jpeg/png
     """
 
-    if not await category_crud.exists(db, id=category_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found')
+    await category_crud.get_one(db, 'Category not found', id=category_id)
 
     if not video_file.content_type == 'video/mp4':
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video only format in mp4')
@@ -41,6 +56,30 @@ async def validation(db: AsyncSession, video_file: UploadFile, preview_file: Upl
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Preview only format in jpeg or png')
 
 
+async def write_video_files(
+        video_name: str, video_file: UploadFile, preview_name: str, preview_file: UploadFile,
+) -> None:
+    """
+        Write video and preview files
+        :param video_name: Video file name
+        :type video_name: str
+        :param video_file: Video
+        :type video_file: UploadFile
+        :param preview_name: Preview file name
+        :type preview_name: str
+        :param preview_file: Preview
+        :type preview_file: UploadFile
+        :return: None
+        :raise HTTPException 413: File is too large
+    """
+    await write_file(video_name, video_file, MAX_VIDEO_SIZE)
+    try:
+        await write_file(preview_name, preview_file, MAX_IMAGE_SIZE)
+    except BaseException:
+        remove_file(video_name)
+        raise
+
+
 async def create_video(
         db: AsyncSession, schema: CreateVideo, video_file: UploadFile, preview_file: UploadFile, user: User,
 ) -> Dict[str, Any]:
@@ -65,20 +104,31 @@ async def create_video(
     video_name = f'{MEDIA_ROOT}{datetime.utcnow().timestamp()}.{video_file.filename.split(".")[-1]}'
     preview_name = f'{MEDIA_ROOT}{datetime.utcnow().timestamp()}.{preview_file.filename.split(".")[-1]}'
 
-    await write_file(video_name, video_file)
-    await write_file(preview_name, preview_file)
+    await write_video_files(video_name, video_file, preview_name, preview_file)
     video = await video_crud.create(db, schema, video_file=video_name, preview_file=preview_name, user_id=user.id)
-    video = await video_crud.get(db, id=video.id)
-    return {
-        **video.__dict__,
-        'category': video.category.__dict__,
-        'user': video.user.__dict__,
-        'votes': video_crud.get_votes(video),
-    }
+    channel_cache.invalidate_on_commit(db, user.id)
+    return serialize_video(video)
+
 
+def fan_out(video_id: int, user_id: int) -> None:
+    """
+        Push new video to followers feeds (call after commit)
+        :param video_id: Video ID
+        :type video_id: int
+        :param user_id: Channel ID
+        :type user_id: int
+        :return: None
+    """
+    if not TESTS:
+        fan_out_video.delay(video_id, user_id)
 
-@paginate(crud=video_crud, url=f'{SERVER_HOST}{API_V1_URL}/videos/?page=')
-async def get_all_videos(*, db: AsyncSession, queryset: List[Video], page: int) -> List[Dict[str, Any]]:
+
+@paginate(
+    crud=video_list_crud,
+    url=f'{SERVER_HOST}{API_V1_URL}/videos/?page=',
+    cursor_url=f'{SERVER_HOST}{API_V1_URL}/videos/?cursor=',
+)
+async def get_all_videos(*, db: AsyncSession, queryset: List[Row], page: int) -> List[Dict[str, Any]]:
     """
         Get all videos
         :param db: DB
@@ -91,12 +141,7 @@ async def get_all_videos(*, db: AsyncSession, queryset: List[Video], page: int)
         :rtype: list
     """
     return [
-        {
-            **video.__dict__,
-            'user': video.user.__dict__,
-            'category': video.category.__dict__,
-            'votes': video_crud.get_votes(video),
-        } for video in queryset
+        serialize_video_row(video) for video in queryset
     ]
 
 
@@ -112,16 +157,8 @@ async def get_video(db: AsyncSession, pk: int) -> Dict[str, Any]:
         :raise HTTPException 400: Video not exist
     """
 
-    if not await video_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
-
-    video = await video_crud.get(db, id=pk)
-    return {
-        **video.__dict__,
-        'category': video.category.__dict__,
-        'user': video.user.__dict__,
-        'votes': video_crud.get_votes(video),
-    }
+    video = await video_crud.get_one(db, 'Video not found', id=pk)
+    return serialize_video(video)
 
 
 async def delete_video(db: AsyncSession, pk: int) -> Dict[str, str]:
@@ -136,56 +173,17 @@ async def delete_video(db: AsyncSession, pk: int) -> Dict[str, str]:
         :raise HTTPException 400: video not found
     """
 
-    if not await video_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
-
-    video = await video_crud.get(db, id=pk)
+    video = await video_crud.get_one(db, 'Video not found', id=pk)
 
     remove_file(video.video_file)
     remove_file(video.preview_file)
 
     await video_crud.remove(db, id=pk)
+    channel_cache.invalidate_on_commit(db, video.user_id)
     return {'msg': 'Video has been deleted'}
 
 
-def ranged(
-        file: IO[bytes],
-        start: int = 0,
-        end: int = None,
-        block_size: int = 8192,
-) -> Generator[bytes, None, None]:
-    """
-        Ranged video
-        :param file: video
-        :type file: IO
-        :param start: start
-        :type start: int
-        :param end: end
-        :type end: int
-        :param block_size: Block size
-        :type block_size: int
-        :return: Generator
-        :rtype: Generator
-    """
-
-    consumed = 0
-
-    file.seek(start)
-    while True:
-        data_length = min(block_size, end - start - consumed) if end else block_size
-        if data_length <= 0:
-            break
-        data = file.read(data_length)
-        if not data:
-            break
-        consumed += data_length
-        yield data
-
-    if hasattr(file, 'close'):
-        file.close()
-
-
-async def open_file(db: AsyncSession, request: Request, pk: int) -> tuple:
+async def open_file(db: AsyncSession, request: Request, pk: int) -> RangedFileResponse:
     """
         Open file
         :param db: DB
@@ -194,36 +192,20 @@ async def open_file(db: AsyncSession, request: Request, pk: int) -> tuple:
         :type request: Request
         :param pk: ID
         :type pk: int
-        :return: Tuple
-        :rtype: tuple
+        :return: Ranged file response
+        :rtype: RangedFileResponse
         :raise HTTPException 400: Video not found
+        :raise HTTPException 404: File not found
     """
 
-    if not await video_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
-
-    video_file = await video_crud.get(db, id=pk)
-    path = Path(video_file.video_file)
-    file = path.open('rb')
-    file_size = path.stat().st_size
-
-    content_length = file_size
-    status_code = status.HTTP_200_OK
-    headers = {}
-    content_range = request.headers.get('range')
+    video = await video_crud.get_one(db, 'Video not found', id=pk)
 
-    if content_range is not None:
-        content_range = content_range.strip().lower()
-        content_ranges = content_range.split('=')[-1]
-        range_start, range_end, *_ = map(str.strip, (content_ranges + '-').split('-'))
-        range_start = max(0, int(range_start)) if range_start else 0
-        range_end = min(file_size - 1, int(range_end)) if range_end else file_size - 1
-        content_length = (range_end - range_start) + 1
-        file = ranged(file, start=range_start, end=range_end + 1)
-        status_code = status.HTTP_206_PARTIAL_CONTENT
-        headers['Content-Range'] = f'bytes {range_start}-{range_end}/{file_size}'
+    try:
+        stat_result = await run_in_threadpool(os.stat, video.video_file)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='File not found')
 
-    return file, status_code, content_length, headers
+    return RangedFileResponse(video.video_file, stat_result, request.headers, media_type='video/mp4')
 
 
 async def create_vote(db: AsyncSession, schema: CreateVote, user: User) -> Dict[str, Any]:
@@ -240,14 +222,14 @@ async def create_vote(db: AsyncSession, schema: CreateVote, user: User) -> Dict[
         :raise HTTPException 400: Vote exist or video not found
     """
 
+    video = await video_crud.get_one(db, 'Video not found', id=schema.video_id)
+
     if await vote_crud.exists(db, video_id=schema.video_id, user_id=user.id):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Vote exist')
 
-    if not await video_crud.exists(db, id=schema.video_id):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
-
     await vote_crud.create(db, schema, user_id=user.id)
-    return await get_video(db, schema.video_id)
+    await video_crud.add_vote(db, schema.video_id, schema.vote)
+    return serialize_video(video)
 
 
 async def add_to_history(db: AsyncSession, request: Request, pk: int) -> Dict[str, str]:
@@ -264,16 +246,18 @@ async def add_to_history(db: AsyncSession, request: Request, pk: int) -> Dict[st
         :raise HTTPException 400: Video not found
     """
 
-    if not await video_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
+    user = await is_auth_or_anonymous(request)
 
-    video = await video_crud.get(db, id=pk)
-    await video_crud.update(db, pk, UpdateVideoViews(views=int(video.views) + 1))
+    if user:
+        found = await history_crud.create_for_video(db, user.id, pk)
+    else:
+        found = await video_crud.exists(db, id=pk)
+    if not found:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
 
-    user = await is_auth_or_anonymous(request)
+    await view_counter.add(db, pk)
 
     if user:
-        await history_crud.create(db, CreateHistory(user_id=user.id, video_id=pk))
         return {'msg': 'Add to history and new view'}
     return {'msg': 'New view'}
 
@@ -299,12 +283,10 @@ async def update_video(
         :rtype: dict
         :raise HTTPException 400: Video not exist
         :raise HTTPException 403: User not owner or superuser
+        :raise HTTPException 413: File is too large
     """
 
-    if not await video_crud.exists(db, id=pk):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Video not found')
-
-    video = await video_crud.get(db, id=pk)
+    video = await video_crud.get_one(db, 'Video not found', id=pk)
 
     if video.user_id != user.id and not user.is_superuser:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='You not published this video')
@@ -314,18 +296,12 @@ async def update_video(
     video_name = f'{MEDIA_ROOT}{datetime.utcnow().timestamp()}.{video_file.filename.split(".")[-1]}'
     preview_name = f'{MEDIA_ROOT}{datetime.utcnow().timestamp()}.{preview_file.filename.split(".")[-1]}'
 
+    await write_video_files(video_name, video_file, preview_name, preview_file)
+
     remove_file(video.video_file)
     remove_file(video.preview_file)
-
-    await write_file(video_name, video_file)
-    await write_file(preview_name, preview_file)
     video_updated = await video_crud.update(db, video.id, schema, video_file=video_name, preview_file=preview_name)
-    return {
-        **video_updated.__dict__,
-        'user': video_updated.user.__dict__,
-        'category': video_updated.category.__dict__,
-        'votes': video_crud.get_votes(video),
-    }
+    return serialize_video(video_updated)
 
 
 async def clear_history(db: AsyncSession, user: User) -> Dict[str, str]:
@@ -342,24 +318,24 @@ async def clear_history(db: AsyncSession, user: User) -> Dict[str, str]:
     return {'msg': 'History cleared'}
 
 
-async def search_videos(db: AsyncSession, q: str) -> List[Dict[str, Any]]:
+async def search_videos(db: AsyncSession, q: str, limit: int = SEARCH_LIMIT, skip: int = 0) -> List[Dict[str, Any]]:
     """
         Search videos
         :param db: DB
         :type db: AsyncSession
         :param q: Query
         :type q: str
+        :param limit: Limit
+        :type limit: int
+        :param skip: Skip
+        :type skip: int
         :return: Videos
         :rtype: str
     """
 
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
     return [
-        {
-            **video.__dict__,
-            'user': video.user.__dict__,
-            'category': video.category.__dict__,
-            'votes': video_crud.get_votes(video),
-        } for video in await video_crud.search(db, q)
+        serialize_video_row(video) for video in await video_list_crud.search(db, q, limit, max(0, skip))
     ]
 
 
@@ -373,10 +349,5 @@ async def trends(db: AsyncSession) -> List[Dict[str, Any]]:
     """
 
     return [
-        {
-            **video.__dict__,
-            'user': video.user.__dict__,
-            'category': video.category.__dict__,
-            'votes': video_crud.get_votes(video),
-        } for video in await video_crud.trends(db)
+        serialize_video(video) for video in await video_crud.trends(db, TRENDS_SNAPSHOT)
     ]
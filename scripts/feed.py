@@ -0,0 +1,34 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.auth.crud import user_crud
+from app.db import async_session, engine, Base
+
+
+async def feed():
+    """ Create feed tables and indexes, backfill subscribers counters """
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            text('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS subscribers_count BIGINT NOT NULL DEFAULT 0')
+        )
+        for column in ('subscriber_id', 'subscription_id'):
+            await conn.execute(
+                text(f'CREATE INDEX IF NOT EXISTS ix_subscriptions_{column} ON subscriptions ({column})')
+            )
+
+    async with async_session() as session:
+        async with session.begin():
+            await user_crud.reconcile_subscribers(session)
+
+    print('Feed tables have been created, subscribers counters have been reconciled')
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(feed())
+    finally:
+        print("Exit")
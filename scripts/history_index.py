@@ -0,0 +1,24 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.db import engine
+
+
+async def history_index():
+    """ Add (user_id, id DESC) index to existing history table """
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text('CREATE INDEX IF NOT EXISTS ix_history_user_id_id ON history (user_id, id DESC)')
+        )
+
+    print('History index has been created')
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(history_index())
+    finally:
+        print("Exit")
@@ -0,0 +1,31 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.db import async_session, engine, Base
+from app.videos.crud import video_crud
+
+
+async def reconcile_votes():
+    """ Backfill and reconcile likes/dislikes counters of videos """
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for column in ('likes_count', 'dislikes_count'):
+            await conn.execute(
+                text(f'ALTER TABLE video ADD COLUMN IF NOT EXISTS {column} BIGINT NOT NULL DEFAULT 0')
+            )
+
+    async with async_session() as session:
+        async with session.begin():
+            await video_crud.reconcile_votes(session)
+
+    print('Votes counters have been reconciled')
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(reconcile_votes())
+    finally:
+        print("Exit")
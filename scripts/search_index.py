@@ -0,0 +1,32 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app.db import engine, Base
+from app.videos.models import SEARCH_VECTOR
+
+
+async def search_index():
+    """ Add full-text search column and GIN index to existing videos table """
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(
+            text(
+                f'ALTER TABLE video ADD COLUMN IF NOT EXISTS search_vector tsvector '
+                f'GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED'
+            )
+        )
+        await conn.execute(
+            text('CREATE INDEX IF NOT EXISTS ix_video_search_vector ON video USING gin (search_vector)')
+        )
+
+    print('Search index has been created')
+
+
+if __name__ == '__main__':
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(search_index())
+    finally:
+        print("Exit")
@@ -1,14 +1,18 @@
 import os
 import shutil
 from unittest import TestCase
+from unittest.mock import patch
 
 import jwt
+import orjson
 from fastapi import HTTPException, UploadFile
 from fastapi.testclient import TestClient
 from pyotp import TOTP
-from sqlalchemy import update
+from sqlalchemy import update, select
 
+from app import tasks
 from app.app import app
+from app.auth import service
 from app.auth.api import (
     register,
     activate,
@@ -23,6 +27,7 @@ from app.auth.api import (
     change_data,
     upload_avatar,
     subscriptions,
+    feed,
     change_password,
     two_auth,
     toggle_2step_auth,
@@ -42,6 +47,7 @@ from app.auth.security import verify_password
 from app.auth.tokens import ALGORITHM, create_password_reset_token, create_token
 from app.config import API_V1_URL, SECRET_KEY, MEDIA_ROOT
 from app.db import engine, AsyncSession
+from app.videos.models import FeedItem
 from tests import create_all, drop_all, async_loop
 
 
@@ -163,7 +169,7 @@ class AuthTestCase(TestCase):
 
         user_1 = async_loop(user_crud.get(self.session, id=1))
 
-        response = async_loop(subscriptions(user_1))
+        response = orjson.loads(async_loop(subscriptions(user_1)).body)
         self.assertEqual(response, [])
 
         async_loop(self.session.execute(update(user_crud.model).filter_by(id=1).values(is_superuser=True)))
@@ -191,19 +197,113 @@ class AuthTestCase(TestCase):
         self.client.post(self.url + '/follow?to_id=2', headers=headers)
         self.client.post(self.url + '/follow?to_id=3', headers=headers)
 
-        response = async_loop(subscriptions(async_loop(user_crud.get(self.session, id=1))))
+        response = orjson.loads(async_loop(subscriptions(async_loop(user_crud.get(self.session, id=1)))).body)
         self.assertEqual(len(response), 2)
         self.assertEqual(response[0]['user']['id'], 3)
         self.assertEqual(len(response[0]['videos']), 0)
         self.assertEqual(response[1]['user']['id'], 2)
         self.assertEqual(len(response[1]['videos']), 1)
 
+        # Limit is clamped
+        response = self.client.get(self.url + '/followed?limit=-1', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[1]['videos']), 1)
+
         user_2 = async_loop(user_crud.get(self.session, id=2))
-        response = async_loop(subscriptions(user_2))
+        response = orjson.loads(async_loop(subscriptions(user_2)).body)
         self.assertEqual(len(response), 1)
         self.assertEqual(response[0]['user']['id'], 3)
         self.assertEqual(len(response[0]['videos']), 0)
 
+        response = orjson.loads(async_loop(feed(async_loop(user_crud.get(self.session, id=1)))).body)
+        self.assertEqual(len(response['results']), 1)
+        self.assertEqual(response['results'][0]['user']['id'], 2)
+        self.assertEqual(response['next'], None)
+
+        response = orjson.loads(async_loop(feed(user_2)).body)
+        self.assertEqual(response['results'], [])
+
+    def test_export_data(self):
+        self.client.post(self.url + '/register', json=self.data)
+
+        result = tasks.export_data.apply(kwargs={'user_id': 1}).get()
+        self.assertEqual(result, {'progress': 100, 'rows': 0, 'total': 0})
+
+        # Task queued by previous release
+        legacy = tasks.export_data.apply(kwargs={'data': {'id': 1, 'username': 'test', 'videos': []}}).get()
+        self.assertEqual(legacy, result)
+
+    def test_feed_fan_out(self):
+        for index in range(1, 4):
+            self.client.post(
+                self.url + '/register',
+                json={**self.data, 'username': f'test{index}', 'email': f'test{index}@example.com'},
+            )
+            verification = async_loop(verification_crud.get(self.session, user_id=index)).__dict__
+            self.client.post(self.url + '/activate', json={'uuid': verification['uuid']})
+        async_loop(self.session.execute(update(user_crud.model).filter_by(id=2).values(is_superuser=True)))
+        async_loop(self.session.commit())
+
+        def login(username: str) -> dict:
+            tokens = self.client.post(self.url + '/login', data={'username': username, 'password': 'test1234'})
+            return {'Authorization': f'Bearer {tokens.json()["access_token"]}'}
+
+        def upload() -> int:
+            with open('tests/image.png', 'rb') as preview:
+                with open('tests/test.mp4', 'rb') as video:
+                    response = self.client.post(
+                        API_V1_URL + '/videos/',
+                        headers=channel,
+                        data=self.video_data,
+                        files={
+                            'preview_file': ('image.png', preview, 'image/png'),
+                            'video_file': ('test.mp4', video, 'video/mp4'),
+                        }
+                    )
+            return response.json()['id']
+
+        def feed_items() -> list:
+            query = async_loop(self.session.execute(
+                select(FeedItem.video_id).filter(FeedItem.user_id == 1).order_by(FeedItem.video_id.desc())
+            ))
+            async_loop(self.session.commit())
+            return query.scalars().all()
+
+        channel = login('test2')
+        self.client.post(API_V1_URL + '/categories/', json={'name': 'FastAPI'}, headers=channel)
+
+        with patch.object(service, 'FEED_FANOUT_MAX_FOLLOWERS', 1), patch.object(service, 'FEED_SIZE', 2), \
+                patch.object(tasks, 'FEED_FANOUT_MAX_FOLLOWERS', 1), patch.object(tasks, 'FEED_SIZE', 2):
+            first = upload()
+
+            # Follow backfills latest channel videos
+            self.client.post(self.url + '/follow?to_id=2', headers=login('test1'))
+            self.assertEqual(feed_items(), [first])
+
+            # Small channel is pushed to feeds, feeds are trimmed
+            videos = [first]
+            for _ in range(3):
+                videos.append(upload())
+                tasks.fan_out_video(videos[-1], 2)
+            self.assertEqual(feed_items(), [videos[3], videos[2]])
+
+            # Large channel is pulled on read
+            self.client.post(self.url + '/follow?to_id=2', headers=login('test3'))
+            videos.append(upload())
+            tasks.fan_out_video(videos[-1], 2)
+            self.assertEqual(feed_items(), [videos[3], videos[2]])
+
+            response = self.client.get(self.url + '/feed', headers=login('test1'))
+            self.assertEqual([video['id'] for video in response.json()['results']], [videos[4], videos[3]])
+
+            # Videos posted while channel was pulled are backfilled when it is pushed again
+            self.client.post(self.url + '/unfollow?to_id=2', headers=login('test3'))
+            tasks.backfill_feeds(2)
+            self.assertEqual(feed_items(), [videos[4], videos[3]])
+
+            response = self.client.get(self.url + '/feed', headers=login('test1'))
+            self.assertEqual([video['id'] for video in response.json()['results']], [videos[4], videos[3]])
+
     def test_subscriptions_request(self):
         self.client.post(self.url + '/register', json=self.data)
         verification = async_loop(verification_crud.get(self.session, user_id=1)).__dict__
@@ -340,6 +440,7 @@ class AuthTestCase(TestCase):
         self.client.post(self.url + '/follow?to_id=2', headers=headers)
         response = self.client.get(self.url + '/channel?pk=2', headers=headers)
         self.assertEqual(response.json()['is_following'], 1)
+        self.assertEqual(response.json()['followers_count'], 1)
 
         self.client.post(API_V1_URL + '/videos/add-to-history?pk=1', headers=headers)
         self.client.post(API_V1_URL + '/videos/add-to-history?pk=1', headers=headers)
@@ -1106,7 +1207,8 @@ class AuthTestCase(TestCase):
 
         # Get data
         response = async_loop(get_data(user))
-        self.assertEqual(response, user.__dict__)
+        self.assertEqual(response, ChangeUserDataResponse(**self.data, avatar='', two_auth=False))
+        self.assertNotIn('password', response)
 
         # Put data
         response = async_loop(change_data(ChangeUserData(send_message=False, about='test'), user))
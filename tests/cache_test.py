@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.cache import RedisCache, TieredCache
+from app.config import EMAIL_QUEUE_REDIS_URL
+from app.db import engine
+from tests import async_loop
+
+
+class CacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.session = AsyncSession(engine)
+        self.tier = RedisCache(EMAIL_QUEUE_REDIS_URL, 60, 'tests:channel')
+        self.cache = TieredCache([self.tier], 'channel')
+
+    def tearDown(self) -> None:
+        async_loop(self.session.close())
+        self.tier.client.delete(self.tier.key(1), self.tier.key(2))
+
+    def test_invalidate_committed(self):
+        async_loop(self.cache.set(1, {'views': 1}))
+        async_loop(self.cache.set(2, {'views': 2}))
+
+        # Kept until transaction is committed
+        self.cache.invalidate_on_commit(self.session, 1)
+        self.assertEqual(async_loop(self.cache.get(1)), {'views': 1})
+
+        async_loop(self.cache.invalidate_committed(self.session))
+        self.assertEqual(async_loop(self.cache.get(1)), None)
+        self.assertEqual(async_loop(self.cache.get(2)), {'views': 2})
+        self.assertEqual(self.session.info, {})
+
+        # Disabled cache
+        disabled = TieredCache([], 'channel')
+        disabled.invalidate_on_commit(self.session, 2)
+        self.assertEqual(self.session.info, {})
@@ -2,6 +2,7 @@ import os
 import shutil
 from unittest import TestCase
 
+import orjson
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy import update
@@ -96,11 +97,11 @@ class CategoryTestCase(TestCase):
                     }
                 )
 
-        response = async_loop(get_videos_for_category(1))
+        response = orjson.loads(async_loop(get_videos_for_category(1)).body)
         self.assertEqual(len(response), 1)
         self.assertEqual(response[0]['id'], 1)
 
-        response = async_loop(get_videos_for_category(2))
+        response = orjson.loads(async_loop(get_videos_for_category(2)).body)
         self.assertEqual(len(response), 1)
         self.assertEqual(response[0]['id'], 2)
 
@@ -238,7 +239,7 @@ class CategoryTestCase(TestCase):
             async_loop(get_category(143))
 
         # Get all
-        response = async_loop(get_all_categories())
+        response = orjson.loads(async_loop(get_all_categories()).body)
         self.assertEqual(type(response), list)
         self.assertEqual(response[0]['id'], 1)
         self.assertEqual(response[0]['name'], self.data['name'])
@@ -258,3 +259,32 @@ class CategoryTestCase(TestCase):
 
         with self.assertRaises(HTTPException) as error:
             async_loop(delete_category(143))
+
+    def test_categories_bulk(self):
+        # Bulk create
+        categories = async_loop(category_crud.bulk_create(
+            self.session, [CreateCategory(name='FastAPI'), CreateCategory(name='Django')],
+        ))
+        self.assertEqual([category.id for category in categories], [1, 2])
+        self.assertEqual([category.name for category in categories], ['FastAPI', 'Django'])
+
+        # Bulk update
+        categories = async_loop(category_crud.bulk_update(self.session, [1, 2], UpdateCategory(name='Python')))
+        self.assertEqual(sorted(category.id for category in categories), [1, 2])
+        self.assertEqual({category.name for category in categories}, {'Python'})
+
+        # Bulk upsert
+        categories = async_loop(category_crud.bulk_upsert(
+            self.session, [{'id': 2, 'name': 'Django'}, {'id': 3, 'name': 'Flask'}], ['id'],
+        ))
+        self.assertEqual([(category.id, category.name) for category in categories], [(2, 'Django'), (3, 'Flask')])
+
+        # ID sequence is advanced past explicit IDs
+        categories = async_loop(category_crud.bulk_create(self.session, [CreateCategory(name='Starlette')]))
+        self.assertEqual([category.id for category in categories], [4])
+        async_loop(category_crud.bulk_remove(self.session, [4]))
+
+        # Bulk remove
+        async_loop(category_crud.bulk_remove(self.session, [1, 2]))
+        async_loop(self.session.commit())
+        self.assertEqual([category.id for category in async_loop(category_crud.all(self.session))], [3])
@@ -2,6 +2,7 @@ import os
 import shutil
 from unittest import TestCase
 
+import orjson
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy import update
@@ -87,7 +88,7 @@ class CommentTestCase(TestCase):
 
         # Create
 
-        response = async_loop(get_comments(1))
+        response = orjson.loads(async_loop(get_comments(1)).body)
         self.assertEqual(response, [])
         self.assertEqual(len(response), 0)
 
@@ -127,24 +128,24 @@ class CommentTestCase(TestCase):
         with self.assertRaises(HTTPException) as error:
             async_loop(get_comments(143))
 
-        response = async_loop(get_comments(1))
+        response = orjson.loads(async_loop(get_comments(1)).body)
         self.assertEqual(len(response), 2)
 
         self.assertEqual(len(async_loop(comment_crud.all(self.session))), 4)
 
         tree = response
         self.assertEqual(tree[0]['id'], 4)
-        self.assertEqual('children' in tree[0].keys(), False)
+        self.assertEqual(tree[0]['children'], None)
         self.assertEqual(tree[1]['id'], 1)
         self.assertEqual(len(tree[1]['children']), 1)
         self.assertEqual(tree[1]['children'][0]['id'], 2)
         self.assertEqual(len(tree[1]['children'][0]['children']), 1)
         self.assertEqual(tree[1]['children'][0]['children'][0]['id'], 3)
-        self.assertEqual('children' in tree[1]['children'][0]['children'][0].keys(), False)
+        self.assertEqual(tree[1]['children'][0]['children'][0]['children'], None)
 
         self.create_video()
 
-        response = async_loop(get_comments(2))
+        response = orjson.loads(async_loop(get_comments(2)).body)
         self.assertEqual(response, [])
         self.assertEqual(len(response), 0)
 
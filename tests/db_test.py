@@ -0,0 +1,118 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import text
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import db
+from app.db import ReplicaRouter, create_engine_async, read_primary, read_session
+from app.middleware import ReadYourWritesMiddleware, READ_PRIMARY_COOKIE, READ_PRIMARY_HEADER
+from tests import async_loop
+
+
+class ReplicaTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.replicas = [
+            create_engine_async('postgresql+asyncpg://postgres@127.0.0.1:1/video'),
+            create_engine_async('postgresql+asyncpg://postgres@127.0.0.1:2/video'),
+        ]
+        self.router = ReplicaRouter(self.replicas, 60)
+
+    def tearDown(self) -> None:
+        for replica in self.replicas:
+            async_loop(replica.dispose())
+
+    def test_router(self):
+        # Round-robin
+        self.assertEqual(
+            [self.router.choose() for _ in range(3)], [self.replicas[0], self.replicas[1], self.replicas[0]],
+        )
+
+        # Failover
+        self.router.mark_down(self.replicas[0], ConnectionRefusedError())
+        self.assertEqual([self.router.choose() for _ in range(2)], [self.replicas[1], self.replicas[1]])
+
+        self.router.mark_down(self.replicas[1], ConnectionRefusedError())
+        self.assertEqual(self.router.choose(), None)
+
+        # Retry after interval
+        self.router.down_until[0] = 0
+        self.assertEqual(self.router.choose(), self.replicas[0])
+
+        self.assertEqual(ReplicaRouter([], 60).choose(), None)
+
+    def test_read_session(self):
+        async def query() -> str:
+            async with read_session() as session:
+                async with session.begin():
+                    return (await session.execute(text('SELECT current_database()'))).scalar()
+
+        with patch.object(db, 'replica_router', self.router):
+            # Replicas are down, request fails over to next replica and primary
+            self.assertEqual(async_loop(query()), db.engine.url.database)
+            self.assertEqual(sorted(self.router.down_until), [0, 1])
+
+            # Down replicas are skipped
+            self.assertEqual(async_loop(query()), db.engine.url.database)
+
+            # Healthy replica (primary database on other URL)
+            replica = create_engine_async(db.engine.url)
+            self.replicas.append(replica)
+            self.router.engines = [replica]
+            self.router.down_until.clear()
+            self.assertEqual(async_loop(query()), db.engine.url.database)
+            self.assertEqual(self.router.down_until, {})
+
+            # Read-your-writes
+            self.router.engines = self.replicas[:2]
+            self.router.down_until.clear()
+            token = read_primary.set(True)
+            try:
+                self.assertEqual(async_loop(query()), db.engine.url.database)
+            finally:
+                read_primary.reset(token)
+
+
+class ReadYourWritesTestCase(TestCase):
+
+    def setUp(self) -> None:
+        async def endpoint(request: Request) -> JSONResponse:
+            status_code = 400 if request.query_params.get('fail') else 200
+            return JSONResponse({'read_primary': read_primary.get()}, status_code=status_code)
+
+        app = Starlette(routes=[Route('/', endpoint, methods=['GET', 'POST'])])
+        router = ReplicaRouter([create_engine_async('postgresql+asyncpg://postgres@127.0.0.1:1/video')], 60)
+        self.client = TestClient(ReadYourWritesMiddleware(app, 5, router))
+
+    def test_middleware(self):
+        response = self.client.get('/')
+        self.assertEqual(response.json(), {'read_primary': False})
+        self.assertEqual(READ_PRIMARY_COOKIE in response.cookies, False)
+
+        response = self.client.get('/', headers={READ_PRIMARY_HEADER: '1'})
+        self.assertEqual(response.json(), {'read_primary': True})
+
+        # Failed write
+        response = self.client.post('/?fail=1')
+        self.assertEqual(READ_PRIMARY_COOKIE in response.cookies, False)
+        self.assertEqual(self.client.get('/').json(), {'read_primary': False})
+
+        # Write, next reads of client go to primary
+        response = self.client.post('/')
+        self.assertEqual(READ_PRIMARY_COOKIE in response.cookies, True)
+        self.assertEqual(self.client.get('/').json(), {'read_primary': True})
+
+        # Sticky time is over
+        self.client.cookies.clear()
+        response = self.client.get('/', cookies={READ_PRIMARY_COOKIE: str(time.time() - 1)})
+        self.assertEqual(response.json(), {'read_primary': False})
+
+        # Replicas are not configured
+        client = TestClient(ReadYourWritesMiddleware(self.client.app.app, 5, ReplicaRouter([], 60)))
+        self.assertEqual(client.get('/', headers={READ_PRIMARY_HEADER: '1'}).json(), {'read_primary': False})
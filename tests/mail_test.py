@@ -0,0 +1,259 @@
+import smtplib
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from app import tasks, send_emails
+from app.config import EMAIL_QUEUE_REDIS_URL
+from app.mail import SMTPPool, SMTPUnavailable, EmailQueue, NotificationDigest
+from tests import async_loop
+
+
+class FakeSMTP:
+    """ SMTP client stub (records connections and sent messages) """
+
+    connections = []
+    login_error = None
+
+    def __init__(self, host, port, timeout=None) -> None:
+        self.sent = []
+        self.noops = 0
+        self.dropped = False
+        self.closed = False
+        FakeSMTP.connections.append(self)
+
+    def starttls(self, context=None):
+        return 220, b'Ready'
+
+    def login(self, user, password):
+        if FakeSMTP.login_error is not None:
+            raise FakeSMTP.login_error
+        return 235, b'Accepted'
+
+    def noop(self):
+        self.noops += 1
+        if self.dropped:
+            raise smtplib.SMTPServerDisconnected()
+        return 250, b'OK'
+
+    def sendmail(self, from_addr, to_addrs, message):
+        if self.dropped:
+            raise smtplib.SMTPServerDisconnected()
+        self.sent.append((from_addr, to_addrs, message))
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class MailTestCase(TestCase):
+
+    def setUp(self) -> None:
+        FakeSMTP.connections = []
+        FakeSMTP.login_error = None
+        self.smtp = patch.object(smtplib, 'SMTP', FakeSMTP)
+        self.smtp.start()
+        self.pool = SMTPPool('localhost', 25, user='user', password='password', keepalive=60)
+        self.queue = EmailQueue(EMAIL_QUEUE_REDIS_URL, key='tests:email:queue')
+        self.queue.client.delete(self.queue.key, self.queue.processing_key)
+        self.email = {'email_to': 'test@example.com', 'subject': 'Test', 'template': 'new_comment', 'environment': {}}
+
+    def tearDown(self) -> None:
+        self.smtp.stop()
+        self.queue.client.delete(self.queue.key, self.queue.processing_key, f'{self.queue.key}:lock')
+
+    def flush(self) -> int:
+        with patch.object(tasks, 'smtp_pool', self.pool), patch.object(tasks, 'email_queue', self.queue):
+            return tasks.flush_emails()
+
+    def test_pool(self):
+        # Reuse
+        self.pool.send('from@example.com', ['to@example.com'], b'1')
+        self.pool.send('from@example.com', ['to@example.com'], b'2')
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertEqual(len(FakeSMTP.connections[0].sent), 2)
+        self.assertEqual(FakeSMTP.connections[0].noops, 0)
+
+        # NOOP after keepalive
+        self.pool.keepalive = 0
+        self.pool.send('from@example.com', ['to@example.com'], b'3')
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertEqual(FakeSMTP.connections[0].noops, 1)
+
+        # Idle connection is lost
+        FakeSMTP.connections[0].dropped = True
+        self.pool.send('from@example.com', ['to@example.com'], b'4')
+        self.assertEqual(len(FakeSMTP.connections), 2)
+        self.assertEqual(FakeSMTP.connections[0].closed, True)
+        self.assertEqual(len(FakeSMTP.connections[1].sent), 1)
+
+        # Connection is lost while sending
+        self.pool.keepalive = 60
+        FakeSMTP.connections[1].dropped = True
+        self.pool.send('from@example.com', ['to@example.com'], b'5')
+        self.assertEqual(len(FakeSMTP.connections), 3)
+        self.assertEqual(FakeSMTP.connections[2].sent[0][2], b'5')
+
+        # Login failed
+        self.pool.close()
+        FakeSMTP.login_error = smtplib.SMTPAuthenticationError(535, b'Bad credentials')
+        with self.assertRaises(SMTPUnavailable):
+            self.pool.send('from@example.com', ['to@example.com'], b'6')
+        self.assertEqual(FakeSMTP.connections[-1].closed, True)
+
+    def test_flush_emails(self):
+        self.queue.push(
+            self.email,
+            self.email,
+            {**self.email, 'email_to': 'a@example.com'},
+            {**self.email, 'email_to': 'b@example.com'},
+        )
+
+        # Server unavailable, queue is kept
+        FakeSMTP.login_error = smtplib.SMTPAuthenticationError(535, b'Bad credentials')
+        self.assertEqual(self.flush(), 0)
+        self.assertEqual(self.queue.client.llen(self.queue.key), 3)
+        self.assertEqual(self.queue.client.llen(self.queue.processing_key), 0)
+
+        # Emails taken by interrupted flush are recovered
+        taken = self.queue.take(2)
+        self.assertEqual([email['email_to'] for email in taken], ['a@example.com', 'b@example.com'])
+        self.assertEqual(self.queue.client.llen(self.queue.processing_key), 2)
+
+        FakeSMTP.connections = []
+        FakeSMTP.login_error = None
+        self.assertEqual(self.flush(), 3)
+        self.assertEqual(self.queue.client.llen(self.queue.key), 0)
+        self.assertEqual(self.queue.client.llen(self.queue.processing_key), 0)
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertEqual(
+            [to_addrs for _, to_addrs, _ in FakeSMTP.connections[0].sent],
+            [['a@example.com'], ['b@example.com'], ['test@example.com']],
+        )
+
+        # Flush is running
+        lock = self.queue.lock()
+        lock.acquire()
+        self.queue.push(self.email)
+        self.assertEqual(self.flush(), 0)
+        lock.release()
+        self.assertEqual(self.flush(), 1)
+
+    def test_legacy_emails(self):
+        environment = {'project_name': 'Project', 'link': 'http://localhost'}
+
+        # Positional args of send_email task of previous release
+        message = tasks.build_message('test@example.com', '{{ project_name }} - Test', '<a>{{ link }}</a>', environment)
+        self.assertEqual((message.subject, message.html_body), ('Project - Test', '<a>http://localhost</a>'))
+
+        # Email queue payload of previous release
+        self.queue.push({
+            'email_to': 'test@example.com',
+            'subject_template': '{{ project_name }} - Test',
+            'html_template': '<a>{{ link }}</a>',
+            'environment': environment,
+        })
+        self.assertEqual(self.flush(), 1)
+        self.assertIn(b'Project - Test', FakeSMTP.connections[0].sent[0][2])
+
+        message = tasks.build_message(**self.email)
+        self.assertEqual(message.subject, 'Test')
+        self.assertIn('A new comment', message.html_body)
+
+    def test_queue_email(self):
+        with patch.object(send_emails, 'TESTS', 0), patch.object(send_emails, 'EMAIL_BATCH_INTERVAL', 1):
+            with patch.object(send_emails, 'email_queue', self.queue):
+                async_loop(send_emails.queue_email(**self.email))
+            self.assertEqual(self.queue.take(10), [self.email])
+
+            # Redis is unavailable, email is dropped without error
+            with patch.object(send_emails, 'email_queue', EmailQueue('redis://127.0.0.1:1')):
+                async_loop(send_emails.queue_email(**self.email))
+
+
+class DigestTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.digest = NotificationDigest(EMAIL_QUEUE_REDIS_URL, 300, 3600, 2, 'tests:digest')
+        self.queue = EmailQueue(EMAIL_QUEUE_REDIS_URL, key='tests:email:queue')
+        self.clear()
+
+    def tearDown(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        keys = self.digest.client.keys('tests:digest*') + [self.queue.key, self.queue.processing_key]
+        self.digest.client.delete(*keys)
+
+    def push(self, user_id: int, comment: str, now: float) -> None:
+        item = {'author': 'author', 'comment': comment}
+        async_loop(self.digest.push(user_id, f'{user_id}@example.com', item, now=now))
+
+    def test_window(self):
+        self.push(1, 'a', 1000)
+        self.push(1, 'b', 1100)
+        self.push(1, 'c', 1200)
+        self.push(2, 'd', 1200)
+
+        # Due after window of first notification
+        self.assertEqual(self.digest.due(10, now=1299), [])
+        self.assertEqual(self.digest.due(10, now=1300), [1])
+        self.assertEqual(self.digest.due(10, now=1500), [1, 2])
+
+        # Count of all notifications, last ones are kept
+        email, count, items = self.digest.read(1)
+        self.assertEqual((email, count), ('1@example.com', 3))
+        self.assertEqual([item['comment'] for item in items], ['b', 'c'])
+
+        # Buffer is kept until ack
+        self.assertEqual(self.digest.read(1), (email, count, items))
+        self.assertEqual(self.digest.ack(1, count, now=1300), 0)
+        self.assertEqual(self.digest.read(1), (None, 0, []))
+        self.assertEqual(self.digest.due(10, now=1500), [2])
+
+    def test_rate_limit(self):
+        self.push(1, 'a', 1000)
+        email, count, items = self.digest.read(1)
+
+        # Notification pushed after read is kept for next digest
+        self.push(1, 'b', 1250)
+        self.assertEqual(self.digest.ack(1, count, now=1300), 1)
+        email, count, items = self.digest.read(1)
+        self.assertEqual((count, [item['comment'] for item in items]), (1, ['b']))
+        self.assertEqual(self.digest.due(10, now=4899), [])
+        self.assertEqual(self.digest.due(10, now=4900), [1])
+        self.digest.ack(1, count, now=4900)
+
+        # Not earlier than min interval after previous digest
+        self.push(1, 'c', 5000)
+        self.assertEqual(self.digest.due(10, now=8499), [])
+        self.assertEqual(self.digest.due(10, now=8500), [1])
+
+    def test_flush_comment_digests(self):
+        now = time.time()
+        self.push(1, 'a', now - 400)
+        self.push(1, 'b', now - 350)
+        self.push(2, 'c', now - 350)
+        self.push(3, 'd', now)
+
+        with patch.object(tasks, 'comment_digest', self.digest), \
+                patch.object(tasks, 'email_queue', self.queue), \
+                patch.object(tasks, 'EMAIL_BATCH_INTERVAL', 1):
+            self.assertEqual(tasks.flush_comment_digests(), 2)
+
+            # Flush is running
+            lock = self.digest.lock()
+            lock.acquire()
+            self.push(2, 'e', now - 3600)
+            self.assertEqual(tasks.flush_comment_digests(), 0)
+            lock.release()
+
+        emails = sorted(self.queue.take(10), key=lambda email: email['email_to'])
+        self.assertEqual([email['email_to'] for email in emails], ['1@example.com', '2@example.com'])
+        self.assertEqual(emails[0]['template'], 'comment_digest')
+        self.assertEqual(emails[0]['environment']['count'], 2)
+        self.assertEqual(emails[1]['template'], 'new_comment')
+        self.assertEqual(self.digest.due(10, now=now + 300), [3])
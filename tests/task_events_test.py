@@ -0,0 +1,125 @@
+import asyncio
+import time
+from unittest import TestCase
+
+from celery import states
+
+from app.task_events import TaskEvents, TaskListener
+from app.tasks import celery
+from tests import async_loop
+
+
+class FakeWebSocket:
+    """ Websocket stub (records sent messages) """
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_json(self, data) -> None:
+        self.sent.append(data)
+
+
+class TaskEventsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.task_ids = ['tests-task-1', 'tests-task-2']
+        self.events = TaskEvents(heartbeat=0.05)
+
+    def tearDown(self) -> None:
+        for task_id in self.task_ids:
+            celery.backend.forget(task_id)
+
+    def wait(self, condition, timeout: float = 5) -> None:
+        async def sleep():
+            await asyncio.sleep(0.05)
+
+        started = time.monotonic()
+        while not condition():
+            self.assertLess(time.monotonic() - started, timeout)
+            async_loop(sleep())
+
+    def test_listener(self):
+        listener = TaskListener()
+        listener.tasks.add('tests-task-1')
+
+        # Latest state of task is sent
+        listener.push('tests-task-1', 'PROGRESS', {'progress': 10})
+        listener.push('tests-task-1', 'PROGRESS', {'progress': 20})
+        listener.push('tests-task-2', 'PROGRESS', {'progress': 30})
+        self.assertEqual(
+            async_loop(listener.get(1)), [{'task_id': 'tests-task-1', 'state': 'PROGRESS', 'progress': 20}],
+        )
+
+        # Fetched state does not replace pushed one
+        listener.push('tests-task-1', states.PENDING, None, initial=True)
+        self.assertEqual(async_loop(listener.get(0.05)), [])
+
+        listener.pushed.clear()
+        listener.push('tests-task-1', states.SUCCESS, None, initial=True)
+        self.assertEqual(
+            async_loop(listener.get(1)), [{'task_id': 'tests-task-1', 'state': states.SUCCESS, 'progress': 100}],
+        )
+
+    def test_heartbeat(self):
+        websocket = FakeWebSocket()
+        listener = TaskListener()
+        listener.tasks.add('tests-task-1')
+
+        async def send():
+            worker = asyncio.ensure_future(self.events.send(websocket, listener))
+            await asyncio.sleep(0.12)
+            listener.push('tests-task-1', 'PROGRESS', {'progress': 50})
+            await asyncio.sleep(0.02)
+            worker.cancel()
+
+        async_loop(send())
+        self.assertEqual(websocket.sent[:2], [{'state': 'HEARTBEAT'}, {'state': 'HEARTBEAT'}])
+        self.assertEqual(websocket.sent[-1], {'task_id': 'tests-task-1', 'state': 'PROGRESS', 'progress': 50})
+
+    def test_subscribe(self):
+        first, second = TaskListener(), TaskListener()
+        celery.backend.store_result('tests-task-1', {'progress': 10}, 'PROGRESS')
+
+        # State stored before subscription is fetched
+        async_loop(self.events.subscribe(first, 'tests-task-1'))
+        self.wait(lambda: self.events.channels == {'tests-task-1'})
+        self.assertEqual(
+            async_loop(first.get(5)), [{'task_id': 'tests-task-1', 'state': 'PROGRESS', 'progress': 10}],
+        )
+
+        async_loop(self.events.subscribe(second, 'tests-task-1'))
+        async_loop(self.events.subscribe(second, 'tests-task-2'))
+        self.wait(lambda: self.events.channels == {'tests-task-1', 'tests-task-2'})
+        self.wait(lambda: len(second.pending) == 2)
+        self.assertEqual(
+            sorted(async_loop(second.get(5)), key=lambda payload: payload['task_id']),
+            [
+                {'task_id': 'tests-task-1', 'state': 'PROGRESS', 'progress': 10},
+                {'task_id': 'tests-task-2', 'state': states.PENDING, 'progress': 0},
+            ],
+        )
+
+        # State is fetched for new listener only
+        self.assertEqual(async_loop(first.get(0.1)), [])
+
+        # Published states
+        celery.backend.store_result('tests-task-1', {'progress': 60}, 'PROGRESS')
+        payload = {'task_id': 'tests-task-1', 'state': 'PROGRESS', 'progress': 60}
+        self.assertEqual(async_loop(first.get(5)), [payload])
+        self.assertEqual(async_loop(second.get(5)), [payload])
+
+        # Listener leaves, channel is kept for other listener
+        self.events.unsubscribe(first, 'tests-task-1')
+        self.assertEqual(self.events.listeners, {'tests-task-1': {second}, 'tests-task-2': {second}})
+
+        # Ready task is unsubscribed
+        celery.backend.store_result('tests-task-1', None, states.SUCCESS)
+        self.assertEqual(
+            async_loop(second.get(5)), [{'task_id': 'tests-task-1', 'state': states.SUCCESS, 'progress': 100}],
+        )
+        self.assertEqual(second.tasks, {'tests-task-2'})
+        self.wait(lambda: self.events.channels == {'tests-task-2'})
+
+        self.events.unsubscribe(second, 'tests-task-2')
+        self.assertEqual(self.events.listeners, {})
+        self.wait(lambda: self.events.channels == set())
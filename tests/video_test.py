@@ -2,7 +2,9 @@ import os
 import shutil
 from datetime import datetime, timedelta
 from unittest import TestCase
+from unittest.mock import patch
 
+import orjson
 from fastapi import UploadFile, HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy import update
@@ -12,6 +14,8 @@ from app.app import app
 from app.auth.crud import verification_crud, user_crud
 from app.config import MEDIA_ROOT, API_V1_URL
 from app.db import engine
+from app.tasks import refresh_trends
+from app.videos import service
 from app.videos.api import (
     create_video,
     get_video,
@@ -141,7 +145,7 @@ class VideosTestCase(TestCase):
         # Get all
 
         # Page №1
-        response = async_loop(get_all_videos(1))
+        response = orjson.loads(async_loop(get_all_videos(1)).body)
         self.assertEqual(response['next'], 'http://localhost:8000/api/v1/videos/?page=2')
         self.assertEqual(len(response['results']), 2)
         self.assertEqual(response['results'][0]['id'], 3)
@@ -149,7 +153,7 @@ class VideosTestCase(TestCase):
         self.assertEqual(response['previous'], None)
 
         # Page №2
-        response = async_loop(get_all_videos(2))
+        response = orjson.loads(async_loop(get_all_videos(2)).body)
         self.assertEqual(response['next'], None)
         self.assertEqual(len(response['results']), 1)
         self.assertEqual(response['results'][0]['id'], 1)
@@ -307,16 +311,30 @@ class VideosTestCase(TestCase):
                 )
         self.assertEqual(response['title'], 'Anti-YouTube 2')
 
-        response = async_loop(search_videos('2'))
+        response = orjson.loads(async_loop(search_videos('2')).body)
         self.assertEqual(len(response), 1)
         self.assertEqual(response[0]['id'], 3)
 
-        response = async_loop(search_videos('anti'))
+        response = orjson.loads(async_loop(search_videos('anti')).body)
         self.assertEqual(len(response), 2)
         self.assertEqual(response[0]['id'], 3)
         self.assertEqual(response[1]['id'], 2)
 
-        response = async_loop(search_videos('example'))
+        response = orjson.loads(async_loop(search_videos('example')).body)
+        self.assertEqual(len(response), 0)
+
+        response = orjson.loads(async_loop(search_videos('ant', limit=1)).body)
+        self.assertEqual(len(response), 1)
+        self.assertEqual(response[0]['id'], 3)
+
+        response = orjson.loads(async_loop(search_videos('ant', limit=1, skip=1)).body)
+        self.assertEqual(len(response), 1)
+        self.assertEqual(response[0]['id'], 2)
+
+        response = orjson.loads(async_loop(search_videos('hello anti')).body)
+        self.assertEqual(len(response), 2)
+
+        response = orjson.loads(async_loop(search_videos('!!!')).body)
         self.assertEqual(len(response), 0)
 
     def test_videos_request(self):
@@ -427,6 +445,33 @@ class VideosTestCase(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertEqual(response.json(), {'detail': 'Results not found'})
 
+        # Cursor №1
+        response = self.client.get(self.url + '/?cursor=')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(response.json()['results'][0]['id'], 3)
+        self.assertEqual(response.json()['results'][1]['id'], 2)
+        self.assertEqual(response.json()['previous'], None)
+        self.assertEqual(response.json()['page'], None)
+
+        # Cursor №2
+        response = self.client.get(response.json()['next'].replace('http://localhost:8000', ''))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response.json()['results'][0]['id'], 1)
+        self.assertEqual(response.json()['next'], None)
+
+        # Cursor №1 (previous)
+        response = self.client.get(response.json()['previous'].replace('http://localhost:8000', ''))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(response.json()['results'][0]['id'], 3)
+        self.assertEqual(response.json()['previous'], None)
+
+        response = self.client.get(self.url + '/?cursor=bad')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
         # Get
         response = self.client.get(self.url + '/1')
         self.assertEqual(response.status_code, 200)
@@ -461,12 +506,38 @@ class VideosTestCase(TestCase):
         # Streaming video
         response = self.client.get(self.url + '/video/2')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(
-            response.headers, {'content-type': 'video/mp4', 'accept-ranges': 'bytes', 'content-length': '0'}
-        )
+        self.assertEqual(response.headers['content-type'], 'video/mp4')
+        self.assertEqual(response.headers['accept-ranges'], 'bytes')
+        self.assertEqual(response.headers['content-length'], '0')
+        self.assertEqual('etag' in response.headers.keys(), True)
+        self.assertEqual('last-modified' in response.headers.keys(), True)
 
         response = self.client.get(self.url + '/video/2', headers={'range': 'bytes=100-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['content-range'], 'bytes */0')
+
+        video_file = async_loop(video_crud.get(self.session, id=2)).video_file
+        with open(video_file, 'wb') as file:
+            file.write(b'0123456789')
+
+        response = self.client.get(self.url + '/video/2', headers={'range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'2345')
+        self.assertEqual(response.headers['content-range'], 'bytes 2-5/10')
+
+        response = self.client.get(self.url + '/video/2', headers={'range': 'bytes=-3'})
         self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'789')
+
+        response = self.client.get(self.url + '/video/2', headers={'range': 'bytes=0-1,8-'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['content-type'].startswith('multipart/byteranges'), True)
+        self.assertEqual(int(response.headers['content-length']), len(response.content))
+        self.assertEqual(b'Content-Range: bytes 8-9/10' in response.content, True)
+
+        response = self.client.get(self.url + '/video/2', headers={'range': 'bytes=2-5', 'if-range': '"old"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'0123456789')
 
         response = self.client.get(self.url + '/video/143')
         self.assertEqual(response.status_code, 400)
@@ -564,9 +635,10 @@ class VideosTestCase(TestCase):
         # History get
         response = self.client.get(API_V1_URL + '/auth/history', headers=headers)
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.json()), 2)
-        self.assertEqual(response.json()[0]['id'], 3)
-        self.assertEqual(response.json()[1]['id'], 2)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertEqual(response.json()['results'][0]['id'], 3)
+        self.assertEqual(response.json()['results'][1]['id'], 2)
+        self.assertEqual(response.json()['next'], None)
 
         # New view
         response = self.client.post(self.url + '/add-to-history?pk=2')
@@ -591,6 +663,22 @@ class VideosTestCase(TestCase):
         self.assertEqual(response.json(), {'msg': 'History cleared'})
         self.assertEqual(len(async_loop(history_crud.all(self.session))), 1)
 
+        # History pagination and collapse
+        self.client.post(self.url + '/add-to-history?pk=2', headers=headers)
+        self.client.post(self.url + '/add-to-history?pk=3', headers=headers)
+        self.client.post(self.url + '/add-to-history?pk=2', headers=headers)
+
+        response = self.client.get(API_V1_URL + '/auth/history', headers=headers)
+        self.assertEqual([video['id'] for video in response.json()['results']], [2, 3])
+        self.assertNotEqual(response.json()['next'], None)
+        response = self.client.get(response.json()['next'].replace('http://localhost:8000', ''), headers=headers)
+        self.assertEqual([video['id'] for video in response.json()['results']], [2])
+        self.assertEqual(response.json()['next'], None)
+
+        response = self.client.get(API_V1_URL + '/auth/history?collapse=true', headers=headers)
+        self.assertEqual([video['id'] for video in response.json()['results']], [2, 3])
+        self.assertEqual(response.json()['next'], None)
+
         # Update video
         video_3 = async_loop(video_crud.get(self.session, id=3))
         tokens = self.client.post(API_V1_URL + '/auth/login', data={'username': 'test', 'password': 'test1234'})
@@ -778,7 +866,7 @@ class VideosTestCase(TestCase):
         headers = {'Authorization': f'Bearer {tokens.json()["access_token"]}'}
         self.client.post(API_V1_URL + '/categories/', json=self.category_data, headers=headers)
 
-        response = async_loop(trends())
+        response = orjson.loads(async_loop(trends()).body)
         self.assertEqual(len(response), 0)
 
         with open('tests/image.png', 'rb') as preview:
@@ -826,7 +914,7 @@ class VideosTestCase(TestCase):
         async_loop(self.session.execute(update(Video).filter(Video.id == 3).values(views=1500)))
         async_loop(self.session.commit())
 
-        response = async_loop(trends())
+        response = orjson.loads(async_loop(trends()).body)
         self.assertEqual(len(response), 2)
         self.assertEqual(response[0]['id'], 3)
         self.assertEqual(response[0]['views'], 1500)
@@ -839,7 +927,62 @@ class VideosTestCase(TestCase):
             )
         )
         async_loop(self.session.commit())
-        response = async_loop(trends())
+        response = orjson.loads(async_loop(trends()).body)
         self.assertEqual(len(response), 1)
         self.assertEqual(response[0]['id'], 2)
         self.assertEqual(response[0]['views'], 1000)
+
+    def test_trends_snapshot(self):
+        self.client.post(API_V1_URL + '/auth/register', json=self.user_data)
+        verification = async_loop(verification_crud.get(self.session, user_id=1)).__dict__
+        self.client.post(API_V1_URL + '/auth/activate', json={'uuid': verification['uuid']})
+        tokens = self.client.post(API_V1_URL + '/auth/login', data={'username': 'test', 'password': 'test1234'})
+
+        async_loop(self.session.execute(update(user_crud.model).filter_by(id=1).values(is_superuser=True)))
+        async_loop(self.session.commit())
+
+        headers = {'Authorization': f'Bearer {tokens.json()["access_token"]}'}
+        self.client.post(API_V1_URL + '/categories/', json=self.category_data, headers=headers)
+
+        for _ in range(2):
+            with open('tests/image.png', 'rb') as preview:
+                with open('tests/test.mp4', 'rb') as video:
+                    self.client.post(
+                        self.url + '/',
+                        headers=headers,
+                        data=self.data,
+                        files={
+                            'preview_file': ('image.png', preview, 'image/png'),
+                            'video_file': ('test.mp4', video, 'video/mp4'),
+                        }
+                    )
+
+        async_loop(self.session.execute(update(Video).filter(Video.id == 1).values(views=1000)))
+        async_loop(self.session.execute(update(Video).filter(Video.id == 2).values(views=1500)))
+        async_loop(self.session.commit())
+
+        with patch.object(service, 'TRENDS_SNAPSHOT', 1):
+            # Snapshot is not refreshed yet
+            response = self.client.get(self.url + '/trends')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 0)
+
+            refresh_trends()
+            response = self.client.get(self.url + '/trends')
+            self.assertEqual([video['id'] for video in response.json()], [2, 1])
+
+            # Scores are kept until next refresh
+            async_loop(self.session.execute(update(Video).filter(Video.id == 1).values(views=3000)))
+            async_loop(
+                self.session.execute(
+                    update(Video).filter(Video.id == 2).values(created_at=datetime.utcnow() - timedelta(days=50))
+                )
+            )
+            async_loop(self.session.commit())
+            response = self.client.get(self.url + '/trends')
+            self.assertEqual([video['id'] for video in response.json()], [2, 1])
+            self.assertEqual(response.json()[1]['views'], 3000)
+
+            refresh_trends()
+            response = self.client.get(self.url + '/trends')
+            self.assertEqual([video['id'] for video in response.json()], [1])